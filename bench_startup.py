@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+DragoonPlot startup benchmark: time from launch to the first rendered frame.
+
+Launches the script (python dragoonplot.py) and, when built, the frozen
+executable (dist/DragoonPlot or dist/DragoonPlot.exe) several times with
+DRAGOONPLOT_STARTUP_BENCH=1. In that mode DragoonPlot prints the wall-clock
+time of its first rendered frame and exits; the difference to the launch
+time is reported. The config file is not saved in that mode. Needs a display.
+
+Usage:
+    python bench_startup.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+MARKER = "DRAGOONPLOT_FIRST_FRAME"
+
+
+def measure(cmd: list) -> float:
+    """Run one launch and return seconds until the first frame."""
+    env = dict(os.environ, DRAGOONPLOT_STARTUP_BENCH="1")
+    start = time.time()
+    result = subprocess.run(cmd, cwd=HERE, env=env, capture_output=True, text=True, timeout=120)
+    for line in result.stdout.splitlines():
+        if line.startswith(MARKER):
+            return float(line.split()[1]) - start
+    raise RuntimeError(f"no first frame reported (exit code {result.returncode}):\n{result.stdout}{result.stderr}")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    targets = [("script", [sys.executable, str(HERE / "dragoonplot.py")])]
+    for name in ("DragoonPlot", "DragoonPlot.exe"):
+        exe = HERE / "dist" / name
+        if exe.exists():
+            targets.append(("frozen", [str(exe)]))
+            break
+    else:
+        print("No frozen build in dist/ (run build.sh / build.bat to include it)")
+
+    for label, cmd in targets:
+        times = [measure(cmd) for _ in range(runs)]
+        print(f"{label:7s} first frame: min {min(times):.3f}s  median {statistics.median(times):.3f}s  "
+              f"max {max(times):.3f}s  ({runs} runs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Stand-in for dfu-util to try DFU batch flashing without hardware.
+
+Point DragoonPlot at it and use Scan / Flash all in the DFU tab:
+
+    DRAGOONPLOT_DFU_UTIL="python dfu_util_stub.py" python dragoonplot.py
+
+Environment:
+    DFU_STUB_DEVICES  number of fake devices listed by -l (default 4)
+    DFU_STUB_FAIL     comma-separated serial numbers whose download fails
+    DFU_STUB_SECONDS  duration of one download (default 3)
+    DFU_STUB_IMAGE    file the fake devices hold; -U reads it back (default: erased flash)
+
+-l prints "Found DFU" lines like dfu-util 0.11; -D prints erase and
+download progress bars redrawn with carriage returns; -U writes the
+requested address range of DFU_STUB_IMAGE.
+"""
+
+import os
+import sys
+import time
+
+FLASH_NAME = "@Internal Flash  /0x08000000/04*016Kg,01*064Kg,07*128Kg"
+
+
+def serial(k: int) -> str:
+    return f"STUB{k:08X}"
+
+
+def list_devices():
+    print("dfu-util 0.11 (stub)\n")
+    for k in range(int(os.environ.get("DFU_STUB_DEVICES", "4"))):
+        for alt, name in ((0, FLASH_NAME), (1, "@Option Bytes  /0x1FFFC000/01*016 e")):
+            print(f'Found DFU: [0483:df11] ver=2200, devnum={10 + k}, cfg=1, intf=0, path="1-{k + 1}", '
+                  f'alt={alt}, name="{name}", serial="{serial(k)}"')
+
+
+def bar(label: str, fraction: float):
+    done = int(fraction * 25)
+    sys.stdout.write(f"\r{label}\t[{'=' * done}{' ' * (25 - done)}] {int(fraction * 100):3d}%")
+    sys.stdout.flush()
+
+
+def download(args: list) -> int:
+    path = args[args.index("-p") + 1] if "-p" in args else ""
+    image = args[args.index("-D") + 1]
+    size = os.path.getsize(image)
+    device = serial(int(path.split("-")[-1]) - 1) if path else args[args.index("-S") + 1]
+    seconds = float(os.environ.get("DFU_STUB_SECONDS", "3"))
+    fail = device in os.environ.get("DFU_STUB_FAIL", "").split(",")
+    print(f"Opening DFU capable USB device...\nDevice ID 0483:df11 serial {device}")
+    print(f"Downloading element to address = 0x08004000, size = {size}")
+    for label, share in (("Erase   ", 0.3), ("Download", 0.7)):
+        steps = 20
+        for i in range(steps + 1):
+            bar(label, i / steps)
+            time.sleep(seconds * share / steps)
+            if fail and label == "Download" and i == steps // 2:
+                print("\ndfu-util: Error during download get_status")
+                return 74
+        print()
+    print("File downloaded successfully")
+    return 0
+
+
+def upload(args: list) -> int:
+    path = args[args.index("-U") + 1]
+    if os.path.exists(path):
+        print(f"dfu-util: Cannot open file {path} for writing: File exists")
+        return 74
+    length = int(args[args.index("-s") + 1].split(":")[1])
+    image = os.environ.get("DFU_STUB_IMAGE", "")
+    data = open(image, "rb").read()[:length] if image else b""
+    data += b"\xff" * (length - len(data))
+    seconds = float(os.environ.get("DFU_STUB_SECONDS", "3")) * 0.2
+    for i in range(11):
+        bar("Upload  ", i / 10)
+        time.sleep(seconds / 10)
+    print()
+    with open(path, "wb") as f:
+        f.write(data)
+    print("Upload done.")
+    return 0
+
+
+def main() -> int:
+    args = sys.argv[1:]
+    if "-l" in args:
+        list_devices()
+        return 0
+    if "-D" in args:
+        return download(args)
+    if "-U" in args:
+        return upload(args)
+    print("usage: dfu_util_stub.py -l | [-p path | -S serial] (-D file | -s address:length -U file)")
+    return 64
+
+
+if __name__ == "__main__":
+    sys.exit(main())
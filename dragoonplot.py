@@ -15,21 +15,40 @@ Text Protocol (commands):
     Buttons:      Created for commands with ARGS == "-"
     Categories:   state, diag, param, sys
 
+Stream Server (optional):
+    Republishes decoded frames to local TCP / Unix socket / WebSocket clients
+
 See PROTOCOL.md for full protocol documentation.
 
 Dependencies:
     pip install dearpygui pyserial
 """
 
+import abc
+import ast
+import base64
+import hashlib
+import heapq
+import re
+import shlex
+import shutil
+import socket
+import stat
 import struct
+import subprocess
+import tempfile
 import threading
 import time
 import json
 import os
-import subprocess
+import queue
 import sys
+import zipfile
+import zlib
+from array import array
+from collections import deque
 from pathlib import Path
-from typing import Optional, Union
+from typing import Callable, Optional, Union
 from dataclasses import dataclass, field
 
 import numpy as np
@@ -65,7 +84,6 @@ def get_linux_display_scale() -> float:
         if result.returncode == 0:
             # Parse the output to find scale factors
             # The scale is in the logical monitors section, format: (x, y, scale, ...)
-            import re
             # Look for the primary monitor's scale (the one with 'true' for is-primary)
             # Pattern matches: (x, y, scale, uint32 N, true, ...)
             matches = re.findall(r'\((\d+), (\d+), ([\d.]+), uint32 \d+, true,', result.stdout)
@@ -155,6 +173,88 @@ def get_dfu_util_path() -> str:
     return 'dfu-util'
 
 
+def dfu_util_command() -> list:
+    """dfu-util command as an argument list; DFU_UTIL_ENV may override it (e.g. with dfu_util_stub.py)."""
+    override = os.environ.get(DFU_UTIL_ENV)
+    if override:
+        return shlex.split(override, posix=sys.platform != 'win32')
+    return [get_dfu_util_path()]
+
+
+def list_dfu_devices() -> list:
+    """
+    Enumerate DFU devices with `dfu-util -l`.
+
+    Returns one dict per device (USB path + serial number) with the "id"
+    (vid:pid), "path", "serial", first "alt" and "alts": a list of
+    (alt, name) pairs; the alt names carry the flash layout.
+    """
+    result = subprocess.run(dfu_util_command() + ["-l"], capture_output=True, text=True, timeout=10)
+    devices: dict = {}
+    for line in result.stdout.splitlines():
+        if not line.startswith("Found DFU:"):
+            continue
+        match = re.search(r"\[([0-9a-fA-F]{4}:[0-9a-fA-F]{4})\]", line)
+        fields = {key: quoted or bare for key, quoted, bare in re.findall(r'(\w+)=(?:"([^"]*)"|([^,\s]*))', line)}
+        key = (fields.get("path", ""), fields.get("serial", ""), fields.get("devnum", ""))
+        device = devices.setdefault(key, {
+            "id": match.group(1) if match else "",
+            "path": fields.get("path", ""),
+            "serial": fields.get("serial", ""),
+            "alt": fields.get("alt", "0"),
+            "alts": [],
+        })
+        device["alts"].append((fields.get("alt", "0"), fields.get("name", "")))
+    return list(devices.values())
+
+
+def parse_dfu_layout(name: str) -> list:
+    """
+    Memory regions [(start, end)] of a DfuSe alt name such as
+    "@Internal Flash  /0x08000000/04*016Kg,01*064Kg,07*128Kg" (adjacent sectors merged).
+    """
+    regions: list = []
+    parts = name.split("/")
+    for i in range(1, len(parts) - 1, 2):
+        try:
+            address = int(parts[i].strip(), 16)
+        except ValueError:
+            continue
+        for count, size, unit in re.findall(r"(\d+)\*\s*(\d+)\s*([KMB]?)", parts[i + 1]):
+            length = int(count) * int(size) * {"K": 1024, "M": 1024 * 1024}.get(unit, 1)
+            if regions and regions[-1][1] == address:
+                regions[-1] = (regions[-1][0], address + length)
+            else:
+                regions.append((address, address + length))
+            address += length
+    return regions
+
+
+def check_image_fits(address: int, size: int, regions: list) -> str:
+    """Empty string if [address, address + size) lies in one region, else the reason it does not."""
+    for start, end in regions:
+        if start <= address < end:
+            if address + size > end:
+                return f"image ({size} bytes) exceeds the region by {address + size - end} bytes"
+            return ""
+    return f"address 0x{address:08X} is outside the device memory"
+
+
+def firmware_image_info(path: str, cache: dict) -> dict:
+    """Size, SHA-256 and CRC-32 of a firmware image, cached by path, size and modification time."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    if key not in cache:
+        sha = hashlib.sha256()
+        crc = 0
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+                crc = zlib.crc32(block, crc)
+        cache[key] = {"size": st.st_size, "sha256": sha.hexdigest(), "crc32": crc}
+    return cache[key]
+
+
 def get_resource_path(relative_path: str) -> str:
     """Get path to bundled resource (works in both dev and PyInstaller bundle)."""
     if getattr(sys, 'frozen', False):
@@ -173,8 +273,65 @@ MAX_CHANNELS = 64
 MAX_LABEL_LEN = 16
 BUFFER_SIZE = 20000
 DEFAULT_TIME_WINDOW = 10.0
+MAX_TIME_WINDOW = 300.0
+MAX_HISTORY_TIME_WINDOW = 24 * 3600.0  # Time window limit when a history tier is active
+HISTORY_CHUNK = 65536  # Samples per chunk record in the history file
+HISTORY_BUCKET = 256  # Samples per min/max summary bucket
+COMPRESSED_CHUNK = 16384  # Samples per compressed history block
+HISTORY_MODES = ["Off", "Disk", "Compressed"]
+MAX_PLOT_POINTS = 4000  # Points requested from history for one series
+TRIGGER_MODES = ["Rising", "Falling", "Either", "Pulse >", "Pulse <"]
+TRIGGER_SWEEPS = ["Auto", "Normal", "Single"]
+TRIGGER_MAX_SAMPLES = 20000  # Max pre + post trigger window
+TRIGGER_AUTO_TIMEOUT = 0.2  # Seconds without trigger before Auto sweep free-runs
+STATS_RATE_WINDOW = 2.0  # Seconds of blocks used for the sample rate estimate
+STATS_REBUILD_BLOCKS = 256  # Deque entries per channel when refilling after the window grew
+STATS_COLUMNS = ["min", "max", "mean", "std", "rms", "count"]
+FFT_SIZES = [256, 512, 1024, 2048, 4096, 8192]
+PERSIST_WIDTH = 800  # Persistence grid size in pixels
+PERSIST_HEIGHT = 400
+PERSIST_GAIN = 0.7  # Brightness per hit (1 - exp(-gain * hits))
+XY_MAX_POINTS = 20000  # Points drawn in the XY tab after decimation
+XY_GRID = 512  # Initial decimation grid (cells per axis)
+XY_MAX_SAMPLES = 200000  # Newest samples of the window used for the XY tab
+XY_RATE_SAMPLES = 1024  # Newest samples used to estimate a channel's sample interval for the XY query
+ALARM_KINDS = ["Above", "Below", "Outside"]
+ALARM_LOG_FILE = "dragoonplot_alarms.log"
+FILTER_KINDS = ["Off", "Low-pass", "High-pass", "Notch", "Moving avg", "Decimate"]
+FILTER_OUTPUTS = ["Replace", "Derived"]  # Show filtered data instead of / next to the channel
+FILTER_SUB_BLOCK = 256  # Max samples per block-IIR step
+FILTERED_BASE = 2 * MAX_CHANNELS  # DataBuffer index of filter outputs (derived channels use MAX_CHANNELS + k)
 CONFIG_FILE = Path.home() / ".dragoonplot.json"
-BAUD_RATES = [9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600]
+DFU_UTIL_ENV = "DRAGOONPLOT_DFU_UTIL"  # Overrides the dfu-util command (testing: "python dfu_util_stub.py")
+STARTUP_BENCH_ENV = "DRAGOONPLOT_STARTUP_BENCH"  # Set: print first-frame time and exit (bench_startup.py)
+TERMINAL_RAM_LINES = 1_000_000  # Terminal lines kept in memory (older ones come from the spill file)
+TERMINAL_WHEEL_LINES = 3  # Lines scrolled per mouse wheel step in the terminal
+TERMINAL_SEARCH_CHUNK = 65536  # Lines copied out of the scrollback per search step
+STREAM_DEFAULT_ADDRESS = "127.0.0.1:5760"
+STREAM_QUEUE_SIZE = 256  # Blocks buffered per stream client before dropping
+MACRO_COMPARE = {
+    ">": lambda a, b: a > b,
+    "<": lambda a, b: a < b,
+    ">=": lambda a, b: a >= b,
+    "<=": lambda a, b: a <= b,
+}
+TEXT_LINE_MAX = 16384  # Longest text line kept (a structured discovery reply is one line)
+DISCOVERY_MARKER = "@commands "  # Prefix of the structured (JSON) discovery reply line
+FWHASH_COMMAND = b"fwhash\r\n"  # Asks the device for the hash of its running firmware
+FWHASH_MARKER = "@fwhash "  # Prefix of the reply line: SHA-256 or CRC-32 in hex
+TX_QUEUE_SIZE = 1024  # Pending writes before send() starts dropping
+TX_COALESCE_BYTES = 4096  # Max queued bytes merged into one port write
+TX_SPIN_TIME = 0.002  # Busy-wait this long before a timed write (sleep is too coarse)
+PORT_POLL_INTERVAL = 0.05  # Seconds between serial port scans while reconnecting (reconnect latency)
+PORT_IDLE_INTERVAL = 1.0  # Seconds between serial port scans otherwise (hot-plug latency)
+PORT_RESCAN_FAST_TIME = 2.0  # Seconds of fast scanning after an explicit rescan()
+BAUD_RATES = [9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600,
+              1000000, 1500000, 2000000, 3000000, 4000000, 6000000, 12000000]  # Any other rate can be typed in
+FTDI_LATENCY_TIMER = 1  # ms; Linux sysfs latency_timer for FTDI adapters (driver default 16)
+SERIAL_DRIVER_BUFFER = 1 << 20  # Bytes; driver RX/TX buffer requested where supported (Windows)
+PING_COMMAND = b"ping\r\n"  # Latency probe; the device answers with a PONG_MARKER line
+PONG_MARKER = "@pong"
+LATENCY_PINGS = 10  # Round trips per latency measurement
 DEFAULT_COLORS = [
     (255, 87, 51),    # Red-orange
     (51, 255, 87),    # Green
@@ -191,6 +348,31 @@ DEFAULT_COLORS = [
 ]
 
 
+@dataclass
+class FilterConfig:
+    kind: str = "Off"  # One of FILTER_KINDS
+    cutoff: float = 50.0  # Hz: low/high-pass corner or notch center
+    q: float = 0.707  # Biquad quality factor (notch: center / bandwidth)
+    length: int = 16  # Moving average length or decimating FIR taps
+    decimate: int = 4  # Decimation factor
+    output: str = "Replace"  # One of FILTER_OUTPUTS
+
+    def to_dict(self):
+        return {"kind": self.kind, "cutoff": self.cutoff, "q": self.q, "length": self.length,
+                "decimate": self.decimate, "output": self.output}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            kind=d.get("kind", "Off"),
+            cutoff=d.get("cutoff", 50.0),
+            q=d.get("q", 0.707),
+            length=d.get("length", 16),
+            decimate=d.get("decimate", 4),
+            output=d.get("output", "Replace"),
+        )
+
+
 @dataclass
 class ChannelConfig:
     name: str = ""
@@ -198,6 +380,29 @@ class ChannelConfig:
     visible: bool = True
     scale: float = 1.0
     offset: float = 0.0
+    expression: str = ""  # Derived channels only, e.g. "ch0*ch1*0.001"
+    filter: Optional[FilterConfig] = None  # Device channels only
+
+    def to_dict(self):
+        d = {"name": self.name, "color": list(self.color), "visible": self.visible,
+             "scale": self.scale, "offset": self.offset}
+        if self.expression:
+            d["expression"] = self.expression
+        if self.filter is not None and self.filter.kind != "Off":
+            d["filter"] = self.filter.to_dict()
+        return d
+
+    @classmethod
+    def from_dict(cls, c):
+        return cls(
+            name=c.get("name", ""),
+            color=tuple(c.get("color", (255, 255, 255))),
+            visible=c.get("visible", True),
+            scale=c.get("scale", 1.0),
+            offset=c.get("offset", 0.0),
+            expression=c.get("expression", ""),
+            filter=FilterConfig.from_dict(c["filter"]) if "filter" in c else None,
+        )
 
 
 @dataclass
@@ -206,36 +411,130 @@ class CommandButton:
     data: str = ""
     mode: str = "ascii"  # "ascii" or "hex"
     category: str = ""  # Category from help output (state, diag, param, sys)
+    args: list = field(default_factory=list)  # Argument names; each gets an input next to the button
+
+    def encode(self, values: list = ()) -> bytes:
+        """Bytes sent for this button; argument values go after the command. Raises ValueError for invalid hex."""
+        if self.mode == "hex":
+            return bytes.fromhex(self.data.replace("0x", "").replace(" ", "").replace(",", ""))
+        data = self.data
+        if values:
+            command = data.rstrip("\r\n")
+            data = " ".join([command, *values]) + data[len(command):]
+        return data.encode('utf-8')
+
+    @classmethod
+    def from_discovery(cls, entry: dict) -> 'CommandButton':
+        """Button for one command of a structured discovery reply (see PROTOCOL.md)."""
+        cmd = str(entry["cmd"])
+        return cls(label=cmd.capitalize(), data=f"{cmd}\r\n", mode="ascii",
+                   category=str(entry.get("cat", "")), args=[str(a) for a in entry.get("args", [])])
 
 
 # Default commands (empty - use Discover to populate from device)
 DEFAULT_COMMAND_BUTTONS = []
 
 
+@dataclass
+class Macro:
+    name: str = "Macro"
+    script: str = ""  # See parse_macro for the command syntax
+
+    def to_dict(self):
+        return {"name": self.name, "script": self.script}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(name=d.get("name", "Macro"), script=d.get("script", ""))
+
+
+@dataclass
+class AlarmRule:
+    channel: int = 0
+    kind: str = "Above"  # One of ALARM_KINDS
+    low: float = 0.0  # Thresholds in scaled units
+    high: float = 0.0
+    hysteresis: float = 0.0  # Distance back inside the limit needed to clear
+    min_duration: float = 0.0  # Seconds the violation must last before the alarm fires
+    enabled: bool = True
+
+    def to_dict(self):
+        return {"channel": self.channel, "kind": self.kind, "low": self.low, "high": self.high,
+                "hysteresis": self.hysteresis, "min_duration": self.min_duration, "enabled": self.enabled}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(
+            channel=d.get("channel", 0),
+            kind=d.get("kind", "Above"),
+            low=d.get("low", 0.0),
+            high=d.get("high", 0.0),
+            hysteresis=d.get("hysteresis", 0.0),
+            min_duration=d.get("min_duration", 0.0),
+            enabled=d.get("enabled", True),
+        )
+
+
 @dataclass
 class AppConfig:
     last_port: str = ""
     last_baud: int = 115200
     channels: list = field(default_factory=list)
+    derived_channels: list = field(default_factory=list)  # ChannelConfigs with an expression
     buttons: list = field(default_factory=list)
+    command_cache: dict = field(default_factory=dict)  # "port|firmware" -> {"commands": [...], "time": t}
     time_window: float = DEFAULT_TIME_WINDOW
     dfu_file_path: str = ""
+    dfu_parallel: int = 4  # dfu-util processes run at once by Flash all
+    dfu_skip_identical: bool = False  # Skip devices that already run the selected image
+    stream_address: str = STREAM_DEFAULT_ADDRESS
+    stream_enabled: bool = False
+    history_mode: str = "Off"  # One of HISTORY_MODES
+    history_dir: str = ""  # Spill directory for disk history (empty = system temp)
+    trigger: dict = field(default_factory=dict)  # Scope tab trigger settings
+    spectrum: dict = field(default_factory=dict)  # Spectrum tab settings
+    histogram: dict = field(default_factory=dict)  # Histogram tab settings
+    xy: dict = field(default_factory=dict)  # XY tab settings
+    alarms: list = field(default_factory=list)  # AlarmRules
+    macros: list = field(default_factory=list)  # Macros
+    persistence: bool = False  # Persistence (intensity) render mode for the Graph tab
+    persistence_decay: float = 1.0  # Seconds for hits to fade to 1/e
+    display_scale: float = 0.0  # Cached display scale (0 = detect at startup)
+    terminal_spill: bool = False  # Spill terminal scrollback to a file in history_dir
+    terminal_index: bool = False  # Build a token index of terminal lines for whole-word search
+    auto_reconnect: bool = True  # Reopen the device after a read error (reset, DFU, replug)
 
     def to_dict(self):
         return {
             "last_port": self.last_port,
             "last_baud": self.last_baud,
-            "channels": [
-                {"name": c.name, "color": list(c.color), "visible": c.visible,
-                 "scale": c.scale, "offset": c.offset}
-                for c in self.channels
-            ],
+            "channels": [c.to_dict() for c in self.channels],
+            "derived_channels": [c.to_dict() for c in self.derived_channels],
             "buttons": [
-                {"label": b.label, "data": b.data, "mode": b.mode, "category": b.category}
+                {"label": b.label, "data": b.data, "mode": b.mode, "category": b.category, "args": b.args}
                 for b in self.buttons
             ],
+            "command_cache": self.command_cache,
             "time_window": self.time_window,
             "dfu_file_path": self.dfu_file_path,
+            "dfu_parallel": self.dfu_parallel,
+            "dfu_skip_identical": self.dfu_skip_identical,
+            "stream_address": self.stream_address,
+            "stream_enabled": self.stream_enabled,
+            "history_mode": self.history_mode,
+            "history_dir": self.history_dir,
+            "trigger": self.trigger,
+            "spectrum": self.spectrum,
+            "histogram": self.histogram,
+            "xy": self.xy,
+            "alarms": [a.to_dict() for a in self.alarms],
+            "macros": [m.to_dict() for m in self.macros],
+            "persistence": self.persistence,
+            "persistence_decay": self.persistence_decay,
+            "display_scale": self.display_scale,
+            "terminal_spill": self.terminal_spill,
+            "terminal_index": self.terminal_index,
+            "auto_reconnect": self.auto_reconnect,
         }
 
     @classmethod
@@ -243,30 +542,184 @@ class AppConfig:
         cfg = cls()
         cfg.last_port = d.get("last_port", "")
         cfg.last_baud = d.get("last_baud", 115200)
-        cfg.channels = [
-            ChannelConfig(
-                name=c.get("name", ""),
-                color=tuple(c.get("color", (255, 255, 255))),
-                visible=c.get("visible", True),
-                scale=c.get("scale", 1.0),
-                offset=c.get("offset", 0.0),
-            )
-            for c in d.get("channels", [])
-        ]
+        cfg.channels = [ChannelConfig.from_dict(c) for c in d.get("channels", [])]
+        cfg.derived_channels = [ChannelConfig.from_dict(c) for c in d.get("derived_channels", [])]
         cfg.buttons = [
             CommandButton(
                 label=b.get("label", "Cmd"),
                 data=b.get("data", ""),
                 mode=b.get("mode", "ascii"),
                 category=b.get("category", ""),
+                args=b.get("args", []),
             )
             for b in d.get("buttons", [])
         ]
+        cfg.command_cache = d.get("command_cache", {})
         cfg.time_window = d.get("time_window", DEFAULT_TIME_WINDOW)
         cfg.dfu_file_path = d.get("dfu_file_path", "")
+        cfg.dfu_parallel = d.get("dfu_parallel", 4)
+        cfg.dfu_skip_identical = d.get("dfu_skip_identical", False)
+        cfg.stream_address = d.get("stream_address", STREAM_DEFAULT_ADDRESS)
+        cfg.stream_enabled = d.get("stream_enabled", False)
+        cfg.history_mode = d.get("history_mode", "Off")
+        cfg.history_dir = d.get("history_dir", "")
+        cfg.trigger = d.get("trigger", {})
+        cfg.spectrum = d.get("spectrum", {})
+        cfg.histogram = d.get("histogram", {})
+        cfg.xy = d.get("xy", {})
+        cfg.alarms = [AlarmRule.from_dict(a) for a in d.get("alarms", [])]
+        cfg.macros = [Macro.from_dict(m) for m in d.get("macros", [])]
+        cfg.persistence = d.get("persistence", False)
+        cfg.persistence_decay = d.get("persistence_decay", 1.0)
+        cfg.display_scale = d.get("display_scale", 0.0)
+        cfg.terminal_spill = d.get("terminal_spill", False)
+        cfg.terminal_index = d.get("terminal_index", False)
+        cfg.auto_reconnect = d.get("auto_reconnect", True)
         return cfg
 
 
+# Functions and constants allowed in derived channel expressions
+DERIVED_FUNCTIONS = {
+    "abs": np.abs, "sqrt": np.sqrt, "exp": np.exp, "log": np.log, "log10": np.log10,
+    "sin": np.sin, "cos": np.cos, "tan": np.tan, "atan": np.arctan, "atan2": np.arctan2,
+    "min": np.minimum, "max": np.maximum, "clip": np.clip, "sign": np.sign,
+    "pi": np.pi, "e": np.e,
+}
+
+def compile_expression(text: str) -> tuple:
+    """
+    Compile a derived channel expression such as "sqrt(ch2**2 + ch3**2)".
+
+    Only arithmetic, numeric constants, chN names and DERIVED_FUNCTIONS are
+    allowed. Returns (code, channels used); raises ValueError otherwise.
+    The code is evaluated once per block with chN bound to whole columns.
+    """
+    allowed = (
+        ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+        ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+    )
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"syntax error: {e.msg}")
+    channels = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, allowed):
+            raise ValueError(f"'{type(node).__name__}' not allowed")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError("only numeric constants allowed")
+        if isinstance(node, ast.Call) and (not isinstance(node.func, ast.Name) or node.keywords
+                                           or not callable(DERIVED_FUNCTIONS.get(node.func.id))):
+            raise ValueError("unknown function")
+        if isinstance(node, ast.Name) and node.id not in DERIVED_FUNCTIONS:
+            if node.id[:2] != "ch" or not node.id[2:].isdigit() or int(node.id[2:]) >= MAX_CHANNELS:
+                raise ValueError(f"unknown name '{node.id}'")
+            channels.add(int(node.id[2:]))
+    return compile(tree, "<expression>", "eval"), sorted(channels)
+
+
+def design_biquad(kind: str, fs: float, f0: float, q: float) -> tuple:
+    """Normalized (b, a) biquad coefficients (RBJ audio EQ cookbook)."""
+    w0 = 2.0 * np.pi * min(max(f0, 1e-3), 0.49 * fs) / fs
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / (2.0 * max(q, 1e-3))
+    if kind == "Low-pass":
+        b = [(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2]
+    elif kind == "High-pass":
+        b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+    else:  # Notch
+        b = [1.0, -2 * cos_w0, 1.0]
+    a = [1 + alpha, -2 * cos_w0, 1 - alpha]
+    return np.array(b) / a[0], np.array(a) / a[0]
+
+
+class StreamFilter:
+    """
+    Streaming filter for one channel whose state carries across blocks.
+
+    Biquads (low-pass, high-pass, notch) run block-wise without a per-sample
+    Python loop: the FIR part is a vectorized 3-tap sum, the recursive part
+    is the convolution with the exact impulse response of 1/A(z) (truncated
+    at the block length, so no approximation) plus the zero-input response
+    of the two carried output samples. Blocks are cut to FILTER_SUB_BLOCK
+    samples to bound the convolution cost. Moving average and decimating
+    FIR filters keep the last taps-1 inputs and only compute kept outputs.
+    """
+
+    def __init__(self, cfg: FilterConfig, fs: float):
+        self.fs = fs
+        self.decimate = 1
+        self.fir = None
+        self.started = False
+        self.count = 0  # Input samples seen (decimation phase)
+        if cfg.kind in ("Low-pass", "High-pass", "Notch"):
+            self.b, self.a = design_biquad(cfg.kind, fs, cfg.cutoff, cfg.q)
+            a1, a2 = self.a[1], self.a[2]
+            h = np.zeros(FILTER_SUB_BLOCK)
+            h[0] = 1.0
+            h[1] = -a1
+            for n in range(2, FILTER_SUB_BLOCK):
+                h[n] = -a1 * h[n - 1] - a2 * h[n - 2]
+            self.h = h
+            # Zero-input response to y[-1] and y[-2]
+            self.g1 = -a1 * h - a2 * np.concatenate([[0.0], h[:-1]])
+            self.g2 = -a2 * h
+        elif cfg.kind == "Moving avg":
+            taps = max(1, cfg.length)
+            self.fir = np.full(taps, 1.0 / taps)
+        else:  # Decimate: windowed-sinc low-pass below the new Nyquist frequency
+            self.decimate = max(1, cfg.decimate)
+            taps = max(3, cfg.length) | 1
+            n = np.arange(taps) - (taps - 1) / 2
+            fir = np.sinc(0.9 * n / self.decimate) * np.hamming(taps)
+            self.fir = fir / fir.sum()
+
+    def _start(self, x0: float):
+        """Initialize the state as if the first value had always been present."""
+        if self.fir is not None:
+            self.x_hist = np.full(len(self.fir) - 1, x0)
+        else:
+            gain = self.b.sum() / self.a.sum()
+            self.x_state = np.array([x0, x0])  # x[-2], x[-1]
+            self.y_state = np.array([gain * x0, gain * x0])  # y[-2], y[-1]
+        self.started = True
+
+    def process(self, timestamps: np.ndarray, x: np.ndarray) -> tuple:
+        """Filter one block; returns (timestamps, values) of the output samples."""
+        x = x.astype(np.float64)
+        if len(x) == 0:
+            return timestamps, x
+        if not self.started:
+            self._start(x[0])
+        if self.fir is not None:
+            return self._process_fir(timestamps, x)
+        out = np.empty(len(x))
+        for start in range(0, len(x), FILTER_SUB_BLOCK):
+            out[start:start + FILTER_SUB_BLOCK] = self._process_biquad(x[start:start + FILTER_SUB_BLOCK])
+        return timestamps, out
+
+    def _process_biquad(self, x: np.ndarray) -> np.ndarray:
+        n = len(x)
+        ext = np.concatenate([self.x_state, x])
+        b0, b1, b2 = self.b
+        w = b0 * ext[2:] + b1 * ext[1:-1] + b2 * ext[:-2]
+        y = np.convolve(w, self.h[:n])[:n]
+        y += self.g1[:n] * self.y_state[1] + self.g2[:n] * self.y_state[0]
+        self.x_state = ext[-2:]
+        self.y_state = np.concatenate([self.y_state, y])[-2:]
+        return y
+
+    def _process_fir(self, timestamps: np.ndarray, x: np.ndarray) -> tuple:
+        taps = len(self.fir)
+        ext = np.concatenate([self.x_hist, x])
+        first = (-self.count) % self.decimate  # First output index in this block
+        windows = np.lib.stride_tricks.sliding_window_view(ext, taps)[first::self.decimate]
+        y = windows @ self.fir[::-1]
+        self.x_hist = ext[len(ext) - (taps - 1):]
+        self.count += len(x)
+        return timestamps[first::self.decimate], y
+
+
 class BinaryProtocolParser:
     """
     State machine parser for binary protocol (no checksum).
@@ -390,14 +843,146 @@ class BinaryProtocolParser:
         return labels
 
 
+def tune_serial_port(port: serial.Serial) -> list:
+    """
+    Lower the latency of an open port where the platform allows it.
+
+    Linux: sets the ASYNC_LOW_LATENCY flag and, for FTDI adapters, lowers
+    the sysfs latency_timer to FTDI_LATENCY_TIMER (writing it needs root or
+    a udev rule, see README). Windows: enlarges the driver buffers. Every
+    step is best effort. Returns short notes on what is in effect.
+    """
+    notes = []
+    if hasattr(port, "set_low_latency_mode"):  # pyserial on Linux
+        try:
+            port.set_low_latency_mode(True)
+            notes.append("low latency")
+        except (ValueError, OSError):
+            pass  # Not a real UART/USB serial driver (e.g. pty)
+    if sys.platform.startswith("linux"):
+        name = os.path.basename(os.path.realpath(port.port))
+        timer = Path("/sys/bus/usb-serial/devices") / name / "latency_timer"
+        try:
+            current = int(timer.read_text())
+            if current > FTDI_LATENCY_TIMER:
+                try:
+                    timer.write_text(str(FTDI_LATENCY_TIMER))
+                    current = FTDI_LATENCY_TIMER
+                except PermissionError:
+                    pass
+            notes.append(f"latency timer {current} ms")
+        except (OSError, ValueError):
+            pass  # Not an FTDI (usb-serial) device
+    if hasattr(port, "set_buffer_size"):  # pyserial on Windows
+        try:
+            port.set_buffer_size(rx_size=SERIAL_DRIVER_BUFFER, tx_size=SERIAL_DRIVER_BUFFER)
+            notes.append(f"{SERIAL_DRIVER_BUFFER >> 10} KiB buffers")
+        except (ValueError, OSError, serial.SerialException):
+            pass
+    return notes
+
+
+class PortMonitor:
+    """
+    Background thread watching serial ports come and go.
+
+    Scans serial.tools.list_ports so the GUI thread never enumerates ports
+    itself: every PORT_IDLE_INTERVAL normally, every PORT_POLL_INTERVAL while
+    a SerialManager is reconnecting (see watch()) and shortly after rescan().
+    Each change bumps generation and wakes threads blocked in wait_change(),
+    so a re-enumerated device is found within one fast scan interval.
+    """
+
+    def __init__(self):
+        self.ports: dict = {}  # Device -> USB serial number ("" if it has none)
+        self.generation = 0  # Incremented on every change of ports
+        self.cond = threading.Condition()
+        self.wake = threading.Event()
+        self.watchers = 0  # Reconnecting SerialManagers that need fast scans
+        self.fast_until = 0.0  # Scan fast until this time (after rescan())
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def rescan(self):
+        """Scan now, then keep scanning fast for PORT_RESCAN_FAST_TIME."""
+        self.fast_until = time.time() + PORT_RESCAN_FAST_TIME
+        self.wake.set()
+
+    def watch(self, enabled: bool):
+        """Request (True) or release (False) fast scanning, e.g. for the length of a reconnect."""
+        with self.cond:
+            self.watchers += 1 if enabled else -1
+        if enabled:
+            self.wake.set()
+
+    def get_ports(self) -> tuple:
+        """Return (generation, {device: serial number})."""
+        with self.cond:
+            return self.generation, dict(self.ports)
+
+    def wait_change(self, generation: int, timeout: float) -> int:
+        """Block until the port list differs from generation (or timeout). Returns the current generation."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.generation != generation, timeout)
+            return self.generation
+
+    def _run(self):
+        while self.running:
+            try:
+                ports = {p.device: p.serial_number or "" for p in serial.tools.list_ports.comports()}
+            except Exception as e:
+                print(f"Port scan error: {e}")
+                ports = self.ports
+            if ports != self.ports:
+                with self.cond:
+                    self.ports = ports
+                    self.generation += 1
+                    self.cond.notify_all()
+            fast = self.watchers > 0 or time.time() < self.fast_until
+            self.wake.wait(PORT_POLL_INTERVAL if fast else PORT_IDLE_INTERVAL)
+            self.wake.clear()
+
+
 class SerialManager:
-    """Threaded serial port manager with batch accumulation."""
+    """
+    Threaded serial port manager with batch accumulation.
+
+    Writes never touch the port on the caller's thread: send() and send_at()
+    queue the data for a writer thread, which merges back-to-back writes
+    into one port write and runs timed writes at their due time (sleep, then
+    busy-wait the last TX_SPIN_TIME for sub-millisecond precision). Write
+    errors and timeouts are reported through on_tx_error.
+
+    With auto_reconnect, a read error (device reset, DFU, unplug) does not
+    end the session: the reader thread closes the port, waits on the
+    PortMonitor for the device with the same USB serial number (or the same
+    port name if it has none) and reopens it. Timestamps keep running, and
+    each (lost, back) interval is appended to gaps for the GUI to mark.
+    """
 
-    def __init__(self, on_labels_callback=None, on_text_callback=None):
+    def __init__(self, on_labels_callback=None, on_text_callback=None, on_tx_error_callback=None):
         self.port: Optional[serial.Serial] = None
         self.thread: Optional[threading.Thread] = None
         self.running = False
         self.on_text = on_text_callback
+        self.on_tx_error = on_tx_error_callback
+        self.tx_queue: queue.Queue = queue.Queue(maxsize=TX_QUEUE_SIZE)  # (generation, due or None, data)
+        self.tx_thread: Optional[threading.Thread] = None
+        self.tx_generation = 0  # Bumped by clear_tx() to drop pending writes
+        self.frame_hook = None  # Called with each parsed frame's values on the serial thread
         self.parser = BinaryProtocolParser(on_labels_callback)
         self.lock = threading.Lock()
         self.text_buffer = bytearray()
@@ -405,6 +990,15 @@ class SerialManager:
         self.frame_batch: list = []
         self.batch_lock = threading.Lock()
         self.batch_time = time.time()  # Track time for batch timestamps
+        self.monitor: Optional[PortMonitor] = None  # Used to find the device again after a read error
+        self.auto_reconnect = True
+        self.state = "disconnected"  # "connected", "reconnecting" or "disconnected"
+        self.port_name = ""
+        self.baud_rate = 0
+        self.serial_number = ""  # USB serial number of the device ("" = match by port name)
+        self.tuning: list = []  # tune_serial_port() notes for the open port
+        self.lost_time = 0.0  # Batch time of the last read error
+        self.gaps: list = []  # (lost, back) batch times of completed reconnects, drained by the GUI
 
     @staticmethod
     def list_ports() -> list:
@@ -416,52 +1010,215 @@ class SerialManager:
         """Connect to serial port."""
         self.disconnect()
         try:
-            # Use larger read buffer and disable flow control for USB CDC
-            self.port = serial.Serial(
-                port_name,
-                baud_rate,
-                timeout=0.05,
-                write_timeout=1.0,
-                xonxoff=False,
-                rtscts=False,
-                dsrdtr=False
-            )
-            # Set RTS high to signal ready-to-receive (important for some USB CDC)
-            self.port.rts = True
-            self.port.dtr = True
+            self.port = self._open(port_name, baud_rate)
+            self.port_name = port_name
+            self.baud_rate = baud_rate
+            self.serial_number = self._find_ports()[1].get(port_name, "")
+            self.state = "connected"
             self.running = True
             self.parser.reset()
             self.thread = threading.Thread(target=self._read_loop, daemon=True)
             self.thread.start()
+            self.tx_thread = threading.Thread(target=self._write_loop, daemon=True)
+            self.tx_thread.start()
             return True
         except Exception as e:
             print(f"Connection error: {e}")
             return False
 
+    def _open(self, port_name: str, baud_rate: int) -> serial.Serial:
+        # Use larger read buffer and disable flow control for USB CDC
+        port = serial.Serial(
+            port_name,
+            baud_rate,
+            timeout=0.05,
+            write_timeout=1.0,
+            xonxoff=False,
+            rtscts=False,
+            dsrdtr=False
+        )
+        # Set RTS high to signal ready-to-receive (important for some USB CDC)
+        port.rts = True
+        port.dtr = True
+        self.tuning = tune_serial_port(port)
+        return port
+
+    def _find_ports(self) -> tuple:
+        """(generation, {device: serial number}) from the monitor, or a direct scan without one."""
+        if self.monitor is not None:
+            return self.monitor.get_ports()
+        return 0, {p.device: p.serial_number or "" for p in serial.tools.list_ports.comports()}
+
+    def _find_device(self, ports: dict) -> str:
+        if self.serial_number:
+            for device, serial_number in ports.items():
+                if serial_number == self.serial_number:
+                    return device
+            return ""
+        return self.port_name if self.port_name in ports else ""
+
+    def _close_port(self):
+        with self.lock:
+            if self.port:
+                try:
+                    self.port.close()
+                except Exception:
+                    pass
+            self.port = None
+
+    def _reconnect(self) -> bool:
+        """Reader thread: wait for the device to come back and reopen it. False if stopped."""
+        self.lost_time = time.time() - self.batch_time
+        self.state = "reconnecting"
+        self._close_port()
+        if self.monitor is not None:
+            self.monitor.watch(True)
+        try:
+            while self.running:
+                generation, ports = self._find_ports()
+                device = self._find_device(ports)
+                if device:
+                    try:
+                        port = self._open(device, self.baud_rate)
+                    except (serial.SerialException, OSError):
+                        port = None  # Still gone, or not ready yet (e.g. permissions being applied)
+                    if port is not None:
+                        with self.lock:
+                            self.port = port
+                        self.port_name = device
+                        self.parser.reset()
+                        self.text_buffer = bytearray()
+                        with self.batch_lock:
+                            self.gaps.append((self.lost_time, time.time() - self.batch_time))
+                        self.state = "connected"
+                        return True
+                if self.monitor is not None:
+                    self.monitor.wait_change(generation, PORT_POLL_INTERVAL)
+                else:
+                    time.sleep(PORT_POLL_INTERVAL)
+            return False
+        finally:
+            if self.monitor is not None:
+                self.monitor.watch(False)
+
     def disconnect(self):
         """Disconnect from serial port."""
+        if self.tx_thread:
+            # Untimed writes queued before this still go out; timed ones are dropped
+            try:
+                self.tx_queue.put((self.tx_generation, None, None), timeout=0.5)
+            except queue.Full:
+                pass
+            self.tx_thread.join(timeout=1.0)
+            self.tx_thread = None
         self.running = False
         if self.thread:
             self.thread.join(timeout=1.0)
             self.thread = None
-        if self.port:
-            try:
-                self.port.close()
-            except:
-                pass
-            self.port = None
+        self._close_port()
+        self.state = "disconnected"
 
     def is_connected(self) -> bool:
         return self.port is not None and self.port.is_open
 
-    def send(self, data: bytes):
-        """Send data to serial port."""
-        if self.is_connected():
+    def send(self, data: bytes) -> bool:
+        """Queue data for the writer thread. Returns False if not connected or the queue is full."""
+        return self.is_connected() and self._queue_tx(None, data)
+
+    def send_at(self, data: bytes, when: float) -> bool:
+        """Queue data to be written at time.perf_counter() == when."""
+        return self.is_connected() and self._queue_tx(when, data)
+
+    def send_sequence(self, steps: list, start: Optional[float] = None) -> float:
+        """Schedule (offset seconds, data) steps relative to start (default: now). Returns start."""
+        if start is None:
+            start = time.perf_counter()
+        for offset, data in steps:
+            if not self.send_at(data, start + offset):
+                break
+        return start
+
+    def clear_tx(self):
+        """Drop all queued and scheduled writes that have not started yet."""
+        self.tx_generation += 1
+
+    def tx_pending(self) -> int:
+        return self.tx_queue.qsize()
+
+    def _queue_tx(self, when: Optional[float], data: Optional[bytes]) -> bool:
+        try:
+            self.tx_queue.put_nowait((self.tx_generation, when, data))
+            return True
+        except queue.Full:
+            self._report_tx_error(f"TX queue full, dropped {len(data or b'')} bytes")
+            return False
+
+    def _report_tx_error(self, message: str):
+        print(f"Send error: {message}")
+        if self.on_tx_error:
+            self.on_tx_error(message)
+
+    def _write(self, data: bytes):
+        try:
+            with self.lock:
+                if self.port is None:
+                    raise serial.SerialException(f"not connected, {len(data)} bytes not sent")
+                self.port.write(data)
+        except serial.SerialTimeoutException:
+            self._report_tx_error(f"write timed out, {len(data)} bytes not sent")
+        except Exception as e:
+            self._report_tx_error(str(e))
+
+    def _write_loop(self):
+        """Writer thread: coalesce untimed writes, run timed writes on schedule."""
+        scheduled: list = []  # Heap of (due, seq, generation, data)
+        seq = 0
+        stopping = False
+        while not stopping and self.running:
+            if scheduled and scheduled[0][2] != self.tx_generation:
+                scheduled = [s for s in scheduled if s[2] == self.tx_generation]
+                heapq.heapify(scheduled)
+            # Timed writes come first, so a steady stream of untimed ones cannot delay them
+            if scheduled and scheduled[0][0] - time.perf_counter() <= TX_SPIN_TIME:
+                due, _, generation, data = heapq.heappop(scheduled)
+                while time.perf_counter() < due:
+                    pass
+                if generation == self.tx_generation:
+                    self._write(data)
+                continue
+
+            wait = 0.1
+            if scheduled:
+                wait = scheduled[0][0] - TX_SPIN_TIME - time.perf_counter()
             try:
-                with self.lock:
-                    self.port.write(data)
-            except Exception as e:
-                print(f"Send error: {e}")
+                item = self.tx_queue.get(timeout=wait) if wait > 0 else self.tx_queue.get_nowait()
+            except queue.Empty:
+                continue
+
+            # Merge everything else already queued, up to TX_COALESCE_BYTES or the next timed write
+            chunks, size = [], 0
+            while item is not None:
+                generation, due, data = item
+                if data is None:
+                    stopping = True
+                elif generation != self.tx_generation:
+                    pass
+                elif due is not None:
+                    heapq.heappush(scheduled, (due, seq, generation, data))
+                    seq += 1
+                else:
+                    chunks.append(data)
+                    size += len(data)
+                if stopping or size >= TX_COALESCE_BYTES:
+                    break
+                if scheduled and scheduled[0][0] - time.perf_counter() <= TX_SPIN_TIME:
+                    break
+                try:
+                    item = self.tx_queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            if chunks:
+                self._write(b"".join(chunks))
 
     def get_batch(self) -> list:
         """Get accumulated data frames and clear the batch. Returns list of (timestamp, values) tuples."""
@@ -513,7 +1270,7 @@ class SerialManager:
                         elif 0x20 <= byte_val < 0x7F or byte_val == 0x09:  # Printable or tab
                             self.text_buffer.append(byte_val)
                             # Limit buffer size (increased for long help lines)
-                            if len(self.text_buffer) > 1024:
+                            if len(self.text_buffer) > TEXT_LINE_MAX:
                                 self.text_buffer = bytearray()
 
                     # Also feed to binary parser
@@ -523,6 +1280,9 @@ class SerialManager:
                         # Accumulate frame with timestamp into batch
                         with self.batch_lock:
                             self.frame_batch.append((current_time, result))
+                        hook = self.frame_hook
+                        if hook is not None:
+                            hook(result)
 
                 # Report stats every 2 seconds
                 now = time.time()
@@ -533,9 +1293,396 @@ class SerialManager:
                     frames_parsed = 0
                     last_report = now
             except Exception as e:
-                if self.running:
-                    print(f"Read error: {e}")
+                if not self.running:
+                    break
+                print(f"Read error: {e}")
+                if not (self.auto_reconnect and self._reconnect()):
+                    self._close_port()
+                    self.state = "disconnected"
+                    self.running = False
+                    break
+
+
+def parse_macro(script: str, buttons: Optional[list] = None) -> list:
+    """
+    Parse macro text into a nested list of ops. One command per line:
+
+        send <text>          send text followed by CR LF
+        hex <bytes>          send raw bytes, e.g. "hex AA 01 ff"
+        button <label>       send the command button with this label
+        delay <ms>           advance the timeline
+        timeout <ms>         time limit for the following waits (default 10000)
+        wait_text <regex>    wait for a terminal line matching regex
+        wait_channel <ch> <op> <value>   wait for a scaled channel value (op: > < >= <=)
+        repeat [n]           repeat the block up to "end" n times (no n = until stopped,
+                             the block then needs a delay or wait)
+        end
+
+    Blank lines and lines starting with # are ignored. Raises ValueError
+    naming the line on errors.
+    """
+    labels = {b.label: b for b in buttons or []}
+    root: list = []
+    stack = [root]
+    for lineno, raw in enumerate(script.splitlines(), 1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        word, _, arg = line.partition(" ")
+        word, arg = word.lower(), arg.strip()
+        try:
+            if word == "send":
+                op = ("send", f"{arg}\r\n".encode("utf-8"))
+            elif word == "hex":
+                op = ("send", CommandButton(data=arg, mode="hex").encode())
+            elif word == "button":
+                if arg not in labels:
+                    raise ValueError(f"no command button '{arg}'")
+                op = ("send", labels[arg].encode())
+            elif word in ("delay", "timeout"):
+                op = (word, float(arg) / 1000.0)
+            elif word == "wait_text":
+                op = ("wait_text", re.compile(arg))
+            elif word == "wait_channel":
+                ch, cmp, value = arg.split()
+                if cmp not in MACRO_COMPARE:
+                    raise ValueError(f"unknown comparison '{cmp}'")
+                op = ("wait_channel", int(ch), cmp, float(value))
+            elif word == "repeat":
+                op = ("repeat", int(arg) if arg else 0, [])
+                stack[-1].append(op)
+                stack.append(op[2])
+                continue
+            elif word == "end":
+                if len(stack) == 1:
+                    raise ValueError("'end' without 'repeat'")
+                if not stack[-1]:
+                    raise ValueError("empty 'repeat' block")
+                stack.pop()
+                if stack[-1][-1][1] == 0 and not _macro_waits(stack[-1][-1][2]):
+                    raise ValueError("'repeat' without a count needs a delay or wait in its block")
+                continue
+            else:
+                raise ValueError(f"unknown command '{word}'")
+        except (ValueError, re.error) as e:
+            raise ValueError(f"line {lineno}: {e}") from None
+        stack[-1].append(op)
+    if len(stack) > 1:
+        raise ValueError("'repeat' without 'end'")
+    return root
+
+
+def _macro_waits(ops: list) -> bool:
+    """True if running ops takes time (a delay or wait somewhere inside)."""
+    return any(op[0] in ("delay", "wait_text", "wait_channel") or (op[0] == "repeat" and _macro_waits(op[2]))
+               for op in ops)
+
+
+class _MacroStopped(Exception):
+    """Raised inside the macro thread when stop() was called."""
+
+
+class MacroRunner:
+    """
+    Runs one macro at a time on a background thread.
+
+    Sends are placed on an absolute timeline with SerialManager.send_at, so
+    delays do not pick up thread wake-up jitter: 100 steps of "delay 10"
+    end 1.000 s after the start. A wait restarts the timeline at the moment
+    its condition was seen. wait_text is fed from the serial thread's text
+    lines and wait_channel from a SerialManager frame hook, so neither
+    depends on the GUI frame rate.
+    """
+
+    LOOKAHEAD = 0.05  # Seconds of sends handed to the writer ahead of their time
+    DEFAULT_TIMEOUT = 10.0  # Seconds a wait may take until a timeout op changes it
+
+    def __init__(self, serial_manager: SerialManager, on_message=None):
+        self.serial = serial_manager
+        self.on_message = on_message
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.hit = threading.Event()
+        self.hit_time = 0.0
+        self.waiting: Optional[tuple] = None  # Current wait op
+        self.t = 0.0  # Timeline position (perf_counter) of the next send
+        self.timeout = self.DEFAULT_TIMEOUT  # Time limit of the following waits
+        self.configs: list = []  # Channel configs for wait_channel scaling
+        self.name = ""
+        self.status = "Idle"
+
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, name: str, ops: list, channel_configs: list) -> bool:
+        if self.is_running():
+            return False
+        self.name = name
+        self.configs = channel_configs
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(ops,), daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """Stop the macro and drop its sends that are not written yet."""
+        if self.is_running():
+            self.stop_event.set()
+            self.serial.clear_tx()
+
+    def feed_text(self, line: str):
+        """Terminal line from the serial thread."""
+        op = self.waiting
+        if op is not None and op[0] == "wait_text" and op[1].search(line):
+            self._signal()
+
+    def _on_frame(self, values: list):
+        op = self.waiting
+        if op is None or op[0] != "wait_channel" or op[1] >= len(values):
+            return
+        _, ch, cmp, limit = op
+        cfg = self.configs[ch] if ch < len(self.configs) else None
+        value = values[ch] * cfg.scale + cfg.offset if cfg is not None else values[ch]
+        if MACRO_COMPARE[cmp](value, limit):
+            self._signal()
+
+    def _signal(self):
+        if not self.hit.is_set():
+            self.hit_time = time.perf_counter()
+            self.hit.set()
+
+    def _message(self, text: str):
+        self.status = text
+        if self.on_message:
+            self.on_message(f"[macro] {self.name}: {text}")
+
+    def _run(self, ops: list):
+        self._message("started")
+        self.t = time.perf_counter()
+        self.timeout = self.DEFAULT_TIMEOUT
+        try:
+            self._execute(ops)
+            # Let the last sends go out before reporting completion
+            self._sleep_until(self.t)
+            self._message("finished")
+        except _MacroStopped:
+            self._message("stopped")
+        except Exception as e:
+            self.serial.clear_tx()
+            self._message(f"error: {e}")
+        finally:
+            self.waiting = None
+            self.serial.frame_hook = None
+
+    def _sleep_until(self, when: float):
+        if self.stop_event.wait(max(0.0, when - time.perf_counter())):
+            raise _MacroStopped
+
+    def _execute(self, ops: list):
+        for op in ops:
+            kind = op[0]
+            if kind == "send":
+                self._sleep_until(self.t - self.LOOKAHEAD)
+                if not self.serial.send_at(op[1], self.t):
+                    raise RuntimeError("send failed (not connected or TX queue full)")
+            elif kind == "delay":
+                self.t += op[1]
+            elif kind == "timeout":
+                self.timeout = op[1]
+            elif kind == "repeat":
+                count = 0
+                while op[1] == 0 or count < op[1]:
+                    # Paces the loop in real time and lets stop() end it, even if the block only has delays
+                    self._sleep_until(self.t - self.LOOKAHEAD)
+                    self._execute(op[2])
+                    count += 1
+            else:
+                self._wait(op)
+
+    def _wait(self, op: tuple):
+        """Block until the wait condition holds, then restart the timeline there."""
+        self._sleep_until(self.t)
+        started = time.perf_counter()
+        self.hit.clear()
+        self.waiting = op
+        if op[0] == "wait_channel":
+            self.serial.frame_hook = self._on_frame
+        try:
+            while not self.hit.wait(0.02):
+                if self.stop_event.is_set():
+                    raise _MacroStopped
+                if time.perf_counter() - started > self.timeout:
+                    raise RuntimeError(f"{op[0]} timed out after {self.timeout * 1000:.0f} ms")
+        finally:
+            self.waiting = None
+            self.serial.frame_hook = None
+        self.t = self.hit_time
+
+
+class DfuJob:
+    """One device of a DFU batch: state, progress and output, updated by its worker thread."""
+
+    def __init__(self, device: dict):
+        self.device = device
+        self.state = "Queued"  # Queued, Reading, Erasing, Downloading, Done, Skipped, Failed, Cancelled
+        self.progress = 0.0  # 0..1 within the current phase
+        self.message = ""
+
+    @property
+    def name(self) -> str:
+        return self.device.get("serial") or self.device.get("path") or "?"
+
+    def finished(self) -> bool:
+        return self.state in ("Done", "Skipped", "Failed", "Cancelled")
+
+
+class DfuQueue:
+    """
+    Flashes a batch of DFU devices with at most `parallel` dfu-util processes at once.
+
+    Each job runs dfu-util for one device (selected by USB path, or serial
+    number when dfu-util reports no path) on its own thread. dfu-util redraws
+    its progress bar with carriage returns, so the output is split on CR and
+    LF and "Erase"/"Download" percentages go into the job; the other lines
+    go to on_output prefixed with the device name.
+    """
+
+    def __init__(self, on_output=None):
+        self.on_output = on_output
+        self.jobs: list[DfuJob] = []
+        self.processes: dict = {}  # DfuJob -> Popen
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def running(self) -> bool:
+        return any(not job.finished() for job in self.jobs)
+
+    def start(self, devices: list, file_path: str, address: str, parallel: int,
+              image: Optional[dict] = None, skip_identical: bool = False):
+        """
+        Queue one job per device and start the dispatcher. With the image
+        info (firmware_image_info) each device's memory layout is checked
+        first; skip_identical reads the flash back and skips devices that
+        already hold the image.
+        """
+        if self.running():
+            return
+        self.cancelled = False
+        self.jobs = [DfuJob(d) for d in devices]
+        slots = threading.Semaphore(max(1, parallel))
+
+        def run(job: DfuJob):
+            try:
+                self._flash(job, file_path, address, image, skip_identical)
+            except Exception as e:
+                # A job must always finish, or running() stays True and blocks further batches
+                job.state, job.message = "Failed", str(e)
+                self._output(job, f"Failed ({e})")
+            finally:
+                slots.release()
+
+        def dispatch():
+            for job in self.jobs:
+                slots.acquire()
+                if self.cancelled:
+                    job.state = "Cancelled"
+                    slots.release()
+                    continue
+                threading.Thread(target=run, args=(job,), daemon=True).start()
+
+        threading.Thread(target=dispatch, daemon=True).start()
+
+    def cancel(self):
+        """Skip queued jobs and stop running dfu-util processes."""
+        self.cancelled = True
+        with self.lock:
+            for process in self.processes.values():
+                process.kill()
+
+    def _output(self, job: DfuJob, line: str):
+        if self.on_output:
+            self.on_output(f"[{job.name}] {line}")
+
+    def _flash(self, job: DfuJob, file_path: str, address: str, image: Optional[dict], skip_identical: bool):
+        device = job.device
+        select = ["-p", device["path"]] if device.get("path") else ["-S", device.get("serial", "")]
+        base = dfu_util_command() + ["-d", device.get("id", ""), *select, "-a", device.get("alt", "0")]
+        if image is not None:
+            start = int(address.split(":")[0], 16)
+            regions = parse_dfu_layout(dict(device.get("alts", [])).get(device.get("alt", "0"), ""))
+            error = check_image_fits(start, image["size"], regions) if regions else ""
+            if error:
+                job.state, job.message = "Failed", error
+                self._output(job, f"Not flashed: {error}")
+                return
+            if skip_identical and self._matches_image(job, base, start, image):
+                job.state, job.progress, job.message = "Skipped", 1.0, "already up to date"
+                self._output(job, "Flash holds the same image, skipped")
+                return
+            if self.cancelled:
+                job.state = "Cancelled"
+                return
+        code = self._run(job, base + ["-s", address, "-D", file_path])
+        if self.cancelled and code != 0:
+            job.state = "Cancelled"
+        elif code == 0:
+            job.state, job.progress = "Done", 1.0
+        else:
+            job.state = "Failed"
+            job.message = f"exit code {code}: {job.message}"
+        self._output(job, job.state if job.state != "Failed" else f"Failed ({job.message})")
+
+    def _matches_image(self, job: DfuJob, base: list, start: int, image: dict) -> bool:
+        """Read the image's address range back with dfu-util -U and compare SHA-256."""
+        folder = tempfile.mkdtemp(prefix="dragoonplot_dfu_")
+        path = os.path.join(folder, "readback.bin")  # dfu-util -U refuses existing files
+        try:
+            if self._run(job, base + ["-s", f"0x{start:08X}:{image['size']}", "-U", path]) != 0:
+                self._output(job, "Read-back failed, flashing anyway")
+                return False
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest() == image["sha256"]
+        except OSError:
+            return False
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    def _run(self, job: DfuJob, cmd: list) -> int:
+        """Run one dfu-util command for the job, tracking its progress; returns the exit code."""
+        self._output(job, f"Running: {' '.join(cmd)}")
+        job.state = "Starting"
+        progress_re = re.compile(r"^\s*(Erase|Download|Upload)\s*\[[^\]]*\]\s*(\d+)%")
+        try:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
+        except OSError as e:
+            job.message = str(e)
+            self._output(job, f"ERROR: {e}")
+            return -1
+        with self.lock:
+            self.processes[job] = process
+        pending = b""
+        while True:
+            chunk = process.stdout.read(256)
+            if not chunk:
                 break
+            parts = re.split(rb"[\r\n]", pending + chunk)
+            pending = parts.pop()
+            for part in parts:
+                line = part.decode("utf-8", "replace").rstrip()
+                match = progress_re.match(line)
+                if match:
+                    job.state = {"Erase": "Erasing", "Download": "Downloading", "Upload": "Reading"}[match.group(1)]
+                    job.progress = int(match.group(2)) / 100.0
+                elif line:
+                    job.message = line
+                    self._output(job, line)
+        if pending.strip():
+            job.message = pending.decode("utf-8", "replace").strip()
+            self._output(job, job.message)
+        process.wait()
+        with self.lock:
+            self.processes.pop(job, None)
+        return process.returncode
 
 
 class DataBuffer:
@@ -549,6 +1696,7 @@ class DataBuffer:
         self.count: dict[int, int] = {}
         self.start_time = time.time()
         self.lock = threading.Lock()
+        self.history = None  # Optional HistoryTier fed with every sample
 
     def _ensure_channel(self, channel: int):
         """Allocate arrays for a new channel (call under lock)."""
@@ -569,27 +1717,161 @@ class DataBuffer:
                 self.write_idx[ch] = (idx + 1) % self.max_size
                 self.count[ch] = min(self.count[ch] + 1, self.max_size)
 
+    def add_frames(self, timestamps: np.ndarray, values: np.ndarray):
+        """Add a block of frames: timestamps[F], values[F, C] (column c is channel c)."""
+        with self.lock:
+            for ch in range(values.shape[1]):
+                self._write(ch, timestamps, values[:, ch])
+
+    def add_samples(self, channel: int, timestamps: np.ndarray, values: np.ndarray):
+        """Add a run of samples to one channel."""
+        with self.lock:
+            self._write(channel, timestamps, values)
+
+    def _write(self, ch: int, timestamps: np.ndarray, values: np.ndarray):
+        """Vectorized ring write for one channel (call under lock)."""
+        if self.history is not None:
+            self.history.append(ch, timestamps, values)
+        self._ensure_channel(ch)
+        n = len(timestamps)
+        if n > self.max_size:
+            timestamps = timestamps[-self.max_size:]
+            values = values[-self.max_size:]
+            n = self.max_size
+        idx = self.write_idx[ch]
+        first = min(n, self.max_size - idx)
+        self.timestamps[ch][idx:idx + first] = timestamps[:first]
+        self.values[ch][idx:idx + first] = values[:first]
+        if n > first:
+            self.timestamps[ch][:n - first] = timestamps[first:]
+            self.values[ch][:n - first] = values[first:]
+        self.write_idx[ch] = (idx + n) % self.max_size
+        self.count[ch] = min(self.count[ch] + n, self.max_size)
+
+    def _ordered(self, channel: int) -> tuple:
+        """Ring contents oldest first, without copying when not wrapped (call under lock)."""
+        count = self.count.get(channel, 0)
+        if count == 0:
+            return np.array([]), np.array([])
+        if count < self.max_size:
+            return self.timestamps[channel][:count], self.values[channel][:count]
+        idx = self.write_idx[channel]
+        ts = np.concatenate([self.timestamps[channel][idx:], self.timestamps[channel][:idx]])
+        vals = np.concatenate([self.values[channel][idx:], self.values[channel][:idx]])
+        return ts, vals
+
     def get_data(self, channel: int) -> tuple:
         """Return (timestamps, values) as numpy arrays, properly ordered."""
         with self.lock:
-            if channel not in self.timestamps:
-                return np.array([]), np.array([])
-            count = self.count[channel]
-            if count == 0:
+            ts, vals = self._ordered(channel)
+            return ts.copy(), vals.copy()
+
+    def get_latest(self, channel: int, n: int) -> tuple:
+        """Return the newest n (timestamps, values) of a channel from the ring (or history, for snapshots)."""
+        with self.lock:
+            if not self.count.get(channel) and self.history is not None and channel in self.history.channels:
+                return self.history.get_latest(channel, n)  # Snapshot buffers keep everything in the history tier
+            n = min(n, self.count.get(channel, 0))
+            if n == 0:
                 return np.array([]), np.array([])
-            if count < self.max_size:
-                # Buffer not full yet - simple slice
-                return self.timestamps[channel][:count].copy(), self.values[channel][:count].copy()
-            else:
-                # Full buffer - reorder from write index (oldest data first)
-                idx = self.write_idx[channel]
-                ts = np.concatenate([self.timestamps[channel][idx:], self.timestamps[channel][:idx]])
-                vals = np.concatenate([self.values[channel][idx:], self.values[channel][:idx]])
-                return ts, vals
+            idx = (self.write_idx[channel] - n + np.arange(n)) % self.max_size
+            return self.timestamps[channel][idx], self.values[channel][idx]
+
+    def get_range(self, channel: int, t0: float, t1: float, max_points: int = 0) -> tuple:
+        """
+        Return (timestamps, values) with t0 <= t <= t1.
+        Served from the in-memory ring when it covers t0, otherwise from the
+        history tier (which may return min/max pairs when over max_points).
+        """
+        with self.lock:
+            ts, vals = self._ordered(channel)
+            if self.history is not None and (len(ts) == 0 or t0 < ts[0]):
+                return self.history.get_range(channel, t0, t1, max_points)
+            i0 = np.searchsorted(ts, t0, side='left')
+            i1 = np.searchsorted(ts, t1, side='right')
+            return ts[i0:i1].copy(), vals[i0:i1].copy()
+
+    def oldest_time(self) -> Optional[float]:
+        """Timestamp of the oldest sample still available (ring or history)."""
+        with self.lock:
+            if self.history is not None:
+                oldest = self.history.oldest_time()
+                if oldest is not None:
+                    return oldest
+            starts = [self.timestamps[ch][self.write_idx[ch] if self.count[ch] == self.max_size else 0]
+                      for ch in self.timestamps if self.count[ch]]
+            return min(starts) if starts else None
+
+    def export(self) -> dict:
+        """
+        Return {channel: (timestamps, values)} with everything stored: the full
+        history tier when attached, otherwise the ring. Integer-valued ring
+        data is narrowed to int16.
+        """
+        data = {}
+        with self.lock:
+            history = self.history
+            stored = {ch: c["count"] for ch, c in history.channels.items()} if history is not None else {}
+            for ch in set(self.timestamps) - set(stored):
+                ts, vals = self._ordered(ch)
+                data[ch] = (ts.copy(), self._narrow(vals))
+        # History is copied one chunk per lock hold and decoded outside it, so ingest keeps running
+        for ch, count in stored.items():
+            parts = []
+            for k in range(-(-count // history.chunk)):
+                with self.lock:
+                    raw = history.raw_chunk(ch, k) if self.history is history else None
+                if raw is None:
+                    break  # Cleared or detached meanwhile
+                parts.append(history.decode_chunk(raw))
+            if parts:
+                data[ch] = (np.concatenate([p[0] for p in parts])[:count],
+                            np.concatenate([p[1] for p in parts])[:count])
+        return dict(sorted(data.items()))
+
+    @staticmethod
+    def _narrow(vals: np.ndarray) -> np.ndarray:
+        """Copy of ring values as int16 if they are all int16 codes (device channels), else as is."""
+        narrow = vals.astype(np.int16)
+        return narrow if np.array_equal(narrow, vals) else vals.copy()
+
+    def set_history(self, history):
+        """Attach (or detach with None) a history tier, seeded with the current ring contents."""
+        with self.lock:
+            if self.history is not None:
+                self.history.close()
+            self.history = history
+            if history is not None:
+                for ch in self.timestamps:
+                    ts, vals = self._ordered(ch)
+                    if len(ts):
+                        # The tier fixes a channel's dtype on its first append: keep device channels int16
+                        history.append(ch, ts, self._narrow(vals))
 
     def get_channel_count(self) -> int:
+        """Number of device channels (derived channels live at MAX_CHANNELS and up)."""
+        with self.lock:
+            return sum(1 for ch in self.timestamps if ch < MAX_CHANNELS)
+
+    def remove_channel(self, channel: int):
+        """Drop all data of one channel (history chunk storage is reclaimed on clear)."""
         with self.lock:
-            return len(self.timestamps)
+            for store in (self.timestamps, self.values, self.write_idx, self.count):
+                store.pop(channel, None)
+            if self.history is not None:
+                self.history.channels.pop(channel, None)
+
+    def move_channel(self, src: int, dst: int):
+        """Move all data of channel src (ring and history) to index dst, replacing what dst held."""
+        with self.lock:
+            stores = [self.timestamps, self.values, self.write_idx, self.count]
+            if self.history is not None:
+                stores.append(self.history.channels)
+            for store in stores:
+                if src in store:
+                    store[dst] = store.pop(src)
+                else:
+                    store.pop(dst, None)
 
     def clear(self):
         with self.lock:
@@ -597,58 +1879,1942 @@ class DataBuffer:
             self.values.clear()
             self.write_idx.clear()
             self.count.clear()
+            if self.history is not None:
+                self.history.clear()
             self.start_time = time.time()
 
 
-class DragoonPlotApp:
-    """Main application class."""
+class HistoryTier(abc.ABC):
+    """
+    Base class for history tiers behind the DataBuffer ring.
+
+    Samples of each channel are stored in fixed-size chunks of `chunk`
+    samples. RAM always holds the time index (first timestamp of each chunk)
+    and a min/max summary per HISTORY_BUCKET samples, which answers wide
+    range queries without touching chunk storage. Subclasses decide where
+    chunks live via _open_chunk / _seal_chunk / _chunk_arrays.
+    """
+
+    chunk = HISTORY_CHUNK
 
     def __init__(self):
-        self.config = self._load_config()
-        self.data_buffer = DataBuffer()
-        self.serial_manager = SerialManager(self._on_labels, self._on_text_line)
-        self.channel_configs: list[ChannelConfig] = list(self.config.channels)
-        self.command_buttons: list[CommandButton] = list(self.config.buttons)
-        self.time_window = self.config.time_window
-        self.pending_labels: dict[int, str] = {}
-        self.labels_updated = False
-        self.ui_scale = 1.0  # Will be set properly in _setup_gui
-        self.help_parsing = False  # Flag to indicate we're parsing help output
-        self.parsed_commands: list[CommandButton] = []  # Commands parsed from help
-        self.commands_updated = False  # Flag to rebuild command buttons
-        self.terminal_queue: list[str] = []  # Queue for terminal output (thread-safe)
-        self.terminal_lock = threading.Lock()
-        self.dfu_output_queue: list[str] = []  # Queue for DFU output (thread-safe)
-        self.plot_paused = False  # When True, discard incoming data and freeze plot
-        self.logging = False  # When True, log data to CSV file
-        self.log_file = None  # File handle for CSV logging
-        self.log_start_time = 0  # Time when logging started
-        self._setup_gui()
+        self.channels: dict[int, dict] = {}
 
-    def _load_config(self) -> AppConfig:
-        if CONFIG_FILE.exists():
-            try:
-                with open(CONFIG_FILE, 'r') as f:
-                    config = AppConfig.from_dict(json.load(f))
-                    # Use default buttons if none saved
-                    if not config.buttons:
-                        config.buttons = [CommandButton(b.label, b.data, b.mode) for b in DEFAULT_COMMAND_BUTTONS]
-                    return config
-            except Exception as e:
-                print(f"Error loading config: {e}")
-        # Return default config with default command buttons
-        config = AppConfig()
-        config.buttons = [CommandButton(b.label, b.data, b.mode) for b in DEFAULT_COMMAND_BUTTONS]
-        return config
+    def _new_channel(self, dtype) -> dict:
+        return {
+            "dtype": np.dtype(dtype),
+            "chunks": [],  # Subclass-specific storage per chunk
+            "chunk_t0": np.zeros(16, dtype=np.float64),
+            "count": 0,
+            # Min/max summary per HISTORY_BUCKET samples (completed buckets only)
+            "sum_t": np.zeros(16, dtype=np.float64),
+            "sum_min": np.zeros(16, dtype=np.float64),
+            "sum_max": np.zeros(16, dtype=np.float64),
+            "sum_count": 0,
+        }
 
-    def _save_config(self):
-        self.config.last_port = self._get_selected_port()
-        self.config.last_baud = self._get_selected_baud()
-        self.config.channels = list(self.channel_configs)
-        self.config.buttons = list(self.command_buttons)
-        self.config.time_window = self.time_window
-        try:
-            with open(CONFIG_FILE, 'w') as f:
+    @abc.abstractmethod
+    def _open_chunk(self, ch: dict):
+        """Return storage for a new writable chunk."""
+
+    def _seal_chunk(self, ch: dict, chunk_idx: int):
+        """Called once a chunk is full."""
+
+    @abc.abstractmethod
+    def _chunk_arrays(self, ch: dict, chunk_idx: int) -> tuple:
+        """Return (timestamps, values) arrays of a chunk (full length)."""
+
+    def _release_outside(self, ch: dict, first: int, last: int):
+        """Called after a range query touching chunks first..last."""
+
+    @abc.abstractmethod
+    def get_latest(self, channel: int, n: int) -> tuple:
+        """Return the newest n raw (timestamps, values) of a channel."""
+
+    @staticmethod
+    def _grow(arr: np.ndarray, needed: int) -> np.ndarray:
+        if needed <= len(arr):
+            return arr
+        new = np.zeros(max(needed, len(arr) * 2), dtype=arr.dtype)
+        new[:len(arr)] = arr
+        return new
+
+    def append(self, channel: int, timestamps: np.ndarray, values: np.ndarray):
+        """Append samples for one channel (timestamps must be non-decreasing)."""
+        ch = self.channels.get(channel)
+        if ch is None:
+            ch = self.channels[channel] = self._new_channel(values.dtype)
+        values = values.astype(ch["dtype"], copy=False)
+        pos = 0
+        n = len(timestamps)
+        while pos < n:
+            chunk_idx, fill = divmod(ch["count"], self.chunk)
+            if chunk_idx == len(ch["chunks"]):
+                ch["chunks"].append(self._open_chunk(ch))
+                ch["chunk_t0"] = self._grow(ch["chunk_t0"], chunk_idx + 1)
+                ch["chunk_t0"][chunk_idx] = timestamps[pos]
+            ts_arr, val_arr = self._chunk_arrays(ch, chunk_idx)
+            take = min(n - pos, self.chunk - fill)
+            ts_arr[fill:fill + take] = timestamps[pos:pos + take]
+            val_arr[fill:fill + take] = values[pos:pos + take]
+            ch["count"] += take
+            pos += take
+            self._update_summary(ch)
+            if fill + take == self.chunk:
+                self._seal_chunk(ch, chunk_idx)
+
+    def _update_summary(self, ch: dict):
+        """Summarize newly completed buckets (buckets never straddle chunks)."""
+        done = ch["sum_count"]
+        total = ch["count"] // HISTORY_BUCKET
+        if total <= done:
+            return
+        for key in ("sum_t", "sum_min", "sum_max"):
+            ch[key] = self._grow(ch[key], total)
+        per_chunk = self.chunk // HISTORY_BUCKET
+        b = done
+        while b < total:
+            chunk_idx, first = divmod(b, per_chunk)
+            last = min(total - chunk_idx * per_chunk, per_chunk)
+            ts_arr, val_arr = self._chunk_arrays(ch, chunk_idx)
+            vals = val_arr[first * HISTORY_BUCKET:last * HISTORY_BUCKET].reshape(-1, HISTORY_BUCKET)
+            end = b + (last - first)
+            ch["sum_t"][b:end] = ts_arr[first * HISTORY_BUCKET:last * HISTORY_BUCKET:HISTORY_BUCKET]
+            ch["sum_min"][b:end] = vals.min(axis=1)
+            ch["sum_max"][b:end] = vals.max(axis=1)
+            b = end
+        ch["sum_count"] = total
+
+    def _index_of(self, ch: dict, t: float) -> int:
+        """Global index of the first sample with timestamp >= t."""
+        n_chunks = len(ch["chunks"])
+        if n_chunks == 0:
+            return 0
+        k = int(np.searchsorted(ch["chunk_t0"][:n_chunks], t, side='left')) - 1
+        if k < 0:
+            return 0
+        fill = min(ch["count"] - k * self.chunk, self.chunk)
+        ts_arr = self._chunk_arrays(ch, k)[0]
+        return k * self.chunk + int(np.searchsorted(ts_arr[:fill], t, side='left'))
+
+    def _read(self, ch: dict, start: int, stop: int) -> tuple:
+        """Copy raw samples [start, stop) out of chunk storage."""
+        ts_parts, val_parts = [], []
+        pos = start
+        while pos < stop:
+            chunk_idx, off = divmod(pos, self.chunk)
+            take = min(stop - pos, self.chunk - off)
+            ts_arr, val_arr = self._chunk_arrays(ch, chunk_idx)
+            ts_parts.append(ts_arr[off:off + take])
+            val_parts.append(val_arr[off:off + take])
+            pos += take
+        if not ts_parts:
+            return np.array([]), np.array([])
+        return np.concatenate(ts_parts), np.concatenate(val_parts).astype(np.float64)
+
+    def raw_chunk(self, channel: int, chunk_idx: int):
+        """
+        Chunk chunk_idx of a channel in a form decode_chunk() can turn into
+        (timestamps, values) without the owner's lock; None if it is gone.
+        Bypasses any decode cache.
+        """
+        ch = self.channels.get(channel)
+        if ch is None or chunk_idx >= len(ch["chunks"]):
+            return None
+        ts, vals = self._chunk_arrays(ch, chunk_idx)
+        return ts.copy(), vals.copy()
+
+    def decode_chunk(self, raw) -> tuple:
+        return raw
+
+    def get_range(self, channel: int, t0: float, t1: float, max_points: int = 0) -> tuple:
+        """
+        Return (timestamps, values) with t0 <= t <= t1.
+        If max_points is set and the range holds more samples, min/max pairs
+        from the bucket summary are returned instead of raw samples.
+        """
+        ch = self.channels.get(channel)
+        if ch is None or ch["count"] == 0:
+            return np.array([]), np.array([])
+        start = self._index_of(ch, t0)
+        stop = self._index_of(ch, np.nextafter(t1, np.inf))
+        if not max_points or stop - start <= max_points:
+            result = self._read(ch, start, stop)
+            self._release_outside(ch, start // self.chunk, max(stop - 1, start) // self.chunk)
+            return result
+
+        # Summary path: whole buckets inside the range, raw samples at the ragged ends
+        b0 = -(-start // HISTORY_BUCKET)
+        b1 = min(stop // HISTORY_BUCKET, ch["sum_count"])
+        if b1 <= b0:
+            return self._read(ch, start, stop)
+        head_t, head_v = self._read(ch, start, b0 * HISTORY_BUCKET)
+        tail_t, tail_v = self._read(ch, b1 * HISTORY_BUCKET, stop)
+        self._release_outside(ch, start // self.chunk, max(stop - 1, start) // self.chunk)
+        sum_t = ch["sum_t"][b0:b1]
+        sum_min = ch["sum_min"][b0:b1]
+        sum_max = ch["sum_max"][b0:b1]
+        # Merge neighbouring buckets until the result fits in max_points
+        group = -(-2 * (b1 - b0) // max(max_points, 2))
+        if group > 1:
+            starts = np.arange(0, b1 - b0, group)
+            sum_t = sum_t[starts]
+            sum_min = np.minimum.reduceat(sum_min, starts)
+            sum_max = np.maximum.reduceat(sum_max, starts)
+        t = np.repeat(sum_t, 2)
+        v = np.empty(len(t))
+        v[0::2] = sum_min
+        v[1::2] = sum_max
+        return np.concatenate([head_t, t, tail_t]), np.concatenate([head_v, v, tail_v])
+
+    def oldest_time(self) -> Optional[float]:
+        """Timestamp of the oldest stored sample across channels."""
+        starts = [ch["chunk_t0"][0] for ch in self.channels.values() if ch["count"]]
+        return min(starts) if starts else None
+
+    @abc.abstractmethod
+    def size_bytes(self) -> int:
+        """Bytes of chunk storage in use."""
+
+    def clear(self):
+        """Drop all history."""
+        self.channels.clear()
+
+    def close(self):
+        """Drop all history and release resources."""
+        self.clear()
+
+
+class DiskHistory(HistoryTier):
+    """
+    Disk-backed history tier: every sample is appended to one memory-mapped
+    chunk file so the plot can show and pan through hours of data.
+
+    The file is a sequence of chunk records, each holding HISTORY_CHUNK
+    samples of one channel: [float64 timestamps][values]. Only the time
+    index and min/max summary stay in RAM.
+    """
+
+    SEGMENT_BYTES = 64 * 1024 * 1024  # File is mapped in segments of this size
+
+    def __init__(self, directory: str = ""):
+        super().__init__()
+        self.dir = tempfile.mkdtemp(prefix="dragoonplot_history_", dir=directory or None)
+        self.path = os.path.join(self.dir, "history.bin")
+        self.file = open(self.path, 'w+b')
+        self.segments: list[np.memmap] = []
+        self.segment_fill = self.SEGMENT_BYTES  # Forces a new segment on first chunk
+
+    def _open_chunk(self, ch: dict) -> tuple:
+        """Allocate a chunk record in the file, returning (timestamps, values) views."""
+        dtype = ch["dtype"]
+        size = self.chunk * (8 + dtype.itemsize)
+        if self.segment_fill + size > self.SEGMENT_BYTES:
+            offset = len(self.segments) * self.SEGMENT_BYTES
+            self.segments.append(np.memmap(self.file, dtype=np.uint8, mode='r+',
+                                           offset=offset, shape=(self.SEGMENT_BYTES,)))
+            self.segment_fill = 0
+        seg = self.segments[-1]
+        start = self.segment_fill
+        self.segment_fill += size
+        ts = seg[start:start + self.chunk * 8].view(np.float64)
+        vals = seg[start + self.chunk * 8:start + size].view(dtype)
+        return ts, vals
+
+    def _chunk_arrays(self, ch: dict, chunk_idx: int) -> tuple:
+        return ch["chunks"][chunk_idx]
+
+    def get_latest(self, channel: int, n: int) -> tuple:
+        ch = self.channels.get(channel)
+        if ch is None:
+            return np.array([]), np.array([])
+        return self._read(ch, max(0, ch["count"] - n), ch["count"])
+
+    def size_bytes(self) -> int:
+        return sum(len(s) for s in self.segments)
+
+    def clear(self):
+        """Drop all history and truncate the chunk file."""
+        super().clear()
+        self.segments = []
+        self.segment_fill = self.SEGMENT_BYTES
+        try:
+            self.file.truncate(0)
+        except OSError:
+            pass  # Still mapped (Windows); new chunks overwrite the file from the start
+
+    def close(self):
+        """Release the mapping and delete the spill directory."""
+        super().clear()
+        self.segments = []
+        try:
+            self.file.close()
+        except Exception:
+            pass
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class CompressedHistory(HistoryTier):
+    """
+    In-memory history tier that seals full chunks into compressed blocks.
+
+    Sealed blocks store delta-encoded values (integer channels) and
+    timestamps (as int64 bit patterns), byte-shuffled and zlib-compressed,
+    which keeps several hours of int16 data within a few hundred MB.
+    Blocks are decompressed lazily and only blocks in the most recently
+    queried view of each channel stay cached.
+    """
+
+    chunk = COMPRESSED_CHUNK
+
+    def _open_chunk(self, ch: dict) -> list:
+        ch.setdefault("cache", {})
+        # [timestamps, values] while open; [compressed ts, compressed values] once sealed
+        return [np.zeros(self.chunk, dtype=np.float64), np.zeros(self.chunk, dtype=ch["dtype"])]
+
+    @staticmethod
+    def _encode(arr: np.ndarray) -> bytes:
+        if arr.dtype.kind in 'iu':
+            arr = np.diff(arr, prepend=arr.dtype.type(0))  # Wraps consistently with cumsum
+        shuffled = arr.view(np.uint8).reshape(-1, arr.dtype.itemsize).T
+        return zlib.compress(shuffled.tobytes(), 1)
+
+    @staticmethod
+    def _decode(data: bytes, dtype: np.dtype, n: int) -> np.ndarray:
+        raw = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        arr = raw.reshape(dtype.itemsize, n).T.copy().view(dtype).reshape(n)
+        if dtype.kind in 'iu':
+            arr = np.cumsum(arr, dtype=dtype)
+        return arr
+
+    def _seal_chunk(self, ch: dict, chunk_idx: int):
+        ts, vals = ch["chunks"][chunk_idx]
+        ch["chunks"][chunk_idx] = [self._encode(ts.view(np.int64)), self._encode(vals)]
+
+    def _chunk_arrays(self, ch: dict, chunk_idx: int) -> tuple:
+        entry = ch["chunks"][chunk_idx]
+        if isinstance(entry[0], np.ndarray):
+            return entry  # Open chunk
+        cached = ch["cache"].get(chunk_idx)
+        if cached is None:
+            ts = self._decode(entry[0], np.dtype(np.int64), self.chunk).view(np.float64)
+            cached = ch["cache"][chunk_idx] = (ts, self._decode(entry[1], ch["dtype"], self.chunk))
+        return cached
+
+    def raw_chunk(self, channel: int, chunk_idx: int):
+        ch = self.channels.get(channel)
+        if ch is None or chunk_idx >= len(ch["chunks"]):
+            return None
+        entry = ch["chunks"][chunk_idx]
+        if isinstance(entry[0], np.ndarray):
+            return entry[0].copy(), entry[1].copy()  # Open chunk, still being written
+        return entry[0], entry[1], ch["dtype"]  # Compressed bytes never change
+
+    def decode_chunk(self, raw) -> tuple:
+        if len(raw) == 2:
+            return raw
+        ts = self._decode(raw[0], np.dtype(np.int64), self.chunk).view(np.float64)
+        return ts, self._decode(raw[1], raw[2], self.chunk)
+
+    def _release_outside(self, ch: dict, first: int, last: int):
+        cache = ch["cache"]
+        for idx in [k for k in cache if k < first or k > last]:
+            del cache[idx]
+
+    def get_latest(self, channel: int, n: int) -> tuple:
+        """Newest n samples; only the blocks they span stay cached."""
+        ch = self.channels.get(channel)
+        if ch is None or ch["count"] == 0:
+            return np.array([]), np.array([])
+        start = max(0, ch["count"] - n)
+        result = self._read(ch, start, ch["count"])
+        self._release_outside(ch, start // self.chunk, (ch["count"] - 1) // self.chunk)
+        return result
+
+    def size_bytes(self) -> int:
+        total = 0
+        for ch in self.channels.values():
+            for entry in ch["chunks"]:
+                if isinstance(entry[0], np.ndarray):
+                    total += entry[0].nbytes + entry[1].nbytes
+                else:
+                    total += len(entry[0]) + len(entry[1])
+            total += sum(ts.nbytes + vals.nbytes for ts, vals in ch["cache"].values())
+        return total
+
+
+class SnapshotHistory(HistoryTier):
+    """Read-only history tier over memory-mapped snapshot arrays."""
+
+    def __init__(self, arrays: dict):
+        super().__init__()
+        for channel, a in arrays.items():
+            ch = self._new_channel(a["val"].dtype)
+            ch.update(ts=a["ts"], vals=a["val"], count=len(a["ts"]),
+                      sum_t=a["sum_t"], sum_min=a["sum_min"], sum_max=a["sum_max"],
+                      sum_count=len(a["sum_t"]))
+            self.channels[channel] = ch
+
+    def append(self, channel: int, timestamps: np.ndarray, values: np.ndarray):
+        pass  # Snapshots are read-only
+
+    def _open_chunk(self, ch: dict):
+        raise TypeError("snapshot history is read-only")
+
+    def _chunk_arrays(self, ch: dict, chunk_idx: int) -> tuple:
+        start = chunk_idx * self.chunk
+        return ch["ts"][start:start + self.chunk], ch["vals"][start:start + self.chunk]
+
+    def _index_of(self, ch: dict, t: float) -> int:
+        return int(np.searchsorted(ch["ts"], t, side='left'))
+
+    def _read(self, ch: dict, start: int, stop: int) -> tuple:
+        return np.array(ch["ts"][start:stop]), ch["vals"][start:stop].astype(np.float64)
+
+    def get_latest(self, channel: int, n: int) -> tuple:
+        ch = self.channels.get(channel)
+        if ch is None:
+            return np.array([]), np.array([])
+        return self._read(ch, max(0, ch["count"] - n), ch["count"])
+
+    def raw_chunk(self, channel: int, chunk_idx: int):
+        ch = self.channels.get(channel)
+        if ch is None or chunk_idx * self.chunk >= ch["count"]:
+            return None
+        return self._chunk_arrays(ch, chunk_idx)  # Read-only mappings: no copy needed
+
+    def oldest_time(self) -> Optional[float]:
+        starts = [ch["ts"][0] for ch in self.channels.values() if ch["count"]]
+        return float(min(starts)) if starts else None
+
+    def newest_time(self) -> Optional[float]:
+        ends = [ch["ts"][-1] for ch in self.channels.values() if ch["count"]]
+        return float(max(ends)) if ends else None
+
+    def size_bytes(self) -> int:
+        return sum(ch["ts"].nbytes + ch["vals"].nbytes for ch in self.channels.values())
+
+
+def save_snapshot(path: str, data: dict, meta: dict):
+    """
+    Write channel data and metadata to a single uncompressed .npz file.
+    data: {channel: (timestamps, values)}. A min/max summary per
+    HISTORY_BUCKET samples is stored alongside so reopening never scans data.
+    """
+    arrays = {"meta": np.array(json.dumps(meta))}
+    for channel, (ts, vals) in data.items():
+        n = len(ts) // HISTORY_BUCKET * HISTORY_BUCKET
+        buckets = vals[:n].reshape(-1, HISTORY_BUCKET)
+        arrays[f"ts_{channel}"] = np.ascontiguousarray(ts, dtype=np.float64)
+        arrays[f"val_{channel}"] = np.ascontiguousarray(vals)
+        arrays[f"sum_t_{channel}"] = np.ascontiguousarray(ts[:n:HISTORY_BUCKET], dtype=np.float64)
+        arrays[f"sum_min_{channel}"] = buckets.min(axis=1).astype(np.float64)
+        arrays[f"sum_max_{channel}"] = buckets.max(axis=1).astype(np.float64)
+    np.savez(path, **arrays)  # ZIP_STORED: members stay memory-mappable
+
+
+def load_snapshot(path: str) -> tuple:
+    """
+    Open a snapshot written by save_snapshot without reading the sample data.
+    Each .npy member of the (uncompressed) zip is memory-mapped in place.
+    Returns (meta dict, {channel: {"ts", "val", "sum_t", "sum_min", "sum_max"}}).
+    """
+    members = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Snapshot member {name} is compressed")
+            # Skip the zip local file header to reach the .npy header
+            f.seek(info.header_offset)
+            local = f.read(30)
+            name_len, extra_len = struct.unpack('<HH', local[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            if len(shape) == 0:
+                members[name] = np.frombuffer(f.read(dtype.itemsize), dtype=dtype).reshape(())
+            elif 0 in shape:
+                members[name] = np.empty(shape, dtype)
+            else:
+                members[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(),
+                                          shape=shape, order='F' if fortran else 'C')
+    meta = json.loads(str(members.pop("meta")))
+    arrays = {}
+    for name, arr in members.items():
+        key, channel = name.rsplit("_", 1)
+        arrays.setdefault(int(channel), {})[key] = arr
+    return meta, arrays
+
+
+class TriggerEngine:
+    """
+    Oscilloscope-style trigger capture.
+
+    Incoming frame blocks are written to a ring of all channels and scanned
+    for trigger points with array operations (edge crossings, or the end of
+    a pulse above the level whose width matches). Each accepted trigger
+    captures `pre` samples before and `post` samples after the trigger point
+    into `capture`; further triggers are ignored until the post window is
+    complete (holdoff).
+
+    Sweep modes:
+        Normal - every trigger replaces the capture
+        Auto   - like Normal, but free-runs when no trigger arrives in time
+        Single - stops after one capture until re-armed
+    """
+
+    def __init__(self):
+        self.channel = 0
+        self.mode = "Rising"  # One of TRIGGER_MODES
+        self.level = 0.0  # Raw (unscaled) trigger level
+        self.width = 10  # Pulse width limit in samples (Pulse modes)
+        self.pre = 100  # Samples before the trigger point
+        self.post = 400  # Samples after the trigger point
+        self.sweep = "Normal"  # One of TRIGGER_SWEEPS
+        self.armed = False
+        self.capture: Optional[np.ndarray] = None  # Captured values [pre + post, channels]
+        self.capture_auto = False  # True if the capture is a free-run (Auto) window
+        self.capture_rate = 0.0  # Estimated sample rate of the capture (Hz)
+        self.capture_count = 0  # Incremented on every new capture
+        self._reset_ring(0)
+
+    def configure(self, **settings):
+        """Update trigger settings and restart acquisition."""
+        for key, value in settings.items():
+            setattr(self, key, value)
+        self.pre = max(0, min(int(self.pre), TRIGGER_MAX_SAMPLES))
+        self.post = max(1, min(int(self.post), TRIGGER_MAX_SAMPLES - self.pre))
+        self._reset_ring(self.channel_count)
+
+    def arm(self):
+        self.armed = True
+        self.last_capture_time = time.time()
+
+    def _reset_ring(self, channel_count: int):
+        self.channel_count = channel_count
+        self.capacity = 2 * (self.pre + self.post) + 4096
+        self.ring = np.zeros((self.capacity, channel_count), dtype=np.float32)
+        self.ring_ts = np.zeros(self.capacity, dtype=np.float64)
+        self.written = 0  # Total samples written (global sample index of next sample)
+        self.holdoff_until = 0  # No trigger accepted before this global index
+        self.pending: Optional[int] = None  # Global index of a trigger awaiting post samples
+        self.last_value = None
+        self.pulse_start = None  # Global index where the current above-level pulse began
+        self.last_capture_time = time.time()
+
+    def process(self, timestamps: np.ndarray, values: np.ndarray):
+        """Scan a block of frames (values[F, C]) for triggers and capture windows."""
+        if not self.armed:
+            return
+        if values.shape[1] != self.channel_count:
+            self._reset_ring(values.shape[1])
+        if self.channel >= self.channel_count:
+            return
+        # Split large blocks so the ring always holds pre-history for pending captures
+        step = self.capacity - (self.pre + self.post)
+        for start in range(0, len(timestamps), step):
+            self._process_block(timestamps[start:start + step], values[start:start + step])
+            if not self.armed:
+                break
+        if self.armed and self.sweep == "Auto" and self.pending is None:
+            timeout = max(TRIGGER_AUTO_TIMEOUT, 2 * (self.pre + self.post) / max(self._rate(), 1.0))
+            if time.time() - self.last_capture_time > timeout and self.written >= self.pre + self.post:
+                self._capture(self.written - self.post, auto=True)
+
+    def _process_block(self, timestamps: np.ndarray, values: np.ndarray):
+        n = len(timestamps)
+        base = self.written
+        idx = (base + np.arange(n)) % self.capacity
+        self.ring[idx] = values
+        self.ring_ts[idx] = timestamps
+        self.written += n
+
+        x = values[:, self.channel].astype(np.float64)
+        prev = np.empty(n)
+        prev[0] = x[0] if self.last_value is None else self.last_value
+        prev[1:] = x[:-1]
+        self.last_value = x[-1]
+
+        rising = np.flatnonzero((prev < self.level) & (x >= self.level))
+        falling = np.flatnonzero((prev >= self.level) & (x < self.level))
+        if self.mode == "Rising":
+            candidates = rising
+        elif self.mode == "Falling":
+            candidates = falling
+        elif self.mode == "Either":
+            candidates = np.union1d(rising, falling)
+        else:
+            # Pulse modes: trigger at the falling edge of a pulse whose width matches
+            starts = rising + base
+            if self.pulse_start is not None:
+                starts = np.concatenate([[self.pulse_start], starts])
+            ends = falling + base
+            k = np.searchsorted(starts, ends, side='right') - 1
+            valid = k >= 0
+            widths = ends[valid] - starts[k[valid]]
+            ok = widths > self.width if self.mode == "Pulse >" else widths < self.width
+            candidates = falling[valid][ok]
+            if x[-1] >= self.level:
+                self.pulse_start = int(starts[-1]) if len(starts) else self.pulse_start
+            else:
+                self.pulse_start = None
+
+        # Complete a capture left pending by the previous block
+        if self.pending is not None and self.pending + self.post <= self.written:
+            self._capture(self.pending)
+            self.pending = None
+        # Accept triggers sequentially with holdoff (few candidates per block)
+        for c in candidates:
+            g = base + int(c)
+            if not self.armed or self.pending is not None:
+                break
+            if g < self.holdoff_until or g < self.pre:
+                continue
+            self.holdoff_until = g + self.post
+            if g + self.post <= self.written:
+                self._capture(g)
+            else:
+                self.pending = g
+
+    def _rate(self) -> float:
+        """Estimated sample rate from the timestamps in the ring."""
+        n = min(self.written, self.capacity)
+        if n < 2:
+            return 0.0
+        newest = self.ring_ts[(self.written - 1) % self.capacity]
+        oldest = self.ring_ts[(self.written - n) % self.capacity]
+        return (n - 1) / (newest - oldest) if newest > oldest else 0.0
+
+    def _capture(self, trigger_idx: int, auto: bool = False):
+        idx = np.arange(trigger_idx - self.pre, trigger_idx + self.post) % self.capacity
+        self.capture = self.ring[idx].copy()
+        self.capture_auto = auto
+        self.capture_rate = self._rate()
+        self.capture_count += 1
+        self.last_capture_time = time.time()
+        if self.sweep == "Single" and not auto:
+            self.armed = False
+
+
+class HistogramEngine:
+    """
+    Incremental value histograms over the full int16 range.
+
+    Each channel keeps 65536 counts. A block only touches the counts
+    between its own min and max (np.bincount over that sub-range), and
+    blocks leaving the `window` are subtracted the same way, so no frame
+    ever rescans the buffer. window = 0 accumulates since the last reset.
+    """
+
+    def __init__(self, window: float = 0.0):
+        self.window = window
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.counts = np.zeros((0, 65536), dtype=np.int64)
+        self.blocks: deque = deque()  # (block end time, int16 values[F, C]) inside the window
+
+    def _add(self, values: np.ndarray, sign: int):
+        channels = values.shape[1]
+        if channels > len(self.counts):
+            self.counts = np.vstack([self.counts, np.zeros((channels - len(self.counts), 65536), dtype=np.int64)])
+        codes = values.astype(np.int32) + 32768
+        lows = codes.min(axis=0)
+        highs = codes.max(axis=0)
+        for c in range(channels):
+            lo = lows[c]
+            self.counts[c, lo:highs[c] + 1] += sign * np.bincount(codes[:, c] - lo, minlength=highs[c] - lo + 1)
+
+    def update(self, timestamps: np.ndarray, values: np.ndarray):
+        """Add a block of int16 frames (values[F, C]) and expire blocks outside the window."""
+        if not self.enabled or len(timestamps) == 0:
+            return
+        self._add(values, 1)
+        if self.window <= 0:
+            return
+        t_end = float(timestamps[-1])
+        self.blocks.append((t_end, values.copy()))
+        while self.blocks and self.blocks[0][0] < t_end - self.window:
+            self._add(self.blocks.popleft()[1], -1)
+
+    def set_window(self, window: float):
+        """Change the window; counts restart so they always match it."""
+        self.window = window
+        self.reset()
+
+    def rebinned(self, channel: int, bins: int) -> Optional[tuple]:
+        """
+        (left edges, counts, bin width) in raw units over the occupied value
+        range, merged into at most `bins` bins; None without data.
+        """
+        if channel >= len(self.counts):
+            return None
+        counts = self.counts[channel]
+        used = np.flatnonzero(counts)
+        if len(used) == 0:
+            return None
+        lo, hi = used[0], used[-1] + 1
+        width = max(1, -(-(hi - lo) // max(bins, 1)))  # Codes per display bin
+        starts = np.arange(lo, hi, width)
+        return starts - 32768, np.add.reduceat(counts[lo:hi], starts - lo), width
+
+    def summary(self, channel: int) -> Optional[dict]:
+        """Count, mean, std and occupied code range (raw units) from the counts."""
+        if channel >= len(self.counts):
+            return None
+        counts = self.counts[channel]
+        n = counts.sum()
+        if n == 0:
+            return None
+        used = np.flatnonzero(counts)
+        codes = used - 32768.0
+        weights = counts[used]
+        mean = (codes * weights).sum() / n
+        std = np.sqrt(((codes - mean) ** 2 * weights).sum() / n)
+        return {"count": int(n), "mean": mean, "std": std, "min": codes[0], "max": codes[-1], "codes": len(used)}
+
+
+def xy_decimate(x: np.ndarray, y: np.ndarray, max_points: int = XY_MAX_POINTS, grid: int = XY_GRID) -> tuple:
+    """
+    Density-based decimation for XY plots: keep the first point of every
+    occupied cell of a grid over the data bounds (coarsening the grid until
+    at most max_points remain). Sparse outliers always keep their cell, so
+    the shape survives; dense regions collapse to one point per cell.
+    """
+    if len(x) <= max_points:
+        return x, y
+    x0, y0 = x.min(), y.min()
+    x_span = (x.max() - x0) or 1.0
+    y_span = (y.max() - y0) or 1.0
+    while True:
+        cx = ((x - x0) * ((grid - 1) / x_span)).astype(np.int64)
+        cy = ((y - y0) * ((grid - 1) / y_span)).astype(np.int64)
+        _, first = np.unique(cx * grid + cy, return_index=True)
+        if len(first) <= max_points or grid <= 16:
+            break
+        grid //= 2
+    first.sort()  # Keep time order (for line mode)
+    return x[first], y[first]
+
+
+class PersistenceRenderer:
+    """
+    Intensity-graded persistence view of the main plot (like an analog scope).
+
+    Samples are accumulated into a fixed hit-count grid with np.add.at
+    instead of being drawn as line vertices, so render cost depends on
+    pixels, not samples. The grid has the texture layout (height, width,
+    rgba): color channels sum the hits weighted by the series color, alpha
+    counts all hits. Hits fade with `decay` seconds and the grid scrolls
+    left with time; tone mapping is three in-place passes over the grid.
+    """
+
+    def __init__(self, width: int = PERSIST_WIDTH, height: int = PERSIST_HEIGHT, decay: float = 1.0):
+        self.width = width
+        self.height = height
+        self.decay = decay
+        self.acc = np.zeros((height, width, 4), dtype=np.float32)
+        self.pixels = np.zeros((height, width, 4), dtype=np.float32)  # RGBA raw texture buffer
+        self.signature = None  # Settings the grid was built for (change = rebuild)
+        self.y_lo, self.y_hi = 0.0, 1.0
+        self.last_end: Optional[float] = None  # View end time of the last frame
+        self.last_t: dict[int, float] = {}  # Newest sample deposited per series
+        self.carry = 0.0  # Fractional column scroll carried to the next frame
+
+    def reset(self, y_lo: float, y_hi: float):
+        self.acc[:] = 0.0
+        self.y_lo, self.y_hi = y_lo, y_hi
+        self.last_t.clear()
+        self.carry = 0.0
+
+    def scroll(self, columns: float):
+        """Shift the grid left by elapsed time (in columns)."""
+        self.carry += columns
+        n = int(self.carry)
+        self.carry -= n
+        if n >= self.width:
+            self.acc[:] = 0.0
+        elif n > 0:
+            self.acc[:, :-n] = self.acc[:, n:]
+            self.acc[:, -n:] = 0.0
+
+    def fade(self, seconds: float):
+        if seconds > 0:
+            self.acc *= np.float32(np.exp(-seconds / max(self.decay, 1e-3)))
+
+    def deposit(self, x: np.ndarray, y: np.ndarray, color: tuple):
+        """Add hits at x in [0, 1) (fraction of the width) and y in plot units."""
+        col = (x * self.width).astype(np.intp)
+        row = ((self.y_hi - y) * (self.height / (self.y_hi - self.y_lo))).astype(np.intp)
+        valid = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+        weight = np.array([*(c / 255.0 for c in color), 1.0], dtype=np.float32)
+        np.add.at(self.acc, (row[valid], col[valid]), weight)
+
+    def compose(self) -> np.ndarray:
+        """Tone-map the hit counts into the RGBA texture buffer (1 - exp(-gain * hits))."""
+        np.multiply(self.acc, -PERSIST_GAIN, out=self.pixels)
+        np.exp(self.pixels, out=self.pixels)
+        np.subtract(1.0, self.pixels, out=self.pixels)
+        return self.pixels
+
+
+class AlarmEngine:
+    """
+    Threshold alarms evaluated once per frame block for all rules at once.
+
+    Each block becomes an (F, R) array of scaled values (one column per
+    rule). Entering and leaving the violation band are marked as +1/-1
+    events, and the hysteresis state is the forward-filled last event
+    (np.maximum.accumulate over event indices), seeded with the state
+    carried from the previous block. The start time of each violation is
+    forward-filled the same way, so the minimum duration check is an array
+    comparison too. Only the resulting alarm/clear edges are handled in Python.
+    """
+
+    def __init__(self):
+        self.configure([])
+
+    def configure(self, rules: list):
+        """Set the rules; all alarm states restart."""
+        self.rules = list(rules)
+        r = len(self.rules)
+        self.violating = np.zeros(r, dtype=bool)  # Hysteresis state
+        self.since = np.full(r, np.nan)  # Start of the current violation
+        self.active = np.zeros(r, dtype=bool)  # Alarm raised (violation longer than min_duration)
+        self.counts = np.zeros(r, dtype=np.int64)  # Alarms raised per rule
+
+    def process(self, timestamps: np.ndarray, values: np.ndarray, configs: list) -> list:
+        """
+        Evaluate a block (values[F, C] raw); returns [(rule index, raised, t, value)]
+        for every alarm edge, in time order.
+        """
+        rules = self.rules
+        if not rules or len(timestamps) == 0:
+            return []
+        frames, channels = values.shape
+        chan = np.array([r.channel for r in rules])
+        usable = np.array([r.enabled and r.channel < channels and r.channel < len(configs) for r in rules])
+        if not usable.any():
+            return []
+        chan = np.where(usable, chan, 0)
+        scale = np.array([configs[c].scale if ok else 1.0 for c, ok in zip(chan, usable)])
+        offset = np.array([configs[c].offset if ok else 0.0 for c, ok in zip(chan, usable)])
+        low = np.array([r.low for r in rules])
+        high = np.array([r.high for r in rules])
+        hyst = np.array([abs(r.hysteresis) for r in rules])
+        check_high = np.array([r.kind in ("Above", "Outside") for r in rules])
+        check_low = np.array([r.kind in ("Below", "Outside") for r in rules])
+
+        x = values[:, chan] * scale + offset  # (F, R)
+        enter = (check_high & (x > high)) | (check_low & (x < low))
+        leave = ~((check_high & (x >= high - hyst)) | (check_low & (x <= low + hyst)))
+        enter &= usable
+        leave |= ~usable
+
+        # Hysteresis state: last event wins, forward-filled along the block
+        rows = np.arange(frames)[:, None]
+        event_row = np.maximum.accumulate(np.where(enter | leave, rows, -1), axis=0)
+        last_enter = np.take_along_axis(enter, np.maximum(event_row, 0), axis=0)
+        violating = np.where(event_row >= 0, last_enter, self.violating)
+
+        # Start time of each violation (forward-filled from its first sample)
+        prev = np.vstack([self.violating[None, :], violating[:-1]])
+        start_row = np.maximum.accumulate(np.where(violating & ~prev, rows, -1), axis=0)
+        since = np.where(start_row >= 0, timestamps[np.maximum(start_row, 0)], self.since)
+        min_duration = np.array([r.min_duration for r in rules])
+        active = violating & (timestamps[:, None] - since >= min_duration)
+
+        # Alarm edges
+        prev_active = np.vstack([self.active[None, :], active[:-1]])
+        edge_rows, edge_rules = np.nonzero(active != prev_active)
+        events = []
+        for row, rule in zip(edge_rows, edge_rules):
+            raised = bool(active[row, rule])
+            if raised:
+                self.counts[rule] += 1
+            events.append((int(rule), raised, float(timestamps[row]), float(x[row, rule])))
+
+        self.violating = violating[-1]
+        self.since = np.where(violating[-1], since[-1], np.nan)
+        self.active = active[-1]
+        return sorted(events, key=lambda e: e[2])
+
+
+class StatsEngine:
+    """
+    Streaming per-channel statistics, updated once per incoming frame block.
+
+    Sliding min/max over `window` seconds are kept in monotonic deques of
+    per-block extremes, so reading them is O(1) per channel regardless of
+    how many samples the window holds (the window edge has block resolution).
+    Mean, variance and RMS accumulate since the last reset with Welford's
+    algorithm, merging each block at once (Chan et al.) across all channels.
+    """
+
+    def __init__(self, window: float = DEFAULT_TIME_WINDOW):
+        self.window = window
+        self.rebuild_needed = False  # Window grew: deques must be refilled from the buffer
+        self.window_changed = 0.0  # Time of the last window change (rebuild is debounced)
+        self.reset()
+
+    def reset(self):
+        """Clear all statistics."""
+        self.n = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.min_dq: list[deque] = []
+        self.max_dq: list[deque] = []
+        self.rate_dq: deque = deque()  # (block end time, frames) for the sample rate
+        self.rate = 0.0
+
+    def _ensure(self, channels: int):
+        grow = channels - len(self.n)
+        if grow > 0:
+            self.n = np.concatenate([self.n, np.zeros(grow)])
+            self.mean = np.concatenate([self.mean, np.zeros(grow)])
+            self.m2 = np.concatenate([self.m2, np.zeros(grow)])
+            self.min_dq += [deque() for _ in range(grow)]
+            self.max_dq += [deque() for _ in range(grow)]
+
+    def _push(self, channel: int, t_end: float, lo: float, hi: float):
+        """Push one block's extremes onto the channel's monotonic deques."""
+        dq = self.min_dq[channel]
+        while dq and dq[-1][1] >= lo:
+            dq.pop()
+        dq.append((t_end, lo))
+        dq = self.max_dq[channel]
+        while dq and dq[-1][1] <= hi:
+            dq.pop()
+        dq.append((t_end, hi))
+
+    def _expire(self, channel: int, start: float):
+        """Drop blocks that ended before start from the channel's deques."""
+        lows, highs = self.min_dq[channel], self.max_dq[channel]
+        while lows and lows[0][0] < start:
+            lows.popleft()
+        while highs and highs[0][0] < start:
+            highs.popleft()
+
+    def update(self, timestamps: np.ndarray, values: np.ndarray):
+        """Merge a block of frames (values[F, C]) into the statistics."""
+        x = values.astype(np.float64)
+        frames, channels = x.shape
+        self._ensure(channels)
+
+        # Welford / Chan merge of the block into the running moments
+        block_mean = x.mean(axis=0)
+        block_m2 = ((x - block_mean) ** 2).sum(axis=0)
+        n_prev = self.n[:channels]
+        total = n_prev + frames
+        delta = block_mean - self.mean[:channels]
+        self.mean[:channels] += delta * frames / total
+        self.m2[:channels] += block_m2 + delta ** 2 * n_prev * frames / total
+        self.n[:channels] = total
+
+        t_end = float(timestamps[-1])
+        lows = x.min(axis=0)
+        highs = x.max(axis=0)
+        start = t_end - self.window
+        for c in range(channels):
+            self._push(c, t_end, lows[c], highs[c])
+            self._expire(c, start)  # Keeps summary() on the window even for channels nobody plots
+
+        self.rate_dq.append((t_end, frames))
+        while len(self.rate_dq) > 2 and t_end - self.rate_dq[0][0] > STATS_RATE_WINDOW:
+            self.rate_dq.popleft()
+        span = t_end - self.rate_dq[0][0]
+        if span > 0:
+            self.rate = sum(f for _, f in list(self.rate_dq)[1:]) / span
+
+    def set_window(self, window: float):
+        """Change the sliding window; growing it requires a rebuild from stored data."""
+        if window > self.window:
+            self.rebuild_needed = True
+            self.window_changed = time.time()
+        self.window = window
+
+    def rebuild(self, buffer: 'DataBuffer', now: float):
+        """
+        Refill the min/max deques from the buffer after the window grew.
+        Beyond the ring the history tier answers from its bucket min/max
+        summary (at most MAX_PLOT_POINTS per channel), so even a 24 h window
+        never decodes raw samples; the window is then folded into
+        STATS_REBUILD_BLOCKS deque entries.
+        """
+        self._ensure(buffer.get_channel_count())
+        for c in range(len(self.min_dq)):
+            self.min_dq[c].clear()
+            self.max_dq[c].clear()
+            ts, vals = buffer.get_range(c, now - self.window, now, MAX_PLOT_POINTS)
+            if len(ts) == 0:
+                continue
+            step = -(-len(ts) // STATS_REBUILD_BLOCKS)
+            starts = np.arange(0, len(ts), step)
+            ends = ts[np.minimum(starts + step, len(ts)) - 1]
+            lows = np.minimum.reduceat(vals, starts)
+            highs = np.maximum.reduceat(vals, starts)
+            for t_end, lo, hi in zip(ends.tolist(), lows.tolist(), highs.tolist()):
+                self._push(c, t_end, lo, hi)
+        self.rebuild_needed = False
+
+    def window_minmax(self, channel: int, now: float) -> Optional[tuple]:
+        """Raw (min, max) of the channel over [now - window, now], or None if unknown."""
+        if channel >= len(self.min_dq) or self.rebuild_needed:
+            return None
+        self._expire(channel, now - self.window)
+        lows, highs = self.min_dq[channel], self.max_dq[channel]
+        if not lows:
+            return None
+        return lows[0][1], highs[0][1]
+
+    def summary(self, channel: int, scale: float = 1.0, offset: float = 0.0) -> Optional[dict]:
+        """Scaled statistics for the stats table."""
+        if channel >= len(self.n) or self.n[channel] == 0:
+            return None
+        n = self.n[channel]
+        mean = self.mean[channel]
+        var = self.m2[channel] / n
+        mean_sq = var + mean * mean
+        lows, highs = self.min_dq[channel], self.max_dq[channel]
+        lo = lows[0][1] * scale + offset if lows else float('nan')
+        hi = highs[0][1] * scale + offset if highs else float('nan')
+        return {
+            "min": min(lo, hi),
+            "max": max(lo, hi),
+            "mean": mean * scale + offset,
+            "std": np.sqrt(var) * abs(scale),
+            # E[(s*x + o)^2] from the raw moments
+            "rms": np.sqrt(max(scale * scale * mean_sq + 2 * scale * offset * mean + offset * offset, 0.0)),
+            "count": int(n),
+        }
+
+
+def parse_channel_list(text: str) -> list:
+    """Parse "0,2,4-7" into [0, 2, 4, 5, 6, 7] (invalid parts are ignored)."""
+    channels = []
+    for part in text.replace(" ", "").split(","):
+        try:
+            if "-" in part:
+                first, last = part.split("-", 1)
+                channels.extend(range(int(first), int(last) + 1))
+            elif part:
+                channels.append(int(part))
+        except ValueError:
+            pass
+    return sorted(set(c for c in channels if c >= 0))
+
+
+class SpectrumWorker:
+    """
+    Background thread computing Welch-averaged power spectra.
+
+    Every update it reads the newest samples of the selected channels from
+    the DataBuffer, cuts them into overlapping Hann-windowed segments and
+    runs a single batched np.fft.rfft over all channels and segments. The
+    result is published under a lock for the GUI thread to pick up, so the
+    FFT work never runs inside the frame loop.
+    """
+
+    def __init__(self, get_buffer: Callable[[], 'DataBuffer']):
+        self.get_buffer = get_buffer  # Current DataBuffer (the app swaps it while a snapshot is open)
+        self.channels: list[int] = []
+        self.nperseg = 1024
+        self.averages = 8  # Segments per estimate (50% overlap)
+        self.update_rate = 10.0  # Spectra per second
+        self.enabled = False
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.result: Optional[dict] = None
+        self.result_id = 0  # Incremented for every new result
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def get_result(self) -> tuple:
+        """Return (result_id, result dict or None)."""
+        with self.lock:
+            return self.result_id, self.result
+
+    def _run(self):
+        while self.running:
+            started = time.time()
+            if self.enabled and self.channels:
+                try:
+                    result = self.compute()
+                except Exception as e:
+                    print(f"Spectrum error: {e}")
+                    result = None
+                if result is not None:
+                    with self.lock:
+                        self.result = result
+                        self.result_id += 1
+            time.sleep(max(0.005, 1.0 / max(self.update_rate, 0.1) - (time.time() - started)))
+
+    def compute(self) -> Optional[dict]:
+        """Welch PSD of the selected channels, batched into one rfft call."""
+        nperseg = self.nperseg
+        step = nperseg // 2
+        wanted = nperseg + step * (max(self.averages, 1) - 1)
+        buffer = self.get_buffer()
+        data = {}
+        for ch in self.channels:
+            ts, vals = buffer.get_latest(ch, wanted)
+            if len(ts) >= nperseg:
+                data[ch] = (ts, vals)
+        if not data:
+            return None
+        # Use a common length so all channels stack into one array
+        length = min(len(ts) for ts, _ in data.values())
+        segments = 1 + (length - nperseg) // step
+        length = nperseg + step * (segments - 1)
+        channels = list(data)
+        x = np.stack([data[ch][1][-length:] for ch in channels])  # (C, N)
+        ts = data[channels[0]][0][-length:]
+        fs = (length - 1) / (ts[-1] - ts[0]) if ts[-1] > ts[0] else 0.0
+        if fs <= 0:
+            return None
+
+        # (C, segments, nperseg) strided view, detrended and windowed
+        seg = np.lib.stride_tricks.sliding_window_view(x, nperseg, axis=-1)[:, ::step]
+        window = np.hanning(nperseg)
+        seg = (seg - seg.mean(axis=-1, keepdims=True)) * window
+        spectrum = np.fft.rfft(seg, axis=-1)
+        psd = (spectrum.real ** 2 + spectrum.imag ** 2).mean(axis=1)
+        psd /= fs * (window * window).sum()
+        psd[:, 1:-1] *= 2.0  # One-sided
+        return {
+            "freqs": np.fft.rfftfreq(nperseg, 1.0 / fs),
+            "psd_db": 10.0 * np.log10(psd + 1e-20),
+            "channels": channels,
+            "fs": fs,
+            "segments": segments,
+        }
+
+
+WATERFALL_COLORMAPS = {
+    "Viridis": [(68, 1, 84), (59, 82, 139), (33, 145, 140), (94, 201, 98), (253, 231, 37)],
+    "Inferno": [(0, 0, 4), (87, 16, 110), (188, 55, 84), (249, 142, 9), (252, 255, 164)],
+    "Gray": [(0, 0, 0), (255, 255, 255)],
+}
+
+
+def make_colormap(name: str) -> np.ndarray:
+    """Build a 256-entry float32 RGB lookup table from colormap anchor colors."""
+    anchors = np.array(WATERFALL_COLORMAPS.get(name, WATERFALL_COLORMAPS["Viridis"]), dtype=np.float32) / 255.0
+    x = np.linspace(0.0, 1.0, len(anchors))
+    xi = np.linspace(0.0, 1.0, 256)
+    return np.stack([np.interp(xi, x, anchors[:, k]) for k in range(3)], axis=1).astype(np.float32)
+
+
+class Waterfall:
+    """
+    Ring-buffered spectrogram image.
+
+    Pixels are a (bins, depth, 3) float32 array used directly as a raw
+    texture; each new spectrum overwrites one column at write_idx, so
+    adding a column never touches the rest of the image. The display
+    draws the two halves of the ring side by side (see ring_segments).
+    """
+
+    def __init__(self, bins: int, depth: int, colormap: str = "Viridis", range_db: float = 80.0):
+        self.bins = bins
+        self.depth = depth
+        self.pixels = np.zeros((bins, depth, 3), dtype=np.float32)
+        self.lut = make_colormap(colormap)
+        self.range_db = max(range_db, 1.0)
+        self.peak: Optional[float] = None  # Top of the color range, follows the signal
+        self.write_idx = 0
+
+    def add_column(self, psd_db: np.ndarray):
+        """Color-map one spectrum (dB) and write it into the next column."""
+        peak = float(psd_db.max())
+        # Jump up immediately, decay slowly so the colors stay stable
+        self.peak = peak if self.peak is None else max(peak, 0.95 * self.peak + 0.05 * peak)
+        low = self.peak - self.range_db
+        idx = ((psd_db - low) * (255.0 / self.range_db)).clip(0, 255).astype(np.intp)
+        self.pixels[:, self.write_idx] = self.lut[idx]
+        self.write_idx = (self.write_idx + 1) % self.depth
+
+    def ring_segments(self) -> list:
+        """
+        Return [(col_start, col_end, age_start, age_end)] for the older and
+        newer part of the ring; ages are in columns before the newest one.
+        """
+        w = self.write_idx
+        return [(w, self.depth, self.depth, w), (0, w, w, 0)]
+
+
+def frames_to_blocks(batch: list) -> list:
+    """
+    Group (timestamp, values) frames into numpy blocks.
+    Consecutive frames with the same channel count are stacked into
+    (timestamps float64[F], values int16[F, C]) tuples.
+    """
+    blocks = []
+    start = 0
+    for i in range(1, len(batch) + 1):
+        if i == len(batch) or len(batch[i][1]) != len(batch[start][1]):
+            run = batch[start:i]
+            timestamps = np.fromiter((f[0] for f in run), dtype=np.float64, count=len(run))
+            values = np.array([f[1] for f in run], dtype=np.int16)
+            blocks.append((timestamps, values))
+            start = i
+    return blocks
+
+
+class TerminalBuffer:
+    """
+    Terminal scrollback: a ring of the newest lines plus an optional spill file.
+
+    Lines are numbered in arrival order from 0 (reset by clear); `first` is
+    the oldest line still available. With spill enabled every line is also
+    appended to a file and its byte offset recorded, so lines that fell out
+    of the ring are read back from disk and scrollback is bounded by disk
+    space rather than RAM. Reading any range costs O(lines read).
+
+    The optional token index maps each lowercase word to the numbers of the
+    lines containing it (built in extend), for whole-word terminal search.
+    All methods take `lock`, so the search thread can read while lines arrive.
+    """
+
+    def __init__(self, capacity: int = TERMINAL_RAM_LINES):
+        self.capacity = capacity
+        self.ring: list[str] = [""] * capacity
+        self.count = 0  # Lines appended since the last clear
+        self.generation = 0  # Bumped by clear() so views know to redraw
+        self.spill_dir: Optional[str] = None
+        self.spill_file = None
+        self.spill_first = 0  # Line number of offsets[0]
+        self.spill_pos = 0  # Bytes written to the spill file
+        self.offsets = np.zeros(0, dtype=np.int64)  # Spill file offset of each spilled line
+        self.spilled = 0  # Valid entries in offsets
+        self.tokens: Optional[dict] = None  # Token -> array('q') of line numbers
+        self.index_first = 0  # First line covered by the token index
+        self.lock = threading.Lock()
+
+    @property
+    def first(self) -> int:
+        ram_first = max(0, self.count - self.capacity)
+        if self.spill_file is not None:
+            return min(ram_first, self.spill_first)
+        return ram_first
+
+    def __len__(self) -> int:
+        return self.count - self.first
+
+    def extend(self, lines: list[str]):
+        """Append lines (main thread)."""
+        with self.lock:
+            self._extend(lines)
+
+    def _extend(self, lines: list[str]):
+        cap = self.capacity
+        n = self.count
+        for line in lines:
+            self.ring[n % cap] = line
+            n += 1
+        if self.spill_file is not None and lines:
+            data = [(line + "\n").encode("utf-8", "replace") for line in lines]
+            need = self.spilled + len(data)
+            if need > len(self.offsets):
+                grown = np.zeros(max(need, 2 * len(self.offsets), 65536), dtype=np.int64)
+                grown[:self.spilled] = self.offsets[:self.spilled]
+                self.offsets = grown
+            sizes = np.fromiter((len(d) for d in data), dtype=np.int64, count=len(data))
+            ends = np.cumsum(sizes)
+            self.offsets[self.spilled:need] = self.spill_pos + ends - sizes
+            self.spill_file.write(b"".join(data))
+            self.spill_pos += int(ends[-1])
+            self.spilled = need
+        if self.tokens is not None:
+            tokens, find = self.tokens, self.token_re.findall
+            for k, line in enumerate(lines, self.count):
+                for token in set(find(line.lower())):
+                    postings = tokens.get(token)
+                    if postings is None:
+                        postings = tokens[token] = array('q')
+                    postings.append(k)
+        self.count = n
+
+    def set_index(self, enabled: bool):
+        """Start or drop the token index. Indexing covers lines from now on."""
+        with self.lock:
+            if enabled and self.tokens is None:
+                self.token_re = re.compile(r"\w+")
+                self.tokens = {}
+                self.index_first = self.count
+            elif not enabled:
+                self.tokens = None
+
+    def lines(self, start: int, stop: int) -> list[str]:
+        """Lines [start, stop), clipped to what is available."""
+        with self.lock:
+            return self._lines(start, stop)
+
+    def get_lines(self, numbers) -> list[str]:
+        """Lines with the given (available, ascending) numbers."""
+        with self.lock:
+            return [self._lines(n, n + 1)[0] for n in numbers]
+
+    def _lines(self, start: int, stop: int) -> list[str]:
+        start = max(start, self.first)
+        stop = min(stop, self.count)
+        if start >= stop:
+            return []
+        ram_first = max(0, self.count - self.capacity)
+        out = []
+        if start < ram_first:
+            out = self._read_spill(start, min(stop, ram_first))
+            start = ram_first
+        cap = self.capacity
+        out.extend(self.ring[n % cap] for n in range(start, stop))
+        return out
+
+    def _read_spill(self, start: int, stop: int) -> list[str]:
+        i, j = start - self.spill_first, stop - self.spill_first
+        offs = self.offsets[i:j + 1] if j < self.spilled else np.append(self.offsets[i:j], self.spill_pos)
+        base = int(offs[0])
+        f = self.spill_file
+        f.seek(base)
+        data = f.read(int(offs[-1]) - base)
+        f.seek(0, os.SEEK_END)
+        rel = (offs - base).tolist()
+        return [data[rel[k]:rel[k + 1] - 1].decode("utf-8", "replace") for k in range(len(rel) - 1)]
+
+    def set_spill(self, enabled: bool, directory: str = ""):
+        """Start or stop spilling to disk. Spilling covers lines from now on."""
+        with self.lock:
+            self._set_spill(enabled, directory)
+
+    def _set_spill(self, enabled: bool, directory: str):
+        if enabled and self.spill_file is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="dragoonplot_terminal_", dir=directory or None)
+            self.spill_file = open(os.path.join(self.spill_dir, "terminal.txt"), "w+b")
+            self.spill_first = self.count
+            self.spill_pos = 0
+            self.spilled = 0
+        elif not enabled and self.spill_file is not None:
+            self._close()
+
+    def clear(self):
+        """Drop all lines (the spill file, if any, is truncated)."""
+        with self.lock:
+            self._clear()
+
+    def _clear(self):
+        self.ring = [""] * self.capacity
+        self.count = 0
+        self.generation += 1
+        if self.spill_file is not None:
+            self.spill_file.seek(0)
+            self.spill_file.truncate(0)
+            self.spill_first = 0
+            self.spill_pos = 0
+            self.spilled = 0
+        if self.tokens is not None:
+            self.tokens = {}
+            self.index_first = 0
+
+    def close(self):
+        """Stop spilling and delete the spill file."""
+        with self.lock:
+            self._close()
+
+    def _close(self):
+        if self.spill_file is None:
+            return
+        try:
+            self.spill_file.close()
+        except Exception:
+            pass
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+        self.spill_file = None
+        self.spill_dir = None
+        self.offsets = np.zeros(0, dtype=np.int64)
+        self.spilled = 0
+
+
+class TerminalSearch:
+    """
+    Background search over the terminal scrollback.
+
+    The query is compiled once and run over the TerminalBuffer in chunks of
+    TERMINAL_SEARCH_CHUNK lines: each chunk is copied out under the buffer
+    lock, joined and scanned with a single regex pass, so ingest only waits
+    for the copy. Matches never span lines: one that crosses a line break is
+    dropped and its first line checked on its own, and the scan resumes at
+    the next line. Once the history is searched the worker keeps matching new
+    lines as they arrive. Whole-word plain queries use the buffer's token
+    index (when enabled) and only check the candidate lines.
+    """
+
+    def __init__(self, terminal: TerminalBuffer):
+        self.terminal = terminal
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.request: Optional[tuple] = None  # (compiled pattern, query tokens or None)
+        self.request_id = 0
+        self.error = ""
+        self._reset(None)
+
+    def _reset(self, generation):
+        self.matches = np.zeros(0, dtype=np.int64)  # Sorted line numbers
+        self.match_count = 0
+        self.scanned = 0  # Lines before this have been searched
+        self.generation = generation
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    @property
+    def active(self) -> bool:
+        return self.request is not None
+
+    def set_query(self, text: str, regex: bool = False, word: bool = False):
+        """Start a new search; an empty text cancels it. Case-insensitive unless text has capitals."""
+        request, error = None, ""
+        if text:
+            body = text if regex else re.escape(text)
+            if word:
+                body = rf"\b(?:{body})\b"
+            flags = re.MULTILINE | (0 if any(c.isupper() for c in text) else re.IGNORECASE)
+            try:
+                pattern = re.compile(body, flags)
+                tokens = re.findall(r"\w+", text.lower()) if word and not regex else None
+                request = (pattern, tokens)
+            except re.error as e:
+                error = str(e)
+        with self.lock:
+            self.request = request
+            self.request_id += 1
+            self.error = error
+            self._reset(None)
+        self.wake.set()
+
+    def get_matches(self) -> np.ndarray:
+        """Matching line numbers found so far (sorted; may include lines no longer in the buffer)."""
+        with self.lock:
+            return self.matches[:self.match_count]
+
+    def progress(self) -> float:
+        """Fraction of the current scrollback searched."""
+        term = self.terminal
+        total = term.count - term.first
+        return 1.0 if total <= 0 else min(1.0, max(0, self.scanned - term.first) / total)
+
+    def _run(self):
+        while self.running:
+            self.wake.wait(0.1)
+            self.wake.clear()
+            with self.lock:
+                request, request_id = self.request, self.request_id
+            if request is None:
+                continue
+            try:
+                self._search(request, request_id)
+            except Exception as e:
+                print(f"Terminal search error: {e}")
+
+    def _search(self, request: tuple, request_id: int):
+        """Search all lines not searched yet, a chunk at a time."""
+        pattern, tokens = request
+        term = self.terminal
+        everything = pattern.search("") is not None  # e.g. "a*": every line matches
+        while self.running and request_id == self.request_id:
+            with term.lock:
+                generation, first, count = term.generation, term.first, term.count
+                index = term.tokens is not None and tokens and self.scanned >= term.index_first
+            with self.lock:
+                if request_id != self.request_id:
+                    return
+                if generation != self.generation:
+                    self._reset(generation)  # Cleared: start over
+                start = max(self.scanned, first)
+            if start >= count:
+                return
+            if index:
+                stop = count
+                hits = self._search_index(pattern, tokens, start, stop)
+            elif everything:
+                stop = min(count, start + TERMINAL_SEARCH_CHUNK)
+                hits = np.arange(start, stop, dtype=np.int64)
+            else:
+                stop = min(count, start + TERMINAL_SEARCH_CHUNK)
+                hits = self._search_chunk(pattern, start, stop)
+            with self.lock:
+                if request_id != self.request_id or generation != self.generation:
+                    return
+                need = self.match_count + len(hits)
+                if need > len(self.matches):
+                    grown = np.zeros(max(need, 2 * len(self.matches), 4096), dtype=np.int64)
+                    grown[:self.match_count] = self.matches[:self.match_count]
+                    self.matches = grown
+                self.matches[self.match_count:need] = hits
+                self.match_count = need
+                self.scanned = stop
+
+    def _search_chunk(self, pattern, start: int, stop: int) -> np.ndarray:
+        lines = self.terminal.lines(start, stop)
+        start = stop - len(lines)  # Oldest lines may have left the ring meanwhile
+        if not lines:
+            return np.zeros(0, dtype=np.int64)
+        lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines)) + 1
+        line_starts = np.cumsum(lengths) - lengths
+        text = "\n".join(lines)
+        positions = []
+        pos = 0
+        while True:
+            m = pattern.search(text, pos)
+            if m is None:
+                break
+            end = text.find("\n", m.start(), m.end())
+            if end < 0:
+                positions.append(m.start())
+                end = text.find("\n", m.start())
+            else:
+                # Crossed a line break: the line it started on may still match by itself
+                line_start = text.rfind("\n", 0, m.start()) + 1
+                if pattern.search(text[line_start:end]):
+                    positions.append(line_start)
+            if end < 0:
+                break
+            pos = end + 1  # One hit per line is enough
+        rows = np.searchsorted(line_starts, positions, side="right") - 1
+        return rows.astype(np.int64) + start
+
+    def _search_index(self, pattern, tokens: list, start: int, stop: int) -> np.ndarray:
+        """Intersect token postings, then confirm the candidates with the pattern."""
+        term = self.terminal
+        candidates = None
+        with term.lock:
+            for token in tokens:
+                postings = np.array(term.tokens.get(token, ()), dtype=np.int64)
+                candidates = postings if candidates is None else np.intersect1d(candidates, postings)
+        candidates = candidates[(candidates >= start) & (candidates < stop)]
+        lines = term.get_lines(candidates)
+        return np.array([n for n, line in zip(candidates.tolist(), lines) if pattern.search(line)],
+                        dtype=np.int64)
+
+
+class StreamClient:
+    """One connected stream consumer with its own bounded send queue."""
+
+    def __init__(self, sock, address: str, queue_size: int):
+        self.sock = sock
+        self.address = address
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.websocket = False
+        self.dropped = 0
+        self.sent = 0
+        self.thread: Optional[threading.Thread] = None
+
+    def push(self, block: bytes):
+        """Queue a block without blocking. Drops the oldest block when full."""
+        while True:
+            try:
+                self.queue.put_nowait(block)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class StreamServer:
+    """
+    Local fan-out server that republishes decoded frames to many consumers.
+
+    Listens on TCP ("host:port") or a Unix socket ("unix:path"). TCP clients that
+    open with an HTTP upgrade request are served as WebSocket binary messages.
+    Every client has a bounded queue and a sender thread, so a slow consumer
+    only loses its own oldest blocks and never stalls serial ingest.
+
+    Block format (little-endian):
+        Data:   [0xAA] [channel_count u8] [frame_count u32] [float64 x F] [int16 x F*C]
+        Labels: [0xAB] [length u32] [UTF-8 JSON {"channel_idx": "label"}]
+    """
+
+    def __init__(self, queue_size: int = STREAM_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.listener = None  # Listening socket while running
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+        self.address = ""
+        self.unix_path = ""
+        self.error = ""  # Why the last start() failed
+        self.clients: list[StreamClient] = []
+        self.clients_lock = threading.Lock()
+        self.labels: dict[int, str] = {}
+
+    def start(self, address: str) -> bool:
+        """
+        Start listening on "host:port" (TCP) or "unix:path" (Unix socket).
+        Anything else is rejected; on failure self.error says why.
+        """
+        self.stop()
+        self.error = ""
+        try:
+            if address.startswith("unix:"):
+                if not hasattr(socket, "AF_UNIX"):
+                    raise ValueError("Unix sockets are not supported on this platform")
+                path = address[len("unix:"):]
+                if not path:
+                    raise ValueError("missing socket path after unix:")
+                try:
+                    mode = os.stat(path).st_mode
+                except FileNotFoundError:
+                    mode = None
+                if mode is not None:
+                    if not stat.S_ISSOCK(mode):
+                        raise ValueError(f"{path} exists and is not a socket")
+                    os.unlink(path)  # Stale socket of an earlier run
+                listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                listener.bind(path)
+                self.unix_path = path
+            else:
+                host, sep, port = address.rpartition(":")
+                if not sep or not port.isdigit():
+                    raise ValueError(f"invalid address {address!r} (expected host:port or unix:path)")
+                listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                listener.bind((host or "127.0.0.1", int(port)))
+            listener.listen(16)
+            listener.settimeout(0.5)
+        except Exception as e:
+            self.error = str(e)
+            print(f"Stream error: {e}")
+            return False
+        self.listener = listener
+        self.address = address
+        self.running = True
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.thread.start()
+        print(f"Stream server listening on {address}")
+        return True
+
+    def stop(self):
+        """Stop listening and disconnect all clients."""
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+        if self.listener:
+            try:
+                self.listener.close()
+            except Exception:
+                pass
+            self.listener = None
+        if self.unix_path:
+            try:
+                os.unlink(self.unix_path)
+            except OSError:
+                pass
+            self.unix_path = ""
+        with self.clients_lock:
+            clients = self.clients
+            self.clients = []
+        for client in clients:
+            self._close_client(client)
+
+    def is_running(self) -> bool:
+        return self.running
+
+    def get_clients(self) -> list:
+        with self.clients_lock:
+            return list(self.clients)
+
+    def publish_frames(self, timestamps: np.ndarray, values: np.ndarray):
+        """Publish a block of frames: timestamps float64[F], values int16[F, C]."""
+        if not self.clients:
+            return
+        frame_count, channel_count = values.shape
+        block = (struct.pack('<BBI', START_DATA, channel_count, frame_count)
+                 + timestamps.astype('<f8', copy=False).tobytes()
+                 + values.astype('<i2', copy=False).tobytes())
+        self._broadcast(block)
+
+    def publish_labels(self, labels: dict):
+        """Publish channel labels (merged with previously seen labels)."""
+        self.labels.update(labels)
+        if self.clients:
+            self._broadcast(self._label_block(labels))
+
+    def _label_block(self, labels: dict) -> bytes:
+        payload = json.dumps({str(k): v for k, v in labels.items()}).encode('utf-8')
+        return struct.pack('<BI', START_LABEL, len(payload)) + payload
+
+    def _broadcast(self, block: bytes):
+        with self.clients_lock:
+            for client in self.clients:
+                client.push(block)
+
+    def _accept_loop(self):
+        """Background thread accepting new stream clients."""
+        while self.running:
+            try:
+                sock, addr = self.listener.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            name = f"{addr[0]}:{addr[1]}" if isinstance(addr, tuple) else (addr or "unix")
+            client = StreamClient(sock, name, self.queue_size)
+            if self.labels:
+                client.push(self._label_block(self.labels))
+            client.thread = threading.Thread(target=self._client_loop, args=(client,), daemon=True)
+            with self.clients_lock:
+                self.clients.append(client)
+            client.thread.start()
+
+    def _client_loop(self, client: StreamClient):
+        """Per-client sender thread: drains the client's queue onto its socket."""
+        try:
+            if client.sock.family != getattr(socket, "AF_UNIX", None):
+                client.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                client.websocket = self._try_websocket_handshake(client.sock)
+            client.sock.settimeout(5.0)
+            while self.running:
+                try:
+                    block = client.queue.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if client.websocket:
+                    block = self._websocket_frame(block)
+                client.sock.sendall(block)
+                client.sent += 1
+        except Exception:
+            pass
+        with self.clients_lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        self._close_client(client)
+
+    def _try_websocket_handshake(self, sock) -> bool:
+        """Upgrade the connection to WebSocket if the client starts with an HTTP GET."""
+        sock.settimeout(0.2)
+        try:
+            head = sock.recv(4, socket.MSG_PEEK)
+        except socket.timeout:
+            return False  # Raw clients don't send anything first
+        if head != b"GET ":
+            return False
+        request = b""
+        sock.settimeout(2.0)
+        while b"\r\n\r\n" not in request and len(request) < 8192:
+            chunk = sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("WebSocket handshake aborted")
+            request += chunk
+        key = ""
+        for line in request.decode('latin-1').split("\r\n"):
+            if line.lower().startswith("sec-websocket-key:"):
+                key = line.split(":", 1)[1].strip()
+        if not key:
+            raise ConnectionError("Not a WebSocket request")
+        accept = base64.b64encode(hashlib.sha1(
+            (key + "258EAFA5-E914-47DA-95CA-C5AB0DC85B11").encode('ascii')).digest()).decode('ascii')
+        sock.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode('ascii'))
+        return True
+
+    @staticmethod
+    def _websocket_frame(payload: bytes) -> bytes:
+        """Wrap payload in a single unmasked binary WebSocket frame."""
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('!BB', 0x82, length)
+        elif length < 65536:
+            header = struct.pack('!BBH', 0x82, 126, length)
+        else:
+            header = struct.pack('!BBQ', 0x82, 127, length)
+        return header + payload
+
+    @staticmethod
+    def _close_client(client: StreamClient):
+        try:
+            client.sock.close()
+        except Exception:
+            pass
+
+
+class DragoonPlotApp:
+    """Main application class."""
+
+    def __init__(self):
+        self.config = self._load_config()
+        self.data_buffer = DataBuffer()
+        self.serial_manager = SerialManager(self._on_labels, self._on_text_line, self._on_tx_error)
+        self.port_monitor = PortMonitor()
+        self.serial_manager.monitor = self.port_monitor
+        self.serial_manager.auto_reconnect = self.config.auto_reconnect
+        self.ports_generation = -1  # Port list generation shown in the port combo
+        self.connection_state = ("disconnected", "")  # (state, port) last shown
+        self.gaps: list = []  # (lost, back) data times of reconnects, marked on the Graph tab
+        self.macros: list[Macro] = list(self.config.macros)
+        self.macro_runner = MacroRunner(self.serial_manager, self._on_macro_message)
+        self.macro_index = 0  # Macro shown in the Macros tab
+        self.connected_port = ""  # Key for the discovery cache
+        self.dfu_queue = DfuQueue(self._append_dfu_output)
+        self.dfu_devices: list = []  # From the last Scan
+        self.dfu_devices_changed = False
+        self.dfu_shown: dict = {}  # Table row -> job state shown
+        self.dfu_batch_active = False
+        self.firmware_cache: dict = {}  # (path, size, mtime) -> firmware_image_info
+        self.firmware_text = ""  # Image summary for the DFU tab (set by the hashing thread)
+        self.device_fw_hash = ""  # Last @fwhash reply
+        self.device_fw_event = threading.Event()
+        self.pong_time = 0.0  # perf_counter() when the last @pong line arrived
+        self.pong_event = threading.Event()
+        self.latency_text = ""  # Connection section readout (tuning notes or measured round trip)
+        self.macro_status = ""
+        self.stream_server = StreamServer()
+        self.stream_status_time = 0.0  # Last time the Stream tab status was refreshed
+        self.trigger = TriggerEngine()
+        self.stats = StatsEngine(self.config.time_window)
+        self.stats_table_time = 0.0  # Last time the Stats tab was refreshed
+        self.stats_rows = 0  # Channel rows created in the Stats table
+        self.spectrum = SpectrumWorker(lambda: self.data_buffer)
+        self.spectrum_result_id = 0  # Last spectrum result shown
+        self.waterfall: Optional[Waterfall] = None
+        self.histogram = HistogramEngine()
+        self.persistence: Optional[PersistenceRenderer] = None  # Set while persistence mode is on
+        self.view_range = (0.0, 0.0)  # (start, end) time of the Graph view, shared with the XY tab
+        self.xy_time = 0.0  # Last time the XY tab was refreshed
+        self.alarm_rules: list[AlarmRule] = list(self.config.alarms)
+        self.alarms = AlarmEngine()
+        self.alarms.configure(self.alarm_rules)
+        self.alarms_changed = True  # Alarm states changed: refresh indicators
+        self.xy_channel_names: list[str] = []
+        self.histogram_time = 0.0  # Last time the Histogram tab was refreshed
+        self.histogram_channel_names: list[str] = []
+        self.scope_capture_count = 0  # Last capture shown in the Scope tab
+        self.scope_channel_names: list[str] = []
+        self.scope_level = 0.0  # Trigger level in scaled units (for the level marker)
+        self.channel_configs: list[ChannelConfig] = list(self.config.channels)
+        self.derived_configs: list[ChannelConfig] = list(self.config.derived_channels)
+        self.derived_code: list = [self._compile_derived(c) for c in self.derived_configs]
+        self.filters: dict[int, StreamFilter] = {}  # Per-channel filter state (designed once fs is known)
+        self.filter_channel = 0  # Channel shown in the filter window
+        self.command_buttons: list[CommandButton] = list(self.config.buttons)
+        self.time_window = self.config.time_window
+        self.view_offset = 0.0  # Seconds the view is scrolled back from live (history pan)
+        self.view_offset_max = 0.0
+        self.pending_labels: dict[int, str] = {}
+        self.labels_updated = False
+        self.channel_rows: dict[int, tuple] = {}  # Buffer index -> last state shown in its Channels row
+        self.ui_scale = 1.0  # Will be set properly in _setup_gui
+        self.help_parsing = False  # Flag to indicate we're parsing help output
+        self.parsed_commands: list[CommandButton] = []  # Commands parsed from help
+        self.commands_updated = False  # Flag to rebuild command buttons
+        self.terminal_queue: list[str] = []  # Queue for terminal output (thread-safe)
+        self.terminal = TerminalBuffer()  # Scrollback, drained from terminal_queue on the main thread
+        if self.config.terminal_spill:
+            self.terminal.set_spill(True, self.config.history_dir)
+        if self.config.terminal_index:
+            self.terminal.set_index(True)
+        self.terminal_search = TerminalSearch(self.terminal)
+        self.terminal_top = 0  # First line shown when not following the tail
+        self.terminal_match = -1  # Line of the current search match (-1 = none)
+        self.terminal_view_key = None  # What the terminal view currently shows
+        self.terminal_status = ""
+        self.terminal_lock = threading.Lock()
+        self.dfu_output_queue: list[str] = []  # Queue for DFU output (thread-safe)
+        self.plot_paused = False  # When True, discard incoming data and freeze plot
+        self.snapshot_path = None  # Path of the snapshot being browsed (None = live data)
+        self.live_state = None  # (data_buffer, channel_configs, derived_configs, paused_time) saved while browsing
+        self.logging = False  # When True, log data to CSV file
+        self.log_file = None  # File handle for CSV logging
+        self.log_start_time = 0  # Time when logging started
+        self._setup_gui()
+
+    def _load_config(self) -> AppConfig:
+        if CONFIG_FILE.exists():
+            try:
+                with open(CONFIG_FILE, 'r') as f:
+                    config = AppConfig.from_dict(json.load(f))
+                    # Use default buttons if none saved
+                    if not config.buttons:
+                        config.buttons = [CommandButton(b.label, b.data, b.mode) for b in DEFAULT_COMMAND_BUTTONS]
+                    return config
+            except Exception as e:
+                print(f"Error loading config: {e}")
+        # Return default config with default command buttons
+        config = AppConfig()
+        config.buttons = [CommandButton(b.label, b.data, b.mode) for b in DEFAULT_COMMAND_BUTTONS]
+        return config
+
+    def _save_config(self):
+        self.config.last_port = self._get_selected_port()
+        self.config.last_baud = self._get_selected_baud() or self.config.last_baud  # Keep the old one on a typo
+        self.config.channels = list(self.channel_configs)
+        self.config.derived_channels = list(self.derived_configs)
+        self.config.alarms = list(self.alarm_rules)
+        self.config.macros = list(self.macros)
+        self.config.buttons = list(self.command_buttons)
+        self.config.time_window = self.time_window
+        self.config.stream_enabled = self.stream_server.is_running()
+        self.config.terminal_spill = self.terminal.spill_file is not None
+        self.config.terminal_index = self.terminal.tokens is not None
+        self.config.auto_reconnect = self.serial_manager.auto_reconnect
+        if dpg.does_item_exist("persist_check"):
+            self.config.persistence = dpg.get_value("persist_check")
+            self.config.persistence_decay = dpg.get_value("persist_decay")
+        if dpg.does_item_exist("spec_channels"):
+            self.config.spectrum = {
+                key: dpg.get_value(f"spec_{key}") for key in (
+                    "channels", "nperseg", "averages", "run",
+                    "waterfall", "wf_channel", "wf_depth", "wf_colormap", "wf_range",
+                )
+            }
+        if dpg.does_item_exist("xy_x"):
+            self.config.xy = {key: dpg.get_value(f"xy_{key}") for key in ("x", "y", "lines", "equal")}
+        if dpg.does_item_exist("hist_run"):
+            self.config.histogram = {key: dpg.get_value(f"hist_{key}") for key in ("run", "window", "bins")}
+        if dpg.does_item_exist("trig_mode"):
+            self.config.trigger = {
+                "channel": self.trigger.channel,
+                **{key: dpg.get_value(f"trig_{key}") for key in ("mode", "level", "width", "pre", "post", "sweep")},
+            }
+        if dpg.does_item_exist("stream_address"):
+            self.config.stream_address = dpg.get_value("stream_address")
+        if dpg.does_item_exist("dfu_parallel"):
+            self.config.dfu_parallel = max(1, dpg.get_value("dfu_parallel"))
+            self.config.dfu_skip_identical = dpg.get_value("dfu_skip_identical")
+        try:
+            with open(CONFIG_FILE, 'w') as f:
                 json.dump(self.config.to_dict(), f, indent=2)
         except Exception as e:
             print(f"Error saving config: {e}")
@@ -659,39 +3825,198 @@ class DragoonPlotApp:
         if not batch:
             return
 
+        # Stack frames into (timestamps, int16 values[frames, channels]) blocks
+        blocks = frames_to_blocks(batch)
+
+        # Republish to external consumers (independent of plot pause)
+        if self.stream_server.is_running():
+            for timestamps, values in blocks:
+                self.stream_server.publish_frames(timestamps, values)
+
+        # Alarms keep watching while the plot is paused (unattended runs)
+        if self.alarms.rules:
+            for timestamps, values in blocks:
+                events = self.alarms.process(timestamps, values, self.channel_configs)
+                if events:
+                    self._on_alarm_events(events)
+
         # When paused, discard incoming data
         if self.plot_paused:
             return
 
         if not hasattr(self, '_data_frame_count'):
             self._data_frame_count = 0
+        if self._data_frame_count == 0:
+            values = batch[0][1]
+            print(f"First data frame: {len(values)} channels, values[0:5]={values[0:5]}")
+        self._data_frame_count += len(batch)
+
+        for timestamps, values in blocks:
+            # Ensure channel configs exist
+            for i in range(len(self.channel_configs), values.shape[1]):
+                color = DEFAULT_COLORS[i % len(DEFAULT_COLORS)]
+                name = self.pending_labels.get(i, f"Ch{i}")
+                self.channel_configs.append(ChannelConfig(
+                    name=name,
+                    color=color,
+                    visible=True,
+                ))
+            # Vectorized write of the whole block (single lock acquisition)
+            self.data_buffer.add_frames(timestamps, values)
+            if self.derived_configs:
+                self._evaluate_derived(timestamps, values)
+            self._apply_filters(timestamps, values)
+            self.stats.update(timestamps, values)
+            self.histogram.update(timestamps, values)
+            if self.trigger.armed:
+                self.trigger.process(timestamps, values)
+
+    def _compile_derived(self, cfg: ChannelConfig):
+        """Compile a derived channel expression, or None if it is invalid."""
+        try:
+            return compile_expression(cfg.expression)
+        except ValueError as e:
+            print(f"Invalid expression '{cfg.expression}' for {cfg.name}: {e}")
+            return None
+
+    def _evaluate_derived(self, timestamps: np.ndarray, values: np.ndarray):
+        """Evaluate all derived channels over a block and store them at MAX_CHANNELS + k."""
+        namespace = dict(DERIVED_FUNCTIONS)
+        for k, compiled in enumerate(self.derived_code):
+            if compiled is None:
+                continue
+            code, channels = compiled
+            if channels and channels[-1] >= values.shape[1]:
+                continue  # Source channel not present (yet)
+            for ch in channels:
+                if f"ch{ch}" not in namespace:
+                    namespace[f"ch{ch}"] = values[:, ch].astype(np.float64)
+            try:
+                with np.errstate(all="ignore"):
+                    result = eval(code, {"__builtins__": {}}, namespace)
+                result = np.broadcast_to(np.asarray(result, dtype=np.float64), timestamps.shape)
+            except Exception as e:
+                print(f"Error evaluating '{self.derived_configs[k].expression}': {e}")
+                self.derived_code[k] = None
+                continue
+            self.data_buffer.add_samples(MAX_CHANNELS + k, timestamps, result)
+
+    def _plot_channels(self) -> list:
+        """(buffer index, ChannelConfig) of every device and derived channel."""
+        return list(enumerate(self.channel_configs)) + \
+            [(MAX_CHANNELS + k, cfg) for k, cfg in enumerate(self.derived_configs)]
+
+    def _plot_series(self) -> list:
+        """
+        (buffer index, ChannelConfig, label, color) of every plotted series.
+        A filtered channel shows its filter output instead of (Replace) or
+        next to (Derived, lighter color) the raw data.
+        """
+        series = []
+        for i, cfg in self._plot_channels():
+            label = cfg.name or f"Ch{i}"
+            flt = cfg.filter if i < MAX_CHANNELS else None
+            if flt is None or flt.kind == "Off":
+                series.append((i, cfg, label, cfg.color))
+            elif flt.output == "Replace":
+                series.append((FILTERED_BASE + i, cfg, f"{label} ({flt.kind})", cfg.color))
+            else:
+                series.append((i, cfg, label, cfg.color))
+                lighter = tuple(min(255, c + 90) for c in cfg.color)
+                series.append((FILTERED_BASE + i, cfg, f"{label} ({flt.kind})", lighter))
+        return series
+
+    def _apply_filters(self, timestamps: np.ndarray, values: np.ndarray):
+        """Run the per-channel filters over a block; outputs go to FILTERED_BASE + channel."""
+        fs = self.stats.rate
+        if fs <= 0:
+            return  # Filters are designed once the sample rate is known
+        for ch, cfg in enumerate(self.channel_configs[:values.shape[1]]):
+            if cfg.filter is None or cfg.filter.kind == "Off":
+                continue
+            flt = self.filters.get(ch)
+            if flt is None or abs(flt.fs - fs) > 0.1 * flt.fs:
+                flt = self.filters[ch] = StreamFilter(cfg.filter, fs)
+            ts, y = flt.process(timestamps, values[:, ch])
+            if len(ts):
+                self.data_buffer.add_samples(FILTERED_BASE + ch, ts, y)
+
+    def _open_filter_window(self, sender, app_data, user_data):
+        """Show the filter settings of one channel."""
+        self.filter_channel = user_data
+        cfg = self.channel_configs[user_data]
+        flt = cfg.filter or FilterConfig()
+        dpg.configure_item("filter_window", label=f"Filter: {cfg.name or f'Ch{user_data}'}", show=True)
+        for key in ("kind", "cutoff", "q", "length", "decimate", "output"):
+            dpg.set_value(f"filter_{key}", getattr(flt, key))
+
+    def _on_filter_setting(self, sender=None, app_data=None):
+        """Apply the filter window settings; the filter restarts with fresh state."""
+        ch = self.filter_channel
+        if ch >= len(self.channel_configs):
+            return
+        self.channel_configs[ch].filter = FilterConfig(
+            kind=dpg.get_value("filter_kind"),
+            cutoff=dpg.get_value("filter_cutoff"),
+            q=dpg.get_value("filter_q"),
+            length=dpg.get_value("filter_length"),
+            decimate=dpg.get_value("filter_decimate"),
+            output=dpg.get_value("filter_output"),
+        )
+        self.filters.pop(ch, None)
+        self.data_buffer.remove_channel(FILTERED_BASE + ch)
+        for tag in (f"series_{ch}", f"series_{FILTERED_BASE + ch}"):
+            if dpg.does_item_exist(tag):
+                dpg.delete_item(tag)
+
+    def _channel_config(self, idx: int) -> Optional[ChannelConfig]:
+        """ChannelConfig for a buffer index (device or derived channel)."""
+        if 0 <= idx < len(self.channel_configs):
+            return self.channel_configs[idx]
+        if 0 <= idx - MAX_CHANNELS < len(self.derived_configs):
+            return self.derived_configs[idx - MAX_CHANNELS]
+        return None
 
-        # Convert batch to samples: [(channel, timestamp, value), ...]
-        samples = []
-        for timestamp, values in batch:
-            self._data_frame_count += 1
-            if self._data_frame_count == 1:
-                print(f"First data frame: {len(values)} channels, values[0:5]={values[0:5]}")
-
-            for i, val in enumerate(values):
-                samples.append((i, timestamp, val))
-                # Ensure channel config exists
-                if i >= len(self.channel_configs):
-                    color = DEFAULT_COLORS[i % len(DEFAULT_COLORS)]
-                    name = self.pending_labels.get(i, f"Ch{i}")
-                    self.channel_configs.append(ChannelConfig(
-                        name=name,
-                        color=color,
-                        visible=True,
-                    ))
-
-        # Add all samples to buffer in one batch (single lock acquisition)
-        if samples:
-            self.data_buffer.add_batch(samples)
+    def _add_derived_channel(self):
+        """Add a derived channel; its expression is edited in the Channels panel."""
+        k = len(self.derived_configs)
+        self.derived_configs.append(ChannelConfig(
+            name=f"Math{k}",
+            color=DEFAULT_COLORS[(k + 4) % len(DEFAULT_COLORS)],
+            expression="ch0",
+        ))
+        self.derived_code.append(self._compile_derived(self.derived_configs[-1]))
+        self.labels_updated = True
+
+    def _remove_derived_channel(self, sender, app_data, user_data):
+        k = user_data - MAX_CHANNELS
+        if not 0 <= k < len(self.derived_configs):
+            return
+        count = len(self.derived_configs)
+        self.derived_configs = self.derived_configs[:k] + self.derived_configs[k + 1:]
+        self.derived_code = self.derived_code[:k] + self.derived_code[k + 1:]
+        # Later derived channels shift down one index and keep their data
+        self.data_buffer.remove_channel(MAX_CHANNELS + k)
+        for j in range(k + 1, count):
+            self.data_buffer.move_channel(MAX_CHANNELS + j, MAX_CHANNELS + j - 1)
+        for j in range(k, count):
+            if dpg.does_item_exist(f"series_{MAX_CHANNELS + j}"):
+                dpg.delete_item(f"series_{MAX_CHANNELS + j}")  # Recreated with the shifted config
+        self.labels_updated = True
+
+    def _on_derived_expression(self, sender, value, user_data):
+        k = user_data - MAX_CHANNELS
+        if 0 <= k < len(self.derived_configs):
+            cfg = self.derived_configs[k]
+            cfg.expression = value
+            self.derived_code[k] = self._compile_derived(cfg)
+            self.data_buffer.remove_channel(user_data)  # Old values no longer match the expression
 
     def _on_labels(self, labels: dict):
         """Callback for incoming channel labels from MCU."""
         print(f"Received labels for {len(labels)} channels: {list(labels.values())[:5]}...")
+        if self.stream_server.is_running():
+            self.stream_server.publish_labels(labels)
         for ch_idx, label in labels.items():
             self.pending_labels[ch_idx] = label
             if ch_idx < len(self.channel_configs):
@@ -700,11 +4025,29 @@ class DragoonPlotApp:
                     self.channel_configs[ch_idx].name = label
                     self.labels_updated = True
 
+    def _on_tx_error(self, message: str):
+        """Callback for write errors from the serial writer thread."""
+        with self.terminal_lock:
+            self.terminal_queue.append(f"[TX error] {message}")
+
     def _on_text_line(self, line: str):
         """Callback for incoming text lines from serial port."""
         # Queue text for terminal output (called from serial thread)
         with self.terminal_lock:
             self.terminal_queue.append(line)
+        self.macro_runner.feed_text(line)
+
+        if line.startswith(DISCOVERY_MARKER):
+            self._on_discovery_reply(line[len(DISCOVERY_MARKER):])
+            return
+        if line.startswith(FWHASH_MARKER):
+            self.device_fw_hash = line[len(FWHASH_MARKER):].strip().lower()
+            self.device_fw_event.set()
+            return
+        if line.startswith(PONG_MARKER):
+            self.pong_time = time.perf_counter()
+            self.pong_event.set()
+            return
 
         # Check for help output start
         if "Commands ===" in line:
@@ -740,16 +4083,51 @@ class DragoonPlotApp:
                 args = parts[1].strip()
                 cat = parts[2].strip()
 
-                # Only add commands without arguments (ARGS == "-")
-                if cmd and args == "-":
+                # Commands with arguments (ARGS != "-") get an input per argument
+                if cmd:
                     btn = CommandButton(
                         label=cmd.capitalize(),
                         data=f"{cmd}\r\n",
                         mode="ascii",
-                        category=cat
+                        category=cat,
+                        args=args.split() if args != "-" else [],
                     )
                     self.parsed_commands.append(btn)
 
+    def _on_discovery_reply(self, text: str):
+        """Structured discovery reply (serial thread): replace and cache the command buttons."""
+        try:
+            reply = json.loads(text)
+            commands = [CommandButton.from_discovery(entry) for entry in reply["commands"]]
+            firmware = str(reply.get("fw", ""))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"Invalid discovery reply: {e}")
+            return
+        self.help_parsing = False
+        self.command_buttons = commands
+        self.commands_updated = True
+        self.config.command_cache[f"{self.connected_port}|{firmware}"] = {
+            "commands": [{"cmd": b.data.rstrip("\r\n"), "cat": b.category, "args": b.args} for b in commands],
+            "time": time.time(),
+        }
+
+    def _load_cached_commands(self, port: str):
+        """Restore the command buttons last discovered on this port."""
+        entries = [(entry.get("time", 0), key, entry) for key, entry in self.config.command_cache.items()
+                   if key.split("|", 1)[0] == port]
+        if not entries:
+            return
+        _, key, entry = max(entries, key=lambda e: e[0])
+        try:
+            self.command_buttons = [CommandButton.from_discovery(c) for c in entry["commands"]]
+        except (KeyError, TypeError) as e:
+            print(f"Invalid cached commands for {key}: {e}")
+            return
+        self.commands_updated = True
+        with self.terminal_lock:
+            self.terminal_queue.append(
+                f"Loaded {len(self.command_buttons)} cached commands for {key.split('|', 1)[1] or port}")
+
     def _discover_commands(self):
         """Send help command to discover available commands."""
         if self.serial_manager.is_connected():
@@ -764,37 +4142,118 @@ class DragoonPlotApp:
             return dpg.get_value("port_combo") or ""
         return ""
 
-    def _get_selected_baud(self) -> int:
-        if dpg.does_item_exist("baud_combo"):
-            val = dpg.get_value("baud_combo")
-            return int(val) if val else 115200
-        return 115200
+    def _get_selected_baud(self) -> Optional[int]:
+        """Baud rate typed in the baud field, or None if it is not a positive integer."""
+        if dpg.does_item_exist("baud_input"):
+            val = dpg.get_value("baud_input").strip()
+            return int(val) if val.isdigit() and int(val) > 0 else None
+        return self.config.last_baud
+
+    def _on_baud_preset(self, sender, app_data):
+        dpg.set_value("baud_input", app_data)
+
+    def _measure_latency(self):
+        """Start timing ping -> @pong round trips in a background thread."""
+        if not self.serial_manager.is_connected():
+            self.latency_text = "Not connected"
+            return
+
+        def worker():
+            rtts = []
+            for _ in range(LATENCY_PINGS):
+                self.pong_event.clear()
+                sent = time.perf_counter()
+                if not self.serial_manager.send(PING_COMMAND) or not self.pong_event.wait(1.0):
+                    break
+                rtts.append((self.pong_time - sent) * 1000.0)
+            if rtts:
+                rtts.sort()
+                self.latency_text = f"RTT {rtts[len(rtts) // 2]:.2f} ms (min {rtts[0]:.2f}, max {rtts[-1]:.2f})"
+            else:
+                self.latency_text = f"No {PONG_MARKER} reply (see PROTOCOL.md)"
+
+        self.latency_text = "Measuring..."
+        threading.Thread(target=worker, daemon=True).start()
 
     def _refresh_ports(self):
-        ports = SerialManager.list_ports()
-        if dpg.does_item_exist("port_combo"):
-            dpg.configure_item("port_combo", items=ports)
-            if ports and not dpg.get_value("port_combo"):
-                dpg.set_value("port_combo", ports[0])
+        """Ask the port monitor for an immediate scan; the list updates in _update_connection."""
+        self.port_monitor.rescan()
+        self.ports_generation = -1
 
     def _toggle_connection(self):
-        if self.serial_manager.is_connected():
+        if self.serial_manager.state != "disconnected":
             self.serial_manager.disconnect()
             dpg.configure_item("connect_btn", label="Connect")
             dpg.configure_item("status_text", default_value="Disconnected", color=(255, 100, 100))
         else:
             port = self._get_selected_port()
             baud = self._get_selected_baud()
+            if baud is None:
+                dpg.configure_item("status_text", default_value="Invalid baud rate", color=(255, 100, 100))
+                return
             if port and self.serial_manager.connect(port, baud):
                 # Sync timestamps between serial manager and data buffer
                 self.serial_manager.batch_time = self.data_buffer.start_time
-                dpg.set_value("connect_btn", "Disconnect")
+                self.connected_port = port
+                self._load_cached_commands(port)
+                self.latency_text = ", ".join(self.serial_manager.tuning)
+                dpg.configure_item("connect_btn", label="Disconnect")
                 dpg.configure_item("status_text", default_value=f"Connected: {port}", color=(100, 255, 100))
             else:
                 dpg.configure_item("status_text", default_value="Connection failed", color=(255, 100, 100))
+        self.connection_state = (self.serial_manager.state, self.serial_manager.port_name)
+
+    def _on_auto_reconnect(self, sender, app_data):
+        self.serial_manager.auto_reconnect = app_data
+
+    def _update_connection(self):
+        """Follow port hot-plug and the serial thread's reconnects (cheap when nothing changed)."""
+        if dpg.get_value("latency_text") != self.latency_text:
+            dpg.set_value("latency_text", self.latency_text)
+        if self.port_monitor.generation != self.ports_generation:
+            self.ports_generation, ports = self.port_monitor.get_ports()
+            dpg.configure_item("port_combo", items=sorted(ports))
+            if ports and not dpg.get_value("port_combo"):
+                dpg.set_value("port_combo", sorted(ports)[0])
+
+        sm = self.serial_manager
+        state = (sm.state, sm.port_name)  # Read first: a reconnect appends its gap before reporting "connected"
+        if sm.gaps:
+            with sm.batch_lock:
+                gaps, sm.gaps = sm.gaps, []
+            oldest = self.data_buffer.oldest_time()
+            self.gaps = [g for g in self.gaps if oldest is not None and g[1] >= oldest] + gaps
+
+        if state == self.connection_state:
+            return
+        previous = self.connection_state[0]
+        self.connection_state = state
+        if sm.state == "reconnecting":
+            message = f"[Connection lost, waiting for {sm.serial_number or sm.port_name}]"
+            dpg.configure_item("status_text", default_value=f"Reconnecting: {sm.port_name}", color=(255, 200, 100))
+        elif sm.state == "connected" and previous == "reconnecting":
+            lost, back = self.gaps[-1] if self.gaps else (0.0, 0.0)
+            message = f"[Reconnected on {sm.port_name} after {back - lost:.2f} s]"
+            self.connected_port = sm.port_name
+            self.latency_text = ", ".join(sm.tuning)
+            dpg.configure_item("status_text", default_value=f"Connected: {sm.port_name}", color=(100, 255, 100))
+        elif sm.state == "disconnected":
+            message = "[Connection lost]"
+            dpg.configure_item("connect_btn", label="Connect")
+            dpg.configure_item("status_text", default_value="Disconnected", color=(255, 100, 100))
+        else:
+            return
+        with self.terminal_lock:
+            self.terminal_queue.append(message)
 
     def _clear_data(self):
+        if self.snapshot_path:
+            self._close_snapshot()
         self.data_buffer.clear()
+        self.stats.reset()
+        self.histogram.reset()
+        self.filters.clear()
+        self.gaps = []
         # Sync serial manager timestamp with data buffer
         self.serial_manager.batch_time = self.data_buffer.start_time
 
@@ -806,12 +4265,116 @@ class DragoonPlotApp:
             self.paused_time = time.time() - self.data_buffer.start_time
             dpg.configure_item("pause_btn", label="Resume")
         else:
+            # Resuming from a snapshot returns to the (still paused) live buffer first
+            if self.snapshot_path:
+                self._close_snapshot()
             # Adjust start_time so old data stays in place and new data continues from here
             pause_duration = (time.time() - self.data_buffer.start_time) - self.paused_time
             self.data_buffer.start_time += pause_duration
             self.serial_manager.batch_time = self.data_buffer.start_time
             dpg.configure_item("pause_btn", label="Pause")
 
+    def _get_next_snapshot_filename(self) -> str:
+        """Get the next available snapshot filename (dragoonplot_snapshot0.npz, ...)."""
+        i = 0
+        while True:
+            filename = f"dragoonplot_snapshot{i}.npz"
+            if not os.path.exists(filename):
+                return filename
+            i += 1
+
+    def _save_snapshot(self):
+        """Save all buffered data plus channel configs to a snapshot file (background thread)."""
+        filename = self._get_next_snapshot_filename()
+        buffer = self.data_buffer
+        meta = {
+            "format": "dragoonplot-snapshot",
+            "version": 1,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "time_window": self.time_window,
+            "channels": [c.to_dict() for c in self.channel_configs],
+            "derived_channels": [c.to_dict() for c in self.derived_configs],
+        }
+
+        def worker():
+            try:
+                t0 = time.time()
+                data = buffer.export()
+                save_snapshot(filename, data, meta)
+                samples = sum(len(ts) for ts, _ in data.values())
+                print(f"Snapshot saved to {filename}: {len(data)} channels, "
+                      f"{samples} samples in {time.time() - t0:.2f}s")
+            except Exception as e:
+                print(f"Error saving snapshot: {e}")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _browse_snapshot(self):
+        """Open file dialog to select a snapshot to browse."""
+        import tkinter as tk
+        from tkinter import filedialog
+        root = tk.Tk()
+        root.withdraw()
+        root.attributes('-topmost', True)
+        file_path = filedialog.askopenfilename(
+            title="Open Snapshot",
+            filetypes=[("DragoonPlot Snapshots", "*.npz"), ("All Files", "*.*")]
+        )
+        root.destroy()
+        if file_path:
+            self._open_snapshot(file_path)
+
+    def _open_snapshot(self, path: str):
+        """Browse a snapshot offline: memory-map it and show it in place of live data."""
+        try:
+            t0 = time.time()
+            meta, arrays = load_snapshot(path)
+            if meta.get("format") != "dragoonplot-snapshot":
+                raise ValueError("not a DragoonPlot snapshot")
+        except Exception as e:
+            print(f"Error opening snapshot: {e}")
+            return
+        if self.snapshot_path:
+            self._close_snapshot()
+        if not self.plot_paused:
+            self._toggle_pause()  # Live data is discarded while browsing
+        snapshot = SnapshotHistory(arrays)
+        buffer = DataBuffer()
+        buffer.set_history(snapshot)
+        configs = [ChannelConfig.from_dict(c) for c in meta.get("channels", [])]
+        for i in range(len(configs), max((ch for ch in arrays if ch < MAX_CHANNELS), default=-1) + 1):
+            configs.append(ChannelConfig(name=f"Ch{i}", color=DEFAULT_COLORS[i % len(DEFAULT_COLORS)]))
+        derived = [ChannelConfig.from_dict(c) for c in meta.get("derived_channels", [])]
+
+        self.live_state = (self.data_buffer, self.channel_configs, self.derived_configs, self.paused_time)
+        self.data_buffer = buffer
+        self.channel_configs = configs
+        self.derived_configs = derived
+        self.derived_code = [self._compile_derived(c) for c in derived]
+        self.paused_time = snapshot.newest_time() or 0.0
+        self.snapshot_path = path
+        self.view_offset = 0.0
+        dpg.set_value("view_offset_slider", 0.0)
+        self.labels_updated = True  # Rebuild channel controls for snapshot channels
+        dpg.configure_item("main_plot", label=f"Snapshot: {Path(path).name}")
+        samples = sum(ch["count"] for ch in snapshot.channels.values())
+        print(f"Opened snapshot {path}: {len(arrays)} channels, {samples} samples in {time.time() - t0:.3f}s")
+
+    def _close_snapshot(self):
+        """Return from snapshot browsing to the (paused) live buffer."""
+        if not self.snapshot_path:
+            return
+        self.data_buffer, self.channel_configs, self.derived_configs, self.paused_time = self.live_state
+        self.derived_code = [self._compile_derived(c) for c in self.derived_configs]
+        self.live_state = None
+        self.snapshot_path = None
+        self.view_offset = 0.0
+        dpg.set_value("view_offset_slider", 0.0)
+        if self.data_buffer.history is None and self.time_window > MAX_TIME_WINDOW:
+            self._on_time_input(None, MAX_TIME_WINDOW)  # Snapshot windows may exceed what the ring holds
+        self.labels_updated = True
+        dpg.configure_item("main_plot", label="Serial Data")
+
     def _get_next_log_filename(self) -> str:
         """Get the next available log filename (dragoonplot_data0.csv, dragoonplot_data1.csv, etc.)."""
         i = 0
@@ -864,51 +4427,148 @@ class DragoonPlotApp:
 
     def _clear_terminal(self):
         """Clear the terminal output."""
-        if dpg.does_item_exist("terminal_output"):
-            dpg.set_value("terminal_output", "")
+        self.terminal.clear()
+        self.terminal_top = 0
+        self.terminal_match = -1
 
-    def _process_terminal_queue(self):
-        """Process queued terminal output (must be called from main thread)."""
-        if not dpg.does_item_exist("terminal_output"):
-            return
+    def _on_terminal_spill(self, sender, value):
+        self.terminal.set_spill(value, self.config.history_dir)
 
-        # Get all queued lines
+    def _process_terminal_queue(self):
+        """Move queued terminal output into the scrollback (must be called from main thread)."""
         with self.terminal_lock:
             if not self.terminal_queue:
                 return
-            lines = self.terminal_queue.copy()
-            self.terminal_queue.clear()
+            lines = self.terminal_queue
+            self.terminal_queue = []
+        self.terminal.extend(lines)
+
+    def _terminal_rows(self) -> int:
+        """Number of lines that fit in the terminal view."""
+        height = dpg.get_item_rect_size("terminal_output")[1]
+        if height <= 0:
+            height = 300 * self.ui_scale  # Not laid out yet
+        line_height = 13 * self.ui_scale + 1  # Default font size plus line spacing
+        return max(1, int(height / line_height) - 1)
+
+    def _terminal_layout(self) -> tuple:
+        """Return (shown line numbers or None for all lines, number of shown lines, rows)."""
+        term = self.terminal
+        matches = self.terminal_search.get_matches()
+        matches = matches[np.searchsorted(matches, term.first):]
+        if self.terminal_search.active and dpg.get_value("terminal_filter"):
+            return matches, len(matches), self._terminal_rows()
+        return None, len(term), self._terminal_rows()
+
+    def _terminal_scroll(self, pos: int):
+        """Scroll so that shown line number `pos` is on top; scrolling to the end follows new lines."""
+        shown, total, rows = self._terminal_layout()
+        last = max(0, total - rows)
+        pos = min(max(pos, 0), last)
+        if shown is None:
+            self.terminal_top = self.terminal.first + pos
+        elif total:
+            self.terminal_top = int(shown[pos])
+        dpg.set_value("terminal_autoscroll", pos >= last)
+
+    def _terminal_pos(self, shown: Optional[np.ndarray]) -> int:
+        """Position of terminal_top among the shown lines."""
+        if shown is None:
+            return self.terminal_top - self.terminal.first
+        return int(np.searchsorted(shown, self.terminal_top))
+
+    def _on_terminal_slider(self, sender, value):
+        # Slider runs bottom (newest) = 0 to top (oldest) = max
+        _, total, rows = self._terminal_layout()
+        self._terminal_scroll(max(0, total - rows) - value)
+
+    def _on_mouse_wheel(self, sender, delta):
+        if dpg.does_item_exist("terminal_output") and dpg.is_item_hovered("terminal_output"):
+            shown, total, rows = self._terminal_layout()
+            pos = max(0, total - rows) if dpg.get_value("terminal_autoscroll") else self._terminal_pos(shown)
+            self._terminal_scroll(pos - int(delta * TERMINAL_WHEEL_LINES))
+
+    def _on_terminal_search(self, sender=None, app_data=None):
+        self.terminal_search.start()
+        self.terminal_search.set_query(
+            dpg.get_value("terminal_search"),
+            regex=dpg.get_value("terminal_regex"),
+            word=dpg.get_value("terminal_word"),
+        )
+        self.terminal_match = -1
 
-        # Append to terminal
-        current = dpg.get_value("terminal_output")
-        new_text = current + "\n".join(lines) + "\n"
+    def _on_terminal_index(self, sender, value):
+        self.terminal.set_index(value)
 
-        # Limit terminal buffer to ~50KB to prevent memory issues
-        max_len = 50000
-        if len(new_text) > max_len:
-            # Truncate from beginning, but find the first newline to avoid breaking mid-line
-            new_text = new_text[-max_len:]
-            first_newline = new_text.find('\n')
-            if first_newline > 0:
-                new_text = new_text[first_newline + 1:]
-
-        dpg.set_value("terminal_output", new_text)
-
-        # Resize input_text height based on line count so child_window can scroll
-        line_count = new_text.count('\n') + 1
-        line_height = 18 * self.ui_scale  # Approximate line height
-        min_height = 100
-        new_height = max(min_height, int(line_count * line_height))
-        dpg.configure_item("terminal_output", height=new_height)
-
-        # Auto-scroll to bottom via child_window
-        auto_scroll_enabled = dpg.does_item_exist("terminal_autoscroll") and dpg.get_value("terminal_autoscroll")
-        if auto_scroll_enabled:
-            try:
-                max_scroll = dpg.get_y_scroll_max("terminal_scroll_container")
-                dpg.set_y_scroll("terminal_scroll_container", max_scroll)
-            except Exception:
-                pass
+    def _terminal_find(self, sender=None, app_data=None, user_data=1):
+        """Jump to the next (user_data=1) or previous (-1) match and center it."""
+        term = self.terminal
+        matches = self.terminal_search.get_matches()
+        matches = matches[np.searchsorted(matches, term.first):]
+        if not len(matches):
+            return
+        current = self.terminal_match if self.terminal_match >= term.first else self.terminal_top - 1
+        if user_data > 0:
+            i = int(np.searchsorted(matches, current, side="right"))
+            self.terminal_match = int(matches[i % len(matches)])
+        else:
+            i = int(np.searchsorted(matches, current)) - 1
+            self.terminal_match = int(matches[i])  # -1 wraps to the last match
+        shown, _, rows = self._terminal_layout()
+        pos = self.terminal_match - term.first if shown is None else int(np.searchsorted(shown, self.terminal_match))
+        self._terminal_scroll(pos - rows // 2)
+        dpg.set_value("terminal_autoscroll", False)
+
+    def _update_terminal_view(self):
+        """Show the visible slice of the scrollback; cost is O(visible lines)."""
+        search = self.terminal_search
+        if dpg.does_item_exist("terminal_matches"):
+            if search.error:
+                status = "invalid pattern"
+            elif search.active:
+                progress = search.progress()
+                status = f"{len(search.get_matches()):,} matches" + ("" if progress >= 1.0 else f" ({progress:.0%})")
+            else:
+                status = ""
+            if status != self.terminal_status:
+                self.terminal_status = status
+                dpg.set_value("terminal_matches", status)
+        if not dpg.does_item_exist("terminal_output") or not dpg.is_item_visible("terminal_output"):
+            return
+        term = self.terminal
+        shown, total, rows = self._terminal_layout()
+        last = max(0, total - rows)
+        pos = last if dpg.get_value("terminal_autoscroll") else min(max(self._terminal_pos(shown), 0), last)
+        if shown is None:
+            numbers = np.arange(term.first + pos, min(term.count, term.first + pos + rows), dtype=np.int64)
+        else:
+            numbers = shown[pos:pos + rows]
+        if len(numbers):
+            self.terminal_top = int(numbers[0])
+
+        # Gutter: line numbers, "*" marks matching lines, ">" the current match
+        matches = search.get_matches()
+        if search.active and len(numbers):
+            hit = np.searchsorted(matches, numbers)
+            is_match = matches[np.minimum(hit, len(matches) - 1)] == numbers if len(matches) else hit < 0
+        else:
+            is_match = np.zeros(len(numbers), dtype=bool)
+        key = (pos, last, numbers[:1].tobytes(), len(numbers), is_match.tobytes(),
+               self.terminal_match, term.generation)
+        if key == self.terminal_view_key:
+            return
+        self.terminal_view_key = key
+        if shown is None:
+            text = term.lines(int(numbers[0]), int(numbers[-1]) + 1) if len(numbers) else []
+        else:
+            text = term.get_lines(numbers)
+        marks = [">" if n == self.terminal_match else "*" if m else " "
+                 for n, m in zip(numbers.tolist(), is_match.tolist())]
+        dpg.set_value("terminal_gutter", "\n".join(f"{mark}{n + 1}" for mark, n in zip(marks, numbers.tolist())))
+        dpg.set_value("terminal_output", "\n".join(text))
+        dpg.configure_item("terminal_slider", max_value=last)
+        dpg.set_value("terminal_slider", last - pos)
+        dpg.set_value("terminal_lines", f"{len(term):,} lines")
 
     def _browse_dfu_file(self):
         """Open file dialog to select .bin file."""
@@ -925,10 +4585,48 @@ class DragoonPlotApp:
         if file_path:
             dpg.set_value("dfu_file_path", file_path)
             self.config.dfu_file_path = file_path
+            self._hash_firmware()
+
+    def _hash_firmware(self):
+        """Hash the selected image in the background and show size and checksums."""
+        file_path = dpg.get_value("dfu_file_path")
+        if not file_path or not Path(file_path).exists():
+            return
+
+        def worker():
+            try:
+                info = firmware_image_info(file_path, self.firmware_cache)
+            except OSError as e:
+                self.firmware_text = f"Cannot read image: {e}"
+                return
+            self.firmware_text = (f"{info['size']:,} bytes, CRC-32 {info['crc32']:08X}, "
+                                  f"SHA-256 {info['sha256'][:16]}...")
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _validate_firmware(self, file_path: str, address: str, devices: list) -> Optional[dict]:
+        """Image info, or None (with the reason logged) if it does not fit the scanned devices' flash."""
+        try:
+            info = firmware_image_info(file_path, self.firmware_cache)
+            start = int(address.split(":")[0], 16)
+        except (OSError, ValueError) as e:
+            self._append_dfu_output(f"ERROR: {e}")
+            return None
+        for device in devices:
+            regions = parse_dfu_layout(dict(device.get("alts", [])).get(device.get("alt", "0"), ""))
+            error = check_image_fits(start, info["size"], regions) if regions else ""
+            if error:
+                self._append_dfu_output(f"ERROR: {device.get('serial') or device.get('path')}: {error}")
+                return None
+        return info
 
     def _enter_dfu_mode(self):
         """Send DFU command to device or show manual instructions."""
         if self.serial_manager.is_connected():
+            file_path = dpg.get_value("dfu_file_path")
+            if dpg.get_value("dfu_skip_identical") and file_path and Path(file_path).exists():
+                threading.Thread(target=self._enter_dfu_if_changed, args=(file_path,), daemon=True).start()
+                return
             self.serial_manager.send(b"dfu\r\n")
             self._append_dfu_output("Sent 'dfu' command to device...")
             self._append_dfu_output("Device should disconnect and enter DFU bootloader.")
@@ -939,6 +4637,26 @@ class DragoonPlotApp:
             self._append_dfu_output("3. Release BOOT0")
             self._append_dfu_output("Device should appear as STM32 BOOTLOADER")
 
+    def _enter_dfu_if_changed(self, file_path: str):
+        """Ask the running firmware for its hash; enter DFU only if it differs from the image."""
+        try:
+            info = firmware_image_info(file_path, self.firmware_cache)
+        except OSError as e:
+            self._append_dfu_output(f"ERROR: {e}")
+            return
+        self.device_fw_event.clear()
+        self.serial_manager.send(FWHASH_COMMAND)
+        if not self.device_fw_event.wait(1.0):
+            self._append_dfu_output("Device did not report its firmware hash")
+        elif self.device_fw_hash in (info["sha256"], f"{info['crc32']:08x}"):
+            self._append_dfu_output(f"Device already runs {Path(file_path).name}, not entering DFU")
+            return
+        else:
+            self._append_dfu_output("Device firmware differs from the image")
+        self.serial_manager.send(b"dfu\r\n")
+        self._append_dfu_output("Sent 'dfu' command to device...")
+        self._append_dfu_output("Device should disconnect and enter DFU bootloader.")
+
     def _flash_dfu(self):
         """Flash firmware using dfu-util in background thread."""
         file_path = dpg.get_value("dfu_file_path")
@@ -948,9 +4666,14 @@ class DragoonPlotApp:
             self._append_dfu_output("ERROR: Please select a valid .bin file")
             return
 
-        dfu_util = get_dfu_util_path()
+        # Size check against the flash layout reported by the last Scan (if any)
+        if self._validate_firmware(file_path, address, self.dfu_devices[:1]) is None:
+            dpg.configure_item("dfu_status", default_value="Invalid image", color=(255, 100, 100))
+            return
+
+        dfu_util = dfu_util_command()
         # On Windows, check if bundled exe exists; on Linux, just use system command
-        if sys.platform == 'win32' and not Path(dfu_util).exists():
+        if sys.platform == 'win32' and not os.environ.get(DFU_UTIL_ENV) and not Path(dfu_util[0]).exists():
             self._append_dfu_output("ERROR: dfu-util.exe not found in application directory")
             return
 
@@ -959,7 +4682,7 @@ class DragoonPlotApp:
 
         def worker():
             try:
-                cmd = [dfu_util, '-a', '0', '-s', address, '-D', file_path]
+                cmd = dfu_util + ['-a', '0', '-s', address, '-D', file_path]
                 self._append_dfu_output(f"Running: {' '.join(cmd)}")
 
                 # Use Popen for real-time output streaming
@@ -995,6 +4718,91 @@ class DragoonPlotApp:
 
         threading.Thread(target=worker, daemon=True).start()
 
+    def _scan_dfu_devices(self):
+        """List DFU devices (dfu-util -l) in the background; the table is rebuilt by the frame loop."""
+        def worker():
+            try:
+                devices = list_dfu_devices()
+            except FileNotFoundError:
+                self._append_dfu_output("ERROR: dfu-util not found")
+                return
+            except Exception as e:
+                self._append_dfu_output(f"ERROR: {e}")
+                return
+            self._append_dfu_output(f"Found {len(devices)} DFU device(s)")
+            self.dfu_devices = devices
+            self.dfu_devices_changed = True
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _rebuild_dfu_table(self):
+        dpg.delete_item("dfu_table", children_only=True, slot=1)
+        self.dfu_shown = {}
+        for k, device in enumerate(self.dfu_devices):
+            with dpg.table_row(parent="dfu_table"):
+                dpg.add_checkbox(tag=f"dfu_use_{k}", default_value=True)
+                dpg.add_text(device["serial"] or "-")
+                dpg.add_text(device["path"] or "-")
+                dpg.add_progress_bar(tag=f"dfu_progress_{k}", default_value=0.0, width=-1)
+                dpg.add_text("", tag=f"dfu_state_{k}")
+
+    def _flash_all_dfu(self):
+        """Flash the checked devices, dfu_parallel at a time."""
+        file_path = dpg.get_value("dfu_file_path")
+        if not file_path or not Path(file_path).exists():
+            self._append_dfu_output("ERROR: Please select a valid .bin file")
+            return
+        if self.dfu_queue.running():
+            return
+        self.config.dfu_parallel = max(1, dpg.get_value("dfu_parallel"))
+        devices = [d for k, d in enumerate(self.dfu_devices) if dpg.get_value(f"dfu_use_{k}")]
+        if not devices:
+            self._append_dfu_output("No DFU devices selected (click Scan)")
+            return
+        address = dpg.get_value("dfu_address")
+        try:
+            image = firmware_image_info(file_path, self.firmware_cache)
+            int(address.split(":")[0], 16)
+        except OSError as e:
+            self._append_dfu_output(f"ERROR: {e}")
+            return
+        except ValueError:
+            self._append_dfu_output(f"ERROR: Invalid address '{address}' (expected hex, e.g. 0x08004000)")
+            return
+        self.dfu_shown = {}
+        self._append_dfu_output(f"Flashing {Path(file_path).name} to {len(devices)} device(s), "
+                                f"{self.config.dfu_parallel} at a time")
+        self.config.dfu_skip_identical = dpg.get_value("dfu_skip_identical")
+        self.dfu_queue.start(devices, file_path, address, self.config.dfu_parallel,
+                             image=image, skip_identical=self.config.dfu_skip_identical)
+
+    def _update_dfu_jobs(self):
+        """Show per-device progress of the DFU batch."""
+        if self.firmware_text != dpg.get_value("dfu_image_info"):
+            dpg.set_value("dfu_image_info", self.firmware_text)
+        if self.dfu_devices_changed:
+            self.dfu_devices_changed = False
+            self._rebuild_dfu_table()
+        jobs = {id(job.device): job for job in self.dfu_queue.jobs}
+        if not jobs:
+            return
+        for k, device in enumerate(self.dfu_devices):
+            job = jobs.get(id(device))
+            if job is None or not dpg.does_item_exist(f"dfu_progress_{k}"):
+                continue
+            shown = (job.state, job.progress, job.message)
+            if self.dfu_shown.get(k) == shown:
+                continue
+            self.dfu_shown[k] = shown
+            percent = f" {job.progress:.0%}" if job.state in ("Erasing", "Downloading") else ""
+            dpg.set_value(f"dfu_progress_{k}", job.progress)
+            dpg.configure_item(f"dfu_progress_{k}", overlay=f"{job.state}{percent}")
+            dpg.set_value(f"dfu_state_{k}", job.message if job.finished() else "")
+        if not self.dfu_queue.running() and self.dfu_batch_active:
+            done = sum(job.state == "Done" for job in self.dfu_queue.jobs)
+            self._append_dfu_output(f"Batch finished: {done}/{len(self.dfu_queue.jobs)} succeeded")
+        self.dfu_batch_active = self.dfu_queue.running()
+
     def _append_dfu_output(self, text: str):
         """Thread-safe append to DFU output."""
         with self.terminal_lock:
@@ -1020,25 +4828,551 @@ class DragoonPlotApp:
         except Exception:
             pass
 
+    def _toggle_stream_server(self):
+        """Start or stop the live data fan-out server."""
+        if self.stream_server.is_running():
+            self.stream_server.stop()
+            dpg.configure_item("stream_btn", label="Start Server")
+        else:
+            address = dpg.get_value("stream_address").strip() or STREAM_DEFAULT_ADDRESS
+            if self.stream_server.start(address):
+                # New clients receive the labels we already know
+                self.stream_server.labels.update(
+                    {i: c.name for i, c in enumerate(self.channel_configs) if c.name})
+                self.config.stream_address = address
+                dpg.configure_item("stream_btn", label="Stop Server")
+            else:
+                dpg.configure_item("stream_status",
+                                   default_value=f"Failed to listen on {address}: {self.stream_server.error}",
+                                   color=(255, 100, 100))
+                return
+        self.stream_status_time = 0.0
+        self._update_stream_status()
+
+    def _update_stream_status(self):
+        """Refresh the Stream tab status and client list (throttled)."""
+        now = time.time()
+        if now - self.stream_status_time < 0.5 or not dpg.does_item_exist("stream_status"):
+            return
+        self.stream_status_time = now
+        if not self.stream_server.is_running():
+            dpg.configure_item("stream_status", default_value="Stopped", color=(200, 200, 200))
+            dpg.set_value("stream_clients", "")
+            return
+        clients = self.stream_server.get_clients()
+        dpg.configure_item("stream_status", color=(100, 255, 100),
+                           default_value=f"Listening on {self.stream_server.address} - {len(clients)} client(s)")
+        lines = []
+        for c in clients:
+            kind = "ws" if c.websocket else "raw"
+            lines.append(f"{c.address} [{kind}]  sent={c.sent}  queued={c.queue.qsize()}  dropped={c.dropped}")
+        dpg.set_value("stream_clients", "\n".join(lines))
+
+    def _on_trigger_setting(self, sender=None, app_data=None):
+        """Apply Scope tab trigger settings (level is entered in scaled units)."""
+        try:
+            channel = int(dpg.get_value("trig_channel").split(":", 1)[0])
+        except (ValueError, AttributeError):
+            channel = self.trigger.channel  # No channels listed yet
+        mode = dpg.get_value("trig_mode")
+        level = dpg.get_value("trig_level")
+        cfg = self.channel_configs[channel] if channel < len(self.channel_configs) else ChannelConfig()
+        scale = cfg.scale if cfg.scale != 0 else 1.0
+        if scale < 0:  # Negative scale flips edges in raw units
+            mode = {"Rising": "Falling", "Falling": "Rising"}.get(mode, mode)
+        was_armed = self.trigger.armed
+        self.trigger.configure(
+            channel=channel,
+            mode=mode,
+            level=(level - cfg.offset) / scale,
+            width=dpg.get_value("trig_width"),
+            pre=dpg.get_value("trig_pre"),
+            post=dpg.get_value("trig_post"),
+            sweep=dpg.get_value("trig_sweep"),
+        )
+        self.scope_level = level
+        if dpg.does_item_exist("scope_level_line"):
+            dpg.set_value("scope_level_line", level)
+        if was_armed:
+            self.trigger.arm()
+
+    def _toggle_trigger(self):
+        """Arm or stop trigger acquisition."""
+        if self.trigger.armed:
+            self.trigger.armed = False
+        else:
+            self._on_trigger_setting()
+            self.trigger.arm()
+        dpg.configure_item("trig_arm_btn", label="Stop" if self.trigger.armed else "Arm")
+
+    def _update_scope(self):
+        """Refresh the Scope tab: channel list, status and the latest capture."""
+        if not dpg.does_item_exist("scope_plot"):
+            return
+        names = [f"{i}: {c.name or f'Ch{i}'}" for i, c in enumerate(self.channel_configs)]
+        if names != self.scope_channel_names:
+            self.scope_channel_names = names
+            dpg.configure_item("trig_channel", items=names)
+            if self.trigger.channel < len(names):
+                dpg.set_value("trig_channel", names[self.trigger.channel])
+
+        engine = self.trigger
+        if engine.armed:
+            status = "Waiting" if engine.pending is None else "Triggered"
+        else:
+            status = "Stopped"
+        dpg.set_value("trig_status", f"{status}  captures: {engine.capture_count}")
+        dpg.configure_item("trig_arm_btn", label="Stop" if engine.armed else "Arm")
+
+        if engine.capture_count == self.scope_capture_count or engine.capture is None:
+            return
+        self.scope_capture_count = engine.capture_count
+
+        # X axis in ms around the trigger point if the sample rate is known, else in samples
+        n = len(engine.capture)
+        x = np.arange(n, dtype=np.float64) - engine.pre
+        if engine.capture_rate > 0:
+            x *= 1000.0 / engine.capture_rate
+            dpg.configure_item("scope_x_axis", label=f"ms ({engine.capture_rate:.0f} Hz)")
+        else:
+            dpg.configure_item("scope_x_axis", label="Samples")
+        x_list = x.tolist()
+        for i in range(engine.capture.shape[1]):
+            tag = f"scope_series_{i}"
+            cfg = self.channel_configs[i] if i < len(self.channel_configs) else ChannelConfig(name=f"Ch{i}")
+            y = (engine.capture[:, i] * cfg.scale + cfg.offset).tolist()
+            if not dpg.does_item_exist(tag):
+                dpg.add_line_series(x_list, y, label=cfg.name or f"Ch{i}", tag=tag, parent="scope_y_axis")
+            else:
+                dpg.set_value(tag, [x_list, y])
+                dpg.configure_item(tag, label=cfg.name or f"Ch{i}")
+            dpg.configure_item(tag, show=cfg.visible)
+            dpg.bind_item_theme(tag, self._create_line_theme(cfg.color))
+        dpg.set_value("scope_trigger_line", 0.0)
+        dpg.set_axis_limits("scope_x_axis", x_list[0], x_list[-1])
+
+    def _on_scope_level_drag(self, sender, app_data):
+        """Dragging the level marker in the Scope plot moves the trigger level."""
+        dpg.set_value("trig_level", dpg.get_value("scope_level_line"))
+        self._on_trigger_setting()
+
+    def _reset_stats(self):
+        """Restart mean/std/RMS accumulation."""
+        self.stats.reset()
+        self.stats.rebuild_needed = True  # Refill window min/max from the buffer
+
+    def _update_stats_table(self):
+        """Refresh the per-channel statistics table (throttled)."""
+        now = time.time()
+        if now - self.stats_table_time < 0.25 or not dpg.does_item_exist("stats_table"):
+            return
+        self.stats_table_time = now
+        dpg.set_value("stats_rate", f"Sample rate: {self.stats.rate:.1f} Hz   Window: {self.time_window:.1f} s")
+        for i in range(self.stats_rows, len(self.channel_configs)):
+            with dpg.table_row(parent="stats_table"):
+                dpg.add_text("", tag=f"stats_name_{i}")
+                for key in STATS_COLUMNS:
+                    dpg.add_text("", tag=f"stats_{key}_{i}")
+        self.stats_rows = max(self.stats_rows, len(self.channel_configs))
+        for i in range(self.stats_rows):
+            cfg = self.channel_configs[i] if i < len(self.channel_configs) else None
+            dpg.set_value(f"stats_name_{i}", "" if cfg is None else cfg.name or f"Ch{i}")
+            summary = None if cfg is None else self.stats.summary(i, cfg.scale, cfg.offset)
+            for key in STATS_COLUMNS:
+                text = "" if summary is None else (
+                    str(summary[key]) if key == "count" else f"{summary[key]:.4g}")
+                dpg.set_value(f"stats_{key}_{i}", text)
+
+    def _on_histogram_setting(self, sender=None, app_data=None):
+        """Apply Histogram tab settings (window changes restart the counts)."""
+        engine = self.histogram
+        window = min(max(dpg.get_value("hist_window"), 0.0), MAX_TIME_WINDOW)
+        if window != engine.window or sender == "hist_reset":
+            engine.set_window(window)
+        engine.enabled = dpg.get_value("hist_run")
+        self.histogram_time = 0.0
+
+    def _update_histogram(self):
+        """Redraw the histogram of the selected channel (throttled)."""
+        now = time.time()
+        if now - self.histogram_time < 0.2 or not dpg.does_item_exist("hist_plot"):
+            return
+        self.histogram_time = now
+        names = [f"{i}: {c.name or f'Ch{i}'}" for i, c in enumerate(self.channel_configs)]
+        if names != self.histogram_channel_names:
+            self.histogram_channel_names = names
+            dpg.configure_item("hist_channel", items=names)
+            if names and not dpg.get_value("hist_channel"):
+                dpg.set_value("hist_channel", names[0])
+        if not self.histogram.enabled:
+            return
+        try:
+            channel = int(dpg.get_value("hist_channel").split(":")[0])
+        except ValueError:
+            return
+        cfg = self.channel_configs[channel] if channel < len(self.channel_configs) else ChannelConfig()
+        result = self.histogram.rebinned(channel, dpg.get_value("hist_bins"))
+        summary = self.histogram.summary(channel)
+        if result is None or summary is None:
+            return
+        edges, counts, width = result
+        # Bars centered on their code range, in scaled units
+        centers = (edges + (width - 1) / 2.0) * cfg.scale + cfg.offset
+        weight = abs(width * cfg.scale) * 0.9
+        if dpg.does_item_exist("hist_series"):
+            dpg.set_value("hist_series", [centers.tolist(), counts.tolist()])
+            dpg.configure_item("hist_series", weight=weight)
+        else:
+            dpg.add_bar_series(centers.tolist(), counts.tolist(), weight=weight, tag="hist_series",
+                               parent="hist_y_axis")
+        dpg.set_value("hist_info", f"n {summary['count']}  mean {summary['mean']:.2f}  std {summary['std']:.3f}  "
+                                   f"p-p {summary['max'] - summary['min']:.0f}  codes {summary['codes']}  "
+                                   f"(raw units, {width} code(s)/bin)")
+
+    def _on_xy_setting(self, sender=None, app_data=None):
+        """Apply XY tab display options."""
+        dpg.configure_item("xy_plot", equal_aspects=dpg.get_value("xy_equal"))
+        if dpg.does_item_exist("xy_series"):
+            dpg.delete_item("xy_series")  # Recreated as line or scatter series
+        self.xy_time = 0.0
+
+    def _update_xy(self, force: bool = False):
+        """Plot one channel against another over the Graph's time window (throttled, only when shown)."""
+        now = time.time()
+        if not force and (now - self.xy_time < 0.1 or not dpg.is_item_visible("xy_plot")):
+            return
+        self.xy_time = now
+        channels = self._plot_channels()
+        names = [f"{i}: {c.name or f'Ch{i}'}" for i, c in channels]
+        if names != self.xy_channel_names:
+            self.xy_channel_names = names
+            for tag in ("xy_x", "xy_y"):
+                dpg.configure_item(tag, items=names)
+        try:
+            ix = int(dpg.get_value("xy_x").split(":")[0])
+            iy = int(dpg.get_value("xy_y").split(":")[0])
+        except ValueError:
+            return
+        cfg_x, cfg_y = self._channel_config(ix), self._channel_config(iy)
+        if cfg_x is None or cfg_y is None:
+            return
+
+        # Channels written from the same frames share timestamps: align on the newest sample
+        view_start, view_end = self.view_range
+        # Only the newest XY_MAX_SAMPLES are used: start the query where they begin, at the channel's own rate
+        tail, _ = self.data_buffer.get_latest(ix, XY_RATE_SAMPLES)
+        if len(tail) > 1 and tail[-1] > tail[0]:
+            view_start = max(view_start, view_end - XY_MAX_SAMPLES * (tail[-1] - tail[0]) / (len(tail) - 1))
+        tx, vx = self.data_buffer.get_range(ix, view_start, view_end)
+        ty, vy = self.data_buffer.get_range(iy, view_start, view_end)
+        n = min(len(vx), len(vy), XY_MAX_SAMPLES)
+        if n == 0:
+            return
+        x = vx[len(vx) - n:] * cfg_x.scale + cfg_x.offset
+        y = vy[len(vy) - n:] * cfg_y.scale + cfg_y.offset
+        px, py = xy_decimate(x, y)
+
+        if dpg.does_item_exist("xy_series"):
+            dpg.set_value("xy_series", [px.tolist(), py.tolist()])
+        else:
+            add_series = dpg.add_line_series if dpg.get_value("xy_lines") else dpg.add_scatter_series
+            add_series(px.tolist(), py.tolist(), tag="xy_series", parent="xy_y_axis")
+            dpg.bind_item_theme("xy_series", self._create_line_theme(cfg_y.color))
+        dpg.configure_item("xy_x_axis", label=cfg_x.name or f"Ch{ix}")
+        dpg.configure_item("xy_y_axis", label=cfg_y.name or f"Ch{iy}")
+        dpg.set_value("xy_info", f"{len(px)} of {n} points")
+
+    def _on_alarm_events(self, events: list):
+        """Report alarm edges to the terminal and the alarm event log."""
+        lines = []
+        for k, raised, t, value in events:
+            rule = self.alarm_rules[k]
+            cfg = self._channel_config(rule.channel)
+            name = cfg.name if cfg is not None and cfg.name else f"Ch{rule.channel}"
+            wall = self.data_buffer.start_time + t
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(wall)) + f".{int(wall % 1 * 1000):03d}"
+            limits = {"Above": f"> {rule.high:g}", "Below": f"< {rule.low:g}",
+                      "Outside": f"outside {rule.low:g}..{rule.high:g}"}[rule.kind]
+            lines.append(f"[{'ALARM' if raised else 'CLEAR'}] {stamp} {name} {limits} (value {value:.4g})")
+        with self.terminal_lock:
+            self.terminal_queue.extend(lines)
+        try:
+            with open(ALARM_LOG_FILE, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Error writing alarm log: {e}")
+        self.alarms_changed = True
+
+    def _on_macro_message(self, text: str):
+        """Progress messages from the macro runner thread."""
+        with self.terminal_lock:
+            self.terminal_queue.append(text)
+
+    def _refresh_macro_list(self):
+        """Show the selected macro in the Macros tab."""
+        names = [f"{k}: {m.name}" for k, m in enumerate(self.macros)]
+        dpg.configure_item("macro_select", items=names)
+        if self.macros:
+            self.macro_index = min(self.macro_index, len(self.macros) - 1)
+            macro = self.macros[self.macro_index]
+            dpg.set_value("macro_select", names[self.macro_index])
+            dpg.set_value("macro_name", macro.name)
+            dpg.set_value("macro_script", macro.script)
+        else:
+            dpg.set_value("macro_select", "")
+            dpg.set_value("macro_name", "")
+            dpg.set_value("macro_script", "")
+
+    def _on_macro_select(self, sender, value):
+        self.macro_index = int(value.split(":")[0])
+        self._refresh_macro_list()
+
+    def _new_macro(self):
+        self.macros.append(Macro(name=f"Macro{len(self.macros)}",
+                                 script="send start\ndelay 100\nsend stop\n"))
+        self.macro_index = len(self.macros) - 1
+        self._refresh_macro_list()
+
+    def _delete_macro(self):
+        if 0 <= self.macro_index < len(self.macros):
+            del self.macros[self.macro_index]
+            self._refresh_macro_list()
+
+    def _on_macro_field(self, sender, value, user_data):
+        if 0 <= self.macro_index < len(self.macros):
+            setattr(self.macros[self.macro_index], user_data, value)
+            if user_data == "name":
+                self._refresh_macro_list()
+
+    def _run_macro(self):
+        if not 0 <= self.macro_index < len(self.macros):
+            return
+        macro = self.macros[self.macro_index]
+        if not self.serial_manager.is_connected():
+            dpg.set_value("macro_status", "Not connected")
+            return
+        try:
+            ops = parse_macro(macro.script, self.command_buttons)
+        except ValueError as e:
+            dpg.set_value("macro_status", f"Error: {e}")
+            return
+        self.macro_runner.start(macro.name, ops, self.channel_configs)
+
+    def _update_macros(self):
+        """Show the runner status in the Macros tab."""
+        if dpg.does_item_exist("macro_status"):
+            runner = self.macro_runner
+            status = f"{runner.name}: {runner.status}" if runner.name else ""
+            if runner.is_running() != dpg.is_item_enabled("macro_stop"):
+                dpg.configure_item("macro_stop", enabled=runner.is_running())
+                dpg.configure_item("macro_run", enabled=not runner.is_running())
+            if status and status != self.macro_status:
+                self.macro_status = status
+                dpg.set_value("macro_status", status)
+
+    def _add_alarm_rule(self):
+        self.alarm_rules.append(AlarmRule())
+        self.alarms.configure(self.alarm_rules)
+        self._rebuild_alarm_rows()
+
+    def _remove_alarm_rule(self, sender, app_data, user_data):
+        if 0 <= user_data < len(self.alarm_rules):
+            del self.alarm_rules[user_data]
+            self.alarms.configure(self.alarm_rules)
+            self._rebuild_alarm_rows()
+
+    def _on_alarm_field(self, sender, value, user_data):
+        """Update one field of a rule; alarm states restart with the new rules."""
+        k, key = user_data
+        if 0 <= k < len(self.alarm_rules):
+            setattr(self.alarm_rules[k], key, value)
+            self.alarms.configure(self.alarm_rules)
+            self.alarms_changed = True
+
+    def _rebuild_alarm_rows(self):
+        """Recreate the rule rows of the Alarms table."""
+        dpg.delete_item("alarm_table", children_only=True, slot=1)
+        for k, rule in enumerate(self.alarm_rules):
+            with dpg.table_row(parent="alarm_table"):
+                dpg.add_input_int(default_value=rule.channel, width=-1, step=0, min_value=0, min_clamped=True,
+                                  on_enter=True, callback=self._on_alarm_field, user_data=(k, "channel"))
+                dpg.add_combo(ALARM_KINDS, default_value=rule.kind, width=-1,
+                              callback=self._on_alarm_field, user_data=(k, "kind"))
+                for key in ("low", "high", "hysteresis", "min_duration"):
+                    dpg.add_input_float(default_value=getattr(rule, key), width=-1, step=0, format="%.4g",
+                                        on_enter=True, callback=self._on_alarm_field, user_data=(k, key))
+                dpg.add_checkbox(default_value=rule.enabled, callback=self._on_alarm_field,
+                                 user_data=(k, "enabled"))
+                dpg.add_text("", tag=f"alarm_status_{k}")
+                dpg.add_button(label="x", callback=self._remove_alarm_rule, user_data=k)
+        self.alarms_changed = True
+
+    def _update_alarms(self):
+        """Refresh alarm indicators after state changes."""
+        if not self.alarms_changed or not dpg.does_item_exist("alarm_table"):
+            return
+        self.alarms_changed = False
+        for k, rule in enumerate(self.alarm_rules):
+            if not dpg.does_item_exist(f"alarm_status_{k}"):
+                continue
+            if not rule.enabled:
+                text, color = "off", (150, 150, 150)
+            elif self.alarms.active[k]:
+                text, color = "ALARM", (255, 80, 80)
+            else:
+                text, color = "ok", (80, 220, 80)
+            dpg.set_value(f"alarm_status_{k}", f"{text} ({self.alarms.counts[k]})")
+            dpg.configure_item(f"alarm_status_{k}", color=color)
+        active = int(self.alarms.active.sum())
+        dpg.configure_item("alarms_tab", label=f"Alarms ({active})" if active else "Alarms")
+
+    def _spectrum_channels(self) -> list:
+        """Channels the spectrum worker should compute (explicit list or visible ones)."""
+        text = dpg.get_value("spec_channels").strip()
+        if text:
+            channels = parse_channel_list(text)
+        else:
+            channels = [i for i, c in enumerate(self.channel_configs) if c.visible]
+        if dpg.get_value("spec_waterfall"):
+            wf_channel = dpg.get_value("spec_wf_channel")
+            if wf_channel not in channels:
+                channels.append(wf_channel)
+        return channels
+
+    def _on_spectrum_setting(self, sender=None, app_data=None):
+        """Apply Spectrum tab settings to the worker thread."""
+        worker = self.spectrum
+        worker.channels = self._spectrum_channels()
+        # Any waterfall setting change starts a new image on the next spectrum
+        self._delete_waterfall()
+        show_waterfall = dpg.get_value("spec_waterfall")
+        dpg.configure_item("wf_plot", show=show_waterfall)
+        dpg.configure_item("spec_plot", height=-int(300 * self.ui_scale) if show_waterfall else -1)
+        worker.nperseg = int(dpg.get_value("spec_nperseg"))
+        worker.averages = max(1, dpg.get_value("spec_averages"))
+        worker.enabled = dpg.get_value("spec_run")
+        if worker.enabled:
+            worker.start()
+
+    def _update_spectrum(self):
+        """Show the latest spectrum posted by the worker thread."""
+        worker = self.spectrum
+        if not worker.enabled:
+            return
+        if not dpg.get_value("spec_channels").strip():
+            # Follow channel visibility when no explicit list is given
+            worker.channels = self._spectrum_channels()
+        result_id, result = worker.get_result()
+        if result is None or result_id == self.spectrum_result_id:
+            return
+        self.spectrum_result_id = result_id
+        freqs = result["freqs"].tolist()
+        shown = set(result["channels"])
+        for row, ch in enumerate(result["channels"]):
+            tag = f"spec_series_{ch}"
+            cfg = self.channel_configs[ch] if ch < len(self.channel_configs) else ChannelConfig(name=f"Ch{ch}")
+            psd = result["psd_db"][row].tolist()
+            if not dpg.does_item_exist(tag):
+                dpg.add_line_series(freqs, psd, label=cfg.name or f"Ch{ch}", tag=tag, parent="spec_y_axis")
+            else:
+                dpg.set_value(tag, [freqs, psd])
+                dpg.configure_item(tag, label=cfg.name or f"Ch{ch}", show=True)
+            dpg.bind_item_theme(tag, self._create_line_theme(cfg.color))
+        for tag in dpg.get_item_children("spec_y_axis", 1):
+            alias = dpg.get_item_alias(tag)
+            if alias.startswith("spec_series_") and int(alias.rsplit("_", 1)[1]) not in shown:
+                dpg.configure_item(tag, show=False)
+        dpg.set_value("spec_info", f"fs {result['fs']:.0f} Hz  "
+                                   f"res {result['fs'] / worker.nperseg:.2f} Hz  avg {result['segments']}")
+
+        wf_channel = dpg.get_value("spec_wf_channel")
+        if dpg.get_value("spec_waterfall") and wf_channel in shown:
+            psd_db = result["psd_db"][result["channels"].index(wf_channel)]
+            if self.waterfall is None or self.waterfall.bins != len(psd_db):
+                self._create_waterfall(len(psd_db))
+            self.waterfall.add_column(psd_db)
+            self._place_waterfall(result["freqs"][-1])
+
+    def _create_waterfall(self, bins: int):
+        """Create the waterfall ring image and its raw texture."""
+        self._delete_waterfall()
+        depth = max(10, dpg.get_value("spec_wf_depth"))
+        self.waterfall = Waterfall(bins, depth, dpg.get_value("spec_wf_colormap"), dpg.get_value("spec_wf_range"))
+        # Raw textures read the NumPy buffer directly: column writes need no set_value
+        dpg.add_raw_texture(depth, bins, self.waterfall.pixels.reshape(-1), format=dpg.mvFormat_Float_rgb,
+                            tag="wf_texture", parent="texture_registry")
+        for tag in ("wf_image_old", "wf_image_new"):
+            dpg.add_image_series("wf_texture", [0, 0], [1, 1], tag=tag, parent="wf_y_axis")
+
+    def _delete_waterfall(self):
+        for tag in ("wf_image_old", "wf_image_new", "wf_texture"):
+            if dpg.does_item_exist(tag):
+                dpg.delete_item(tag)
+        self.waterfall = None
+
+    def _place_waterfall(self, max_freq: float):
+        """Position both halves of the ring so the newest column is at x = 0."""
+        wf = self.waterfall
+        period = 1.0 / self.spectrum.update_rate
+        for tag, (c0, c1, age0, age1) in zip(("wf_image_old", "wf_image_new"), wf.ring_segments()):
+            # Texture row 0 is the DC bin, so flip V to put it at the bottom
+            dpg.configure_item(tag, show=c1 > c0,
+                               bounds_min=(-age0 * period, 0.0), bounds_max=(-age1 * period, max_freq),
+                               uv_min=(c0 / wf.depth, 1.0), uv_max=(c1 / wf.depth, 0.0))
+
     def _on_time_input(self, sender, value):
         """Handle manual time window input."""
         if value > 0:
-            self.time_window = min(value, 300.0)
+            limit = MAX_HISTORY_TIME_WINDOW if self.data_buffer.history is not None else MAX_TIME_WINDOW
+            self.time_window = min(value, limit)
+            self.stats.set_window(self.time_window)
             dpg.set_value("time_slider", self.time_window)
-
-    def _send_command(self, button: CommandButton):
+            dpg.set_value("time_input", self.time_window)
+
+    def _on_time_slider(self, sender, value):
+        """Handle time window slider changes."""
+        self.time_window = value
+        self.stats.set_window(value)
+
+    def _on_history_mode(self, sender, value):
+        """Switch the history tier behind the in-memory ring buffer (the live one while browsing a snapshot)."""
+        buffer = self.live_state[0] if self.snapshot_path else self.data_buffer
+        if value == "Compressed":
+            buffer.set_history(CompressedHistory())
+        elif value == "Disk":
+            try:
+                buffer.set_history(DiskHistory(self.config.history_dir))
+            except OSError as e:
+                print(f"Error creating disk history: {e}")
+                value = "Off"
+        if value == "Off":
+            buffer.set_history(None)
+            if not self.snapshot_path:  # The snapshot keeps its own tier; _close_snapshot clamps
+                self.view_offset = 0.0
+                if self.time_window > MAX_TIME_WINDOW:
+                    self._on_time_input(None, MAX_TIME_WINDOW)
+        self.config.history_mode = value
+        if dpg.does_item_exist("history_combo"):
+            dpg.set_value("history_combo", value)
+
+    def _on_view_offset(self, sender, value):
+        """Scroll the view back in time (seconds before live/paused time)."""
+        self.view_offset = max(0.0, value)
+
+    def _go_live(self):
+        """Reset the history pan so the view follows the newest data."""
+        self.view_offset = 0.0
+        dpg.set_value("view_offset_slider", 0.0)
+
+    def _send_command(self, button: CommandButton, values: list = ()):
         if button is None:
             print("Error: button is None")
             return
-        if button.mode == "hex":
-            try:
-                hex_str = button.data.replace("0x", "").replace(" ", "").replace(",", "")
-                data = bytes.fromhex(hex_str)
-            except ValueError:
-                print(f"Invalid hex: {button.data}")
-                return
-        else:
-            data = button.data.encode('utf-8')
+        try:
+            data = button.encode([v for v in values if v])
+        except ValueError:
+            print(f"Invalid hex: {button.data}")
+            return
         self.serial_manager.send(data)
 
     def _send_terminal_input(self, sender=None, app_data=None):
@@ -1077,15 +5411,19 @@ class DragoonPlotApp:
                 if cat in categories:
                     # Category header - use verbatim name from device
                     dpg.add_text(cat, color=(150, 200, 255), parent="cmd_buttons_group")
-                    # Buttons in a horizontal flow
+                    # Buttons in a horizontal flow, then one row per command with arguments
                     with dpg.group(horizontal=True, parent="cmd_buttons_group"):
                         for i, btn in categories[cat]:
-                            dpg.add_button(
-                                label=btn.label,
-                                callback=lambda s, a, u: self._send_command(u),
-                                user_data=btn,
-                                width=self._sz(70),
-                            )
+                            if not btn.args:
+                                dpg.add_button(
+                                    label=btn.label,
+                                    callback=lambda s, a, u: self._send_command(u),
+                                    user_data=btn,
+                                    width=self._sz(70),
+                                )
+                    for i, btn in categories[cat]:
+                        if btn.args:
+                            self._add_command_with_args(btn)
                     dpg.add_spacer(height=5, parent="cmd_buttons_group")
 
             # Render any uncategorized buttons as simple buttons
@@ -1094,91 +5432,172 @@ class DragoonPlotApp:
                     dpg.add_text("Other", color=(150, 200, 255), parent="cmd_buttons_group")
                 with dpg.group(horizontal=True, parent="cmd_buttons_group"):
                     for i, btn in uncategorized:
-                        dpg.add_button(
-                            label=btn.label,
-                            callback=lambda s, a, u: self._send_command(u),
-                            user_data=btn,
-                            width=self._sz(70),
-                        )
+                        if not btn.args:
+                            dpg.add_button(
+                                label=btn.label,
+                                callback=lambda s, a, u: self._send_command(u),
+                                user_data=btn,
+                                width=self._sz(70),
+                            )
+                for i, btn in uncategorized:
+                    if btn.args:
+                        self._add_command_with_args(btn)
+
+    def _add_command_with_args(self, btn: CommandButton):
+        """Button plus one input per argument; the inputs are sent after the command."""
+        with dpg.group(horizontal=True, parent="cmd_buttons_group"):
+            button = dpg.add_button(label=btn.label, width=self._sz(70))
+            inputs = [dpg.add_input_text(hint=name, width=self._sz(50), on_enter=True) for name in btn.args]
+
+            def send(sender, app_data, user_data):
+                self._send_command(user_data, [dpg.get_value(item).strip() for item in inputs])
+
+            dpg.set_item_callback(button, send)
+            dpg.set_item_user_data(button, btn)
+            for item in inputs:
+                dpg.set_item_callback(item, send)
+                dpg.set_item_user_data(item, btn)
 
     def _on_channel_visible(self, sender, value, user_data):
         idx = user_data
-        if 0 <= idx < len(self.channel_configs):
-            self.channel_configs[idx].visible = value
+        cfg = self._channel_config(idx)
+        if cfg is not None:
+            cfg.visible = value
             # Immediately hide/show the series so Y-axis rescales on next frame
             series_tag = f"series_{idx}"
-            if dpg.does_item_exist(series_tag):
+            if dpg.does_item_exist(series_tag) and self.persistence is None:
                 dpg.configure_item(series_tag, show=value)
 
     def _on_channel_color(self, sender, value, user_data):
         idx = user_data
-        if 0 <= idx < len(self.channel_configs):
+        cfg = self._channel_config(idx)
+        if cfg is not None:
             # DearPyGui color_edit returns values as normalized floats 0.0-1.0
             new_color = (int(value[0] * 255), int(value[1] * 255), int(value[2] * 255))
-            self.channel_configs[idx].color = new_color
+            cfg.color = new_color
             # Apply new theme to the series immediately
             series_tag = f"series_{idx}"
             if dpg.does_item_exist(series_tag):
                 dpg.bind_item_theme(series_tag, self._create_line_theme(new_color))
 
     def _on_channel_name(self, sender, value, user_data):
-        idx = user_data
-        if 0 <= idx < len(self.channel_configs):
-            self.channel_configs[idx].name = value
+        cfg = self._channel_config(user_data)
+        if cfg is not None:
+            cfg.name = value
 
     def _on_channel_scale(self, sender, value, user_data):
-        idx = user_data
-        if 0 <= idx < len(self.channel_configs):
-            self.channel_configs[idx].scale = value
+        cfg = self._channel_config(user_data)
+        if cfg is not None:
+            cfg.scale = value
 
     def _on_channel_offset(self, sender, value, user_data):
-        idx = user_data
-        if 0 <= idx < len(self.channel_configs):
-            self.channel_configs[idx].offset = value
-
-    def _rebuild_channel_controls(self):
-        if dpg.does_item_exist("channel_controls_group"):
-            dpg.delete_item("channel_controls_group", children_only=True)
-            for i, cfg in enumerate(self.channel_configs):
-                with dpg.group(horizontal=True, parent="channel_controls_group"):
-                    dpg.add_checkbox(
-                        default_value=cfg.visible,
-                        callback=self._on_channel_visible,
-                        user_data=i,
-                    )
-                    dpg.add_color_edit(
-                        default_value=(*cfg.color, 255),
-                        callback=self._on_channel_color,
-                        user_data=i,
-                        no_alpha=True,
-                        no_inputs=True,
-                        width=self._sz(30),
-                    )
-                    dpg.add_input_text(
-                        default_value=cfg.name,
-                        width=self._sz(70),
-                        callback=self._on_channel_name,
-                        user_data=i,
-                        on_enter=True,
-                    )
-                    dpg.add_input_float(
-                        default_value=cfg.scale,
-                        width=self._sz(50),
-                        callback=self._on_channel_scale,
-                        user_data=i,
-                        format="%.2f",
-                        step=0,
-                        on_enter=True,
-                    )
-                    dpg.add_input_float(
-                        default_value=cfg.offset,
-                        width=self._sz(50),
-                        callback=self._on_channel_offset,
-                        user_data=i,
-                        format="%.1f",
-                        step=0,
-                        on_enter=True,
-                    )
+        cfg = self._channel_config(user_data)
+        if cfg is not None:
+            cfg.offset = value
+
+    def _channel_row_state(self, cfg: ChannelConfig) -> tuple:
+        return (cfg.visible, tuple(cfg.color), cfg.name, cfg.scale, cfg.offset, cfg.expression)
+
+    def _add_channel_row(self, i: int, cfg: ChannelConfig, before: Union[int, str]):
+        """Create the control row for buffer index i inside the channel clipper."""
+        with dpg.group(horizontal=True, tag=f"chrow_{i}", parent="channel_clipper", before=before):
+            dpg.add_checkbox(
+                tag=f"chvis_{i}",
+                default_value=cfg.visible,
+                callback=self._on_channel_visible,
+                user_data=i,
+            )
+            dpg.add_color_edit(
+                tag=f"chcolor_{i}",
+                default_value=(*cfg.color, 255),
+                callback=self._on_channel_color,
+                user_data=i,
+                no_alpha=True,
+                no_inputs=True,
+                width=self._sz(30),
+            )
+            dpg.add_input_text(
+                tag=f"chname_{i}",
+                default_value=cfg.name,
+                width=self._sz(70),
+                callback=self._on_channel_name,
+                user_data=i,
+                on_enter=True,
+            )
+            dpg.add_input_float(
+                tag=f"chscale_{i}",
+                default_value=cfg.scale,
+                width=self._sz(50),
+                callback=self._on_channel_scale,
+                user_data=i,
+                format="%.2f",
+                step=0,
+                on_enter=True,
+            )
+            dpg.add_input_float(
+                tag=f"choffset_{i}",
+                default_value=cfg.offset,
+                width=self._sz(50),
+                callback=self._on_channel_offset,
+                user_data=i,
+                format="%.1f",
+                step=0,
+                on_enter=True,
+            )
+            if i < MAX_CHANNELS:
+                dpg.add_button(label="F", callback=self._open_filter_window, user_data=i)
+            else:
+                # Derived channel: expression (chN = raw device channel values) and remove button
+                dpg.add_input_text(
+                    tag=f"chexpr_{i}",
+                    default_value=cfg.expression,
+                    width=self._sz(120),
+                    callback=self._on_derived_expression,
+                    user_data=i,
+                    on_enter=True,
+                    hint="ch0*ch1*0.001",
+                )
+                dpg.add_button(label="x", callback=self._remove_derived_channel, user_data=i)
+
+    def _update_channel_controls(self):
+        """Bring the Channels panel in line with the channel configs.
+
+        Rows are keyed by buffer index and kept between calls: new channels get
+        a new row, rows of channels that went away are deleted, and existing rows
+        only get set_value calls for the fields that changed (e.g. a label frame
+        renaming two channels touches two widgets, not the whole panel). The rows
+        sit in a clipper, so only the visible ones are laid out each frame.
+        """
+        if not dpg.does_item_exist("channel_clipper"):
+            return
+        wanted = self._plot_channels()
+        wanted_idx = {i for i, _ in wanted}
+        for i in [i for i in self.channel_rows if i not in wanted_idx]:
+            if dpg.does_item_exist(f"chrow_{i}"):
+                dpg.delete_item(f"chrow_{i}")
+            del self.channel_rows[i]
+
+        # Derived rows sort after device rows, so a device channel appearing late
+        # is inserted before the first existing derived row
+        first_derived = min((i for i in self.channel_rows if i >= MAX_CHANNELS), default=None)
+        for i, cfg in wanted:
+            state = self._channel_row_state(cfg)
+            old = self.channel_rows.get(i)
+            if old is None:
+                before = f"chrow_{first_derived}" if i < MAX_CHANNELS and first_derived is not None else 0
+                self._add_channel_row(i, cfg, before)
+            elif old != state:
+                for tag, new, prev in (
+                    (f"chvis_{i}", state[0], old[0]),
+                    (f"chcolor_{i}", (*state[1], 255), (*old[1], 255)),
+                    (f"chname_{i}", state[2], old[2]),
+                    (f"chscale_{i}", state[3], old[3]),
+                    (f"choffset_{i}", state[4], old[4]),
+                    (f"chexpr_{i}", state[5], old[5]),
+                ):
+                    if new != prev and dpg.does_item_exist(tag):
+                        dpg.set_value(tag, new)
+            self.channel_rows[i] = state
 
     def _create_splitter_theme(self):
         """Create a theme for the horizontal splitter bar."""
@@ -1302,8 +5721,12 @@ class DragoonPlotApp:
     def _setup_gui(self):
         dpg.create_context()
 
-        # Detect and apply display scaling for HiDPI support
-        self.ui_scale = get_display_scale()
+        # Detect and apply display scaling for HiDPI support. Detection can run
+        # several external tools on Linux, so only the first start waits for it;
+        # later starts use the cached value and re-check after the first frame.
+        self.scale_cached = self.config.display_scale > 0
+        self.ui_scale = self.config.display_scale if self.scale_cached else get_display_scale()
+        self.config.display_scale = self.ui_scale
 
         # Scale viewport size
         viewport_width = int(1200 * self.ui_scale)
@@ -1348,6 +5771,26 @@ class DragoonPlotApp:
         with dpg.handler_registry(tag="global_handlers"):
             dpg.add_mouse_click_handler(button=0, callback=self._on_mouse_down)
             dpg.add_mouse_release_handler(button=0, callback=self._on_mouse_release)
+            dpg.add_mouse_wheel_handler(callback=self._on_mouse_wheel)
+
+        # Raw textures (waterfall) are created on demand
+        dpg.add_texture_registry(tag="texture_registry")
+
+        # Per-channel filter settings (opened with the F button in the Channels panel)
+        with dpg.window(tag="filter_window", label="Filter", show=False, autosize=True, no_collapse=True):
+            dpg.add_combo(FILTER_KINDS, label="Type", tag="filter_kind", default_value="Off",
+                          width=sz(110), callback=self._on_filter_setting)
+            dpg.add_input_float(label="Cutoff / center (Hz)", tag="filter_cutoff", default_value=50.0,
+                                width=sz(110), step=0, format="%.2f", on_enter=True,
+                                callback=self._on_filter_setting)
+            dpg.add_input_float(label="Q", tag="filter_q", default_value=0.707, width=sz(110), step=0,
+                                format="%.3f", on_enter=True, callback=self._on_filter_setting)
+            dpg.add_input_int(label="Length / taps", tag="filter_length", default_value=16, width=sz(110),
+                              min_value=1, min_clamped=True, on_enter=True, callback=self._on_filter_setting)
+            dpg.add_input_int(label="Decimation", tag="filter_decimate", default_value=4, width=sz(110),
+                              min_value=1, min_clamped=True, on_enter=True, callback=self._on_filter_setting)
+            dpg.add_combo(FILTER_OUTPUTS, label="Output", tag="filter_output", default_value="Replace",
+                          width=sz(110), callback=self._on_filter_setting)
 
         with dpg.window(tag="main_window"):
             # Top panel - Tabbed view (Graph and Terminal)
@@ -1371,16 +5814,38 @@ class DragoonPlotApp:
                         with dpg.group(horizontal=True):
                             dpg.add_button(label="Clear", callback=self._clear_terminal, width=sz(60))
                             dpg.add_checkbox(label="Auto-scroll", tag="terminal_autoscroll", default_value=True)
-                        with dpg.child_window(tag="terminal_scroll_container", height=-sz(30), width=-1, horizontal_scrollbar=True):
+                            dpg.add_checkbox(label="Spill to disk", tag="terminal_spill",
+                                             default_value=self.terminal.spill_file is not None,
+                                             callback=self._on_terminal_spill)
+                            dpg.add_text("0 lines", tag="terminal_lines")
+                        with dpg.group(horizontal=True):
+                            dpg.add_input_text(tag="terminal_search", hint="Search", width=sz(200),
+                                               callback=self._on_terminal_search)
+                            dpg.add_button(label="<", callback=self._terminal_find, user_data=-1, width=sz(20))
+                            dpg.add_button(label=">", callback=self._terminal_find, user_data=1, width=sz(20))
+                            dpg.add_checkbox(label="Regex", tag="terminal_regex", callback=self._on_terminal_search)
+                            dpg.add_checkbox(label="Word", tag="terminal_word", callback=self._on_terminal_search)
+                            dpg.add_checkbox(label="Filter", tag="terminal_filter")
+                            dpg.add_checkbox(label="Index", tag="terminal_index",
+                                             default_value=self.terminal.tokens is not None,
+                                             callback=self._on_terminal_index)
+                            dpg.add_text("", tag="terminal_matches")
+                        # Only the visible lines are put in the text boxes; the slider scrolls the scrollback
+                        with dpg.group(horizontal=True):
+                            dpg.add_input_text(tag="terminal_gutter", multiline=True, readonly=True,
+                                               height=-sz(30), width=sz(70), tab_input=False)
                             dpg.add_input_text(
                                 tag="terminal_output",
                                 default_value="",
                                 multiline=True,
                                 readonly=True,
-                                height=100,  # Will grow dynamically based on content
-                                width=-1,
+                                height=-sz(30),
+                                width=-sz(24),
                                 tab_input=False,
                             )
+                            dpg.add_slider_int(tag="terminal_slider", vertical=True, min_value=0, max_value=0,
+                                               height=-sz(30), width=sz(18), format="",
+                                               callback=self._on_terminal_slider)
                         with dpg.group(horizontal=True):
                             dpg.add_input_text(
                                 tag="terminal_input",
@@ -1407,7 +5872,23 @@ class DragoonPlotApp:
                             dpg.add_input_text(tag="dfu_address", default_value="0x08004000", width=sz(100))
                             dpg.add_button(label="Enter DFU", callback=self._enter_dfu_mode, width=sz(80))
                             dpg.add_button(label="Flash", callback=self._flash_dfu, width=sz(60))
+                        with dpg.group(horizontal=True):
+                            dpg.add_checkbox(label="Skip identical", tag="dfu_skip_identical",
+                                             default_value=self.config.dfu_skip_identical)
+                            dpg.add_text("", tag="dfu_image_info", color=(150, 150, 150))
                         dpg.add_text("", tag="dfu_status", color=(200, 200, 200))
+                        # Batch flashing: several devices in parallel
+                        with dpg.group(horizontal=True):
+                            dpg.add_button(label="Scan", callback=self._scan_dfu_devices, width=sz(60))
+                            dpg.add_text("Parallel:")
+                            dpg.add_input_int(tag="dfu_parallel", default_value=self.config.dfu_parallel,
+                                              min_value=1, min_clamped=True, width=sz(80))
+                            dpg.add_button(label="Flash all", callback=self._flash_all_dfu, width=sz(70))
+                            dpg.add_button(label="Cancel", callback=lambda: self.dfu_queue.cancel(), width=sz(60))
+                        with dpg.table(tag="dfu_table", header_row=True, resizable=True, borders_innerH=True,
+                                       borders_outerH=True, scrollY=True, row_background=True, height=sz(150)):
+                            for label in ("On", "Serial", "Path", "Progress", "Result"):
+                                dpg.add_table_column(label=label)
                         with dpg.child_window(tag="dfu_output_container", height=-1, width=-1):
                             dpg.add_text(
                                 tag="dfu_output",
@@ -1416,6 +5897,197 @@ class DragoonPlotApp:
                                 track_offset=1.0,
                             )
 
+                    # Scope tab - triggered capture of repeating events
+                    trig = self.config.trigger
+                    with dpg.tab(label="Scope", tag="scope_tab"):
+                        with dpg.group(horizontal=True):
+                            dpg.add_combo(tag="trig_channel", items=[], width=sz(110),
+                                          callback=self._on_trigger_setting)
+                            dpg.add_combo(tag="trig_mode", items=TRIGGER_MODES, width=sz(80),
+                                          default_value=trig.get("mode", "Rising"),
+                                          callback=self._on_trigger_setting)
+                            dpg.add_text("Level")
+                            dpg.add_input_float(tag="trig_level", default_value=trig.get("level", 0.0),
+                                                width=sz(70), step=0, format="%.2f", on_enter=True,
+                                                callback=self._on_trigger_setting)
+                            dpg.add_text("Width")
+                            dpg.add_input_int(tag="trig_width", default_value=trig.get("width", 10),
+                                              width=sz(60), step=0, on_enter=True,
+                                              callback=self._on_trigger_setting)
+                            dpg.add_text("Pre")
+                            dpg.add_input_int(tag="trig_pre", default_value=trig.get("pre", 100),
+                                              width=sz(60), step=0, on_enter=True,
+                                              callback=self._on_trigger_setting)
+                            dpg.add_text("Post")
+                            dpg.add_input_int(tag="trig_post", default_value=trig.get("post", 400),
+                                              width=sz(60), step=0, on_enter=True,
+                                              callback=self._on_trigger_setting)
+                            dpg.add_combo(tag="trig_sweep", items=TRIGGER_SWEEPS, width=sz(70),
+                                          default_value=trig.get("sweep", "Normal"),
+                                          callback=self._on_trigger_setting)
+                            dpg.add_button(label="Arm", tag="trig_arm_btn", callback=self._toggle_trigger,
+                                           width=sz(50))
+                            dpg.add_text("Stopped", tag="trig_status", color=(200, 200, 200))
+                        with dpg.plot(tag="scope_plot", height=-1, width=-1, anti_aliased=True):
+                            dpg.add_plot_legend(no_buttons=True)
+                            dpg.add_plot_axis(dpg.mvXAxis, label="Samples", tag="scope_x_axis")
+                            dpg.add_plot_axis(dpg.mvYAxis, label="Value", tag="scope_y_axis", auto_fit=True)
+                            dpg.add_drag_line(tag="scope_trigger_line", vertical=True, default_value=0.0,
+                                              color=(150, 150, 150, 255))
+                            # Dragging the level marker sets the trigger level
+                            dpg.add_drag_line(tag="scope_level_line", vertical=False,
+                                              default_value=trig.get("level", 0.0), color=(255, 200, 0, 255),
+                                              callback=self._on_scope_level_drag)
+
+                    # Alarms tab - threshold rules evaluated on every block
+                    with dpg.tab(label="Alarms", tag="alarms_tab"):
+                        with dpg.group(horizontal=True):
+                            dpg.add_button(label="Add rule", callback=self._add_alarm_rule, width=sz(80))
+                            dpg.add_text(f"Events are written to the terminal and {ALARM_LOG_FILE}",
+                                         color=(150, 150, 150))
+                        with dpg.table(tag="alarm_table", header_row=True, resizable=True,
+                                       borders_innerH=True, borders_outerH=True, scrollY=True,
+                                       row_background=True, height=-1):
+                            for label in ("Channel", "Type", "Low", "High", "Hysteresis", "Min s", "On",
+                                          "Status", ""):
+                                dpg.add_table_column(label=label)
+
+                    # Macros tab - scripted command sequences run on a background thread
+                    with dpg.tab(label="Macros", tag="macros_tab"):
+                        with dpg.group(horizontal=True):
+                            dpg.add_combo([], tag="macro_select", width=sz(160), callback=self._on_macro_select)
+                            dpg.add_button(label="New", callback=self._new_macro, width=sz(50))
+                            dpg.add_button(label="Delete", callback=self._delete_macro, width=sz(60))
+                            dpg.add_button(label="Run", tag="macro_run", callback=self._run_macro, width=sz(50))
+                            dpg.add_button(label="Stop", tag="macro_stop", enabled=False,
+                                           callback=lambda: self.macro_runner.stop(), width=sz(50))
+                            dpg.add_text("", tag="macro_status")
+                        dpg.add_input_text(label="Name", tag="macro_name", width=sz(160), on_enter=True,
+                                           callback=self._on_macro_field, user_data="name")
+                        dpg.add_text("send <text> | hex <bytes> | button <label> | delay <ms> | timeout <ms> | "
+                                     "wait_text <regex> | wait_channel <ch> <op> <value> | repeat [n] ... end",
+                                     color=(150, 150, 150))
+                        dpg.add_input_text(tag="macro_script", multiline=True, width=-1, height=-1, tab_input=True,
+                                           callback=self._on_macro_field, user_data="script")
+
+                    # Stats tab - streaming per-channel statistics
+                    with dpg.tab(label="Stats", tag="stats_tab"):
+                        with dpg.group(horizontal=True):
+                            dpg.add_button(label="Reset", callback=self._reset_stats, width=sz(60))
+                            dpg.add_text("", tag="stats_rate")
+                        dpg.add_text("Min/Max over the X axis window; Mean/Std/RMS since reset",
+                                     color=(150, 150, 150))
+                        with dpg.table(tag="stats_table", header_row=True, resizable=True,
+                                       borders_innerH=True, borders_outerH=True, scrollY=True,
+                                       row_background=True, height=-1):
+                            dpg.add_table_column(label="Channel")
+                            for key in STATS_COLUMNS:
+                                dpg.add_table_column(label=key.capitalize())
+
+                    # Spectrum tab - Welch PSD computed in a worker thread
+                    spec = self.config.spectrum
+                    with dpg.tab(label="Spectrum", tag="spectrum_tab"):
+                        with dpg.group(horizontal=True):
+                            dpg.add_checkbox(label="Run", tag="spec_run", default_value=spec.get("run", False),
+                                             callback=self._on_spectrum_setting)
+                            dpg.add_text("Channels")
+                            dpg.add_input_text(tag="spec_channels", default_value=spec.get("channels", ""),
+                                               hint="visible", width=sz(90), on_enter=True,
+                                               callback=self._on_spectrum_setting)
+                            dpg.add_text("FFT")
+                            dpg.add_combo(tag="spec_nperseg", items=[str(n) for n in FFT_SIZES],
+                                          default_value=str(spec.get("nperseg", 1024)), width=sz(70),
+                                          callback=self._on_spectrum_setting)
+                            dpg.add_text("Averages")
+                            dpg.add_input_int(tag="spec_averages", default_value=spec.get("averages", 8),
+                                              width=sz(60), step=0, on_enter=True,
+                                              callback=self._on_spectrum_setting)
+                            dpg.add_text("", tag="spec_info", color=(150, 150, 150))
+                        with dpg.group(horizontal=True):
+                            dpg.add_checkbox(label="Waterfall", tag="spec_waterfall",
+                                             default_value=spec.get("waterfall", False),
+                                             callback=self._on_spectrum_setting)
+                            dpg.add_text("Ch")
+                            dpg.add_input_int(tag="spec_wf_channel", default_value=spec.get("wf_channel", 0),
+                                              width=sz(40), step=0, min_value=0, min_clamped=True,
+                                              on_enter=True, callback=self._on_spectrum_setting)
+                            dpg.add_text("Depth")
+                            dpg.add_input_int(tag="spec_wf_depth", default_value=spec.get("wf_depth", 500),
+                                              width=sz(60), step=0, on_enter=True,
+                                              callback=self._on_spectrum_setting)
+                            dpg.add_text("Range dB")
+                            dpg.add_input_float(tag="spec_wf_range", default_value=spec.get("wf_range", 80.0),
+                                                width=sz(60), step=0, format="%.0f", on_enter=True,
+                                                callback=self._on_spectrum_setting)
+                            dpg.add_combo(tag="spec_wf_colormap", items=list(WATERFALL_COLORMAPS),
+                                          default_value=spec.get("wf_colormap", "Viridis"), width=sz(80),
+                                          callback=self._on_spectrum_setting)
+                        with dpg.plot(tag="spec_plot", height=-1, width=-1, anti_aliased=True):
+                            dpg.add_plot_legend(no_buttons=True)
+                            dpg.add_plot_axis(dpg.mvXAxis, label="Hz", tag="spec_x_axis", auto_fit=True)
+                            dpg.add_plot_axis(dpg.mvYAxis, label="dB", tag="spec_y_axis", auto_fit=True)
+                        with dpg.plot(tag="wf_plot", height=-1, width=-1, show=False):
+                            dpg.add_plot_axis(dpg.mvXAxis, label="s", tag="wf_x_axis", auto_fit=True)
+                            dpg.add_plot_axis(dpg.mvYAxis, label="Hz", tag="wf_y_axis", auto_fit=True)
+
+                    # Histogram tab - incremental value histogram per channel
+                    hist = self.config.histogram
+                    with dpg.tab(label="Histogram", tag="histogram_tab"):
+                        with dpg.group(horizontal=True):
+                            dpg.add_checkbox(label="Run", tag="hist_run", default_value=hist.get("run", False),
+                                             callback=self._on_histogram_setting)
+                            dpg.add_combo(tag="hist_channel", items=[], width=sz(120),
+                                          callback=lambda: setattr(self, "histogram_time", 0.0))
+                            dpg.add_text("Window (s)")
+                            dpg.add_input_float(tag="hist_window", default_value=hist.get("window", 0.0),
+                                                width=sz(60), step=0, format="%.1f", on_enter=True,
+                                                callback=self._on_histogram_setting)
+                            dpg.add_text("Bins")
+                            dpg.add_input_int(tag="hist_bins", default_value=hist.get("bins", 256),
+                                              width=sz(60), step=0, min_value=1, min_clamped=True)
+                            dpg.add_button(label="Reset", tag="hist_reset", callback=self._on_histogram_setting)
+                        dpg.add_text("", tag="hist_info", color=(150, 150, 150))
+                        with dpg.plot(tag="hist_plot", height=-1, width=-1):
+                            dpg.add_plot_axis(dpg.mvXAxis, label="Value", tag="hist_x_axis", auto_fit=True)
+                            dpg.add_plot_axis(dpg.mvYAxis, label="Count", tag="hist_y_axis", auto_fit=True)
+
+                    # XY tab - one channel against another over the Graph's time window
+                    xy = self.config.xy
+                    with dpg.tab(label="XY", tag="xy_tab"):
+                        with dpg.group(horizontal=True):
+                            dpg.add_text("X")
+                            dpg.add_combo(tag="xy_x", items=[], default_value=xy.get("x", ""), width=sz(120),
+                                          callback=self._on_xy_setting)
+                            dpg.add_text("Y")
+                            dpg.add_combo(tag="xy_y", items=[], default_value=xy.get("y", ""), width=sz(120),
+                                          callback=self._on_xy_setting)
+                            dpg.add_checkbox(label="Lines", tag="xy_lines", default_value=xy.get("lines", False),
+                                             callback=self._on_xy_setting)
+                            dpg.add_checkbox(label="Equal axes", tag="xy_equal", default_value=xy.get("equal", False),
+                                             callback=self._on_xy_setting)
+                            dpg.add_text("", tag="xy_info", color=(150, 150, 150))
+                        with dpg.plot(tag="xy_plot", height=-1, width=-1, equal_aspects=xy.get("equal", False)):
+                            dpg.add_plot_axis(dpg.mvXAxis, label="X", tag="xy_x_axis", auto_fit=True)
+                            dpg.add_plot_axis(dpg.mvYAxis, label="Y", tag="xy_y_axis", auto_fit=True)
+
+                    # Stream tab - fan-out server for external consumers
+                    with dpg.tab(label="Stream", tag="stream_tab"):
+                        with dpg.group(horizontal=True):
+                            dpg.add_text("Address:")
+                            dpg.add_input_text(
+                                tag="stream_address",
+                                default_value=self.config.stream_address,
+                                hint="host:port or unix:/path/to/socket",
+                                width=sz(250),
+                            )
+                            dpg.add_button(label="Start Server", tag="stream_btn",
+                                           callback=self._toggle_stream_server, width=sz(100))
+                        dpg.add_text("Stopped", tag="stream_status", color=(200, 200, 200))
+                        dpg.add_text("Clients connect via raw TCP/Unix socket or WebSocket. See PROTOCOL.md.",
+                                     color=(150, 150, 150))
+                        with dpg.child_window(tag="stream_clients_container", height=-1, width=-1):
+                            dpg.add_text(tag="stream_clients", default_value="")
+
             # Splitter bar - draggable divider
             dpg.add_button(tag="splitter_bar", label="", height=sz(10), width=-1)
             dpg.bind_item_theme("splitter_bar", self._create_splitter_theme())
@@ -1433,12 +6105,16 @@ class DragoonPlotApp:
                             width=-1,
                         )
                         dpg.add_button(label="Refresh", callback=self._refresh_ports, width=-1)
-                        dpg.add_combo(
-                            tag="baud_combo",
-                            items=[str(b) for b in BAUD_RATES],
-                            default_value=str(self.config.last_baud),
-                            width=-1,
-                        )
+                        with dpg.group(horizontal=True):
+                            dpg.add_input_text(tag="baud_input", default_value=str(self.config.last_baud),
+                                               decimal=True, hint="Baud", width=-sz(24))
+                            dpg.add_combo(tag="baud_combo", items=[str(b) for b in BAUD_RATES], no_preview=True,
+                                          callback=self._on_baud_preset, width=-1)
+                        dpg.add_checkbox(label="Auto-reconnect", tag="auto_reconnect",
+                                         default_value=self.config.auto_reconnect, callback=self._on_auto_reconnect)
+                        with dpg.group(horizontal=True):
+                            dpg.add_button(label="Ping", callback=self._measure_latency, width=sz(40))
+                            dpg.add_text("", tag="latency_text")
                         with dpg.table(header_row=False, borders_innerV=False, borders_outerV=False,
                                        borders_innerH=False, borders_outerH=False):
                             dpg.add_table_column(width_stretch=True)
@@ -1454,6 +6130,9 @@ class DragoonPlotApp:
                             with dpg.table_row():
                                 dpg.add_button(label="Pause", tag="pause_btn", callback=self._toggle_pause, width=-1)
                                 dpg.add_button(label="Log", tag="log_btn", callback=self._toggle_logging, width=-1)
+                            with dpg.table_row():
+                                dpg.add_button(label="Snapshot", callback=self._save_snapshot, width=-1)
+                                dpg.add_button(label="Open", callback=self._browse_snapshot, width=-1)
                         dpg.add_text("Disconnected", tag="status_text", color=(255, 100, 100))
 
                     # Vertical splitter 0
@@ -1468,7 +6147,7 @@ class DragoonPlotApp:
                             default_value=self.time_window,
                             min_value=1.0,
                             max_value=300.0,
-                            callback=lambda s, a: setattr(self, 'time_window', a),
+                            callback=self._on_time_slider,
                             width=-1,
                             format="%.0f sec",
                         )
@@ -1480,6 +6159,40 @@ class DragoonPlotApp:
                             format="%.1f",
                             step=1.0,
                         )
+                        with dpg.group(horizontal=True):
+                            dpg.add_combo(
+                                tag="history_combo",
+                                items=HISTORY_MODES,
+                                default_value="Off",
+                                callback=self._on_history_mode,
+                                width=sz(80),
+                            )
+                            dpg.add_button(label="Live", callback=self._go_live, width=-1)
+                        dpg.add_slider_float(
+                            tag="view_offset_slider",
+                            default_value=0.0,
+                            min_value=0.0,
+                            max_value=1.0,
+                            callback=self._on_view_offset,
+                            width=-1,
+                            format="-%.1f sec",
+                        )
+                        with dpg.group(horizontal=True):
+                            dpg.add_checkbox(
+                                label="Persist",
+                                tag="persist_check",
+                                default_value=self.config.persistence,
+                                callback=self._on_persistence,
+                            )
+                            dpg.add_input_float(
+                                tag="persist_decay",
+                                default_value=self.config.persistence_decay,
+                                width=-1,
+                                callback=self._on_persistence,
+                                format="%.2f s",
+                                step=0,
+                                on_enter=True,
+                            )
 
                     # Vertical splitter 1
                     dpg.add_button(tag="vsplitter_1", label="", width=sz(6), height=-1)
@@ -1489,7 +6202,9 @@ class DragoonPlotApp:
                     with dpg.child_window(tag="section_channels", width=self.section_widths[2], height=-1, border=False):
                         dpg.add_text("Channels (Vis|Color|Name|Scale|Offset)", color=(200, 200, 255))
                         with dpg.child_window(tag="channels_window", height=-1, width=-1):
-                            dpg.add_group(tag="channel_controls_group")
+                            with dpg.group(tag="channel_controls_group"):
+                                dpg.add_clipper(tag="channel_clipper")
+                                dpg.add_button(label="+ Math", callback=self._add_derived_channel)
 
                     # Vertical splitter 2
                     dpg.add_button(tag="vsplitter_2", label="", width=sz(6), height=-1)
@@ -1507,13 +6222,31 @@ class DragoonPlotApp:
         dpg.setup_dearpygui()
         dpg.show_viewport()
 
-        self._refresh_ports()
+        # Port list arrives from the monitor thread (port_combo starts at the last port)
+        self.port_monitor.start()
         self._rebuild_command_buttons()
 
-        # Restore last port selection if available
-        ports = SerialManager.list_ports()
-        if self.config.last_port in ports:
-            dpg.set_value("port_combo", self.config.last_port)
+        # Start the spectrum worker if it was running last session
+        self._on_spectrum_setting()
+        self._on_histogram_setting()
+        self._on_persistence()
+        self._rebuild_alarm_rows()
+        self._refresh_macro_list()
+        self._hash_firmware()
+
+        # Restore trigger settings (Width/Pre/Post/Level are set via default_value)
+        self.trigger.channel = self.config.trigger.get("channel", 0)
+        self._on_trigger_setting()
+
+        # Restore the history tier from the last session
+        if self.config.history_mode != "Off":
+            self._on_history_mode(None, self.config.history_mode)
+        elif self.time_window > MAX_TIME_WINDOW:
+            self._on_time_input(None, MAX_TIME_WINDOW)
+
+        # Restart the stream server if it was running last session
+        if self.config.stream_enabled:
+            self._toggle_stream_server()
 
     def _downsample_minmax(self, timestamps: np.ndarray, values: np.ndarray, max_points: int = 2000) -> tuple:
         """Downsample data while preserving min/max peaks in each bin."""
@@ -1559,57 +6292,84 @@ class DragoonPlotApp:
         y_max = float('-inf')
         has_visible_data = False
 
-        # Update each channel
-        num_channels = max(len(self.channel_configs), self.data_buffer.get_channel_count())
         # Use frozen time when paused, otherwise current time
         if self.plot_paused and hasattr(self, 'paused_time'):
             current_time = self.paused_time
         else:
             current_time = time.time() - self.data_buffer.start_time
 
-        for i in range(num_channels):
-            series_tag = f"series_{i}"
+        # Keep the history pan range in step with the data available
+        oldest = self.data_buffer.oldest_time()
+        offset_max = max(0.0, current_time - self.time_window - oldest) if oldest is not None else 0.0
+        if abs(offset_max - self.view_offset_max) >= 0.5 or (offset_max == 0.0) != (self.view_offset_max == 0.0):
+            self.view_offset_max = offset_max
+            dpg.configure_item("view_offset_slider", max_value=max(offset_max, 1.0))
+
+        # Right edge of the view: live (or paused) time minus the history pan offset
+        view_offset = min(self.view_offset, self.view_offset_max)
+        view_end = current_time - view_offset
+        view_start = view_end - self.time_window
+        self.view_range = (view_start, view_end)
+
+        # Autoscale from the streaming stats (O(1) per channel) when showing live data
+        use_stats = view_offset == 0 and self.snapshot_path is None
+        if use_stats and self.stats.rebuild_needed and time.time() - self.stats.window_changed > 0.3:
+            self.stats.rebuild(self.data_buffer, current_time)
+
+        if self.persistence is not None:
+            self._update_persistence(view_start, view_end, view_offset == 0 and not self.plot_paused)
+            return
 
-            if i >= len(self.channel_configs):
-                continue
+        # Reconnect gaps in view, shifted like the timestamps below
+        gap_t = None
+        if self.gaps and self.snapshot_path is None:
+            gaps = np.array([g for g in self.gaps if g[1] > view_start and g[0] < view_end]).reshape(-1, 2)
+            if len(gaps):
+                gap_t = self.time_window - (view_end - gaps)
+        self._update_gap_markers(gap_t)
+
+        # Update each series (device channels, filter outputs, then derived channels)
+        for i, cfg, label, color in self._plot_series():
+            series_tag = f"series_{i}"
 
-            cfg = self.channel_configs[i]
-            timestamps, values = self.data_buffer.get_data(i)
+            # Range query: ring buffer for recent data, history tier for older data
+            timestamps, values = self.data_buffer.get_range(i, view_start, view_end, MAX_PLOT_POINTS)
 
             if len(timestamps) == 0:
                 if dpg.does_item_exist(series_tag):
                     dpg.configure_item(series_tag, show=False)
                 continue
 
-            # Shift timestamps so newest data is at time_window (numpy vectorized)
-            timestamps = self.time_window - (current_time - timestamps)
+            # Shift timestamps so the view's right edge is at time_window (numpy vectorized)
+            visible_t = self.time_window - (view_end - timestamps)
 
             # Apply scale and offset (numpy vectorized)
-            values = values * cfg.scale + cfg.offset
-
-            # Filter to visible time window
-            mask = (timestamps >= 0) & (timestamps <= self.time_window)
-            visible_t = timestamps[mask]
-            visible_v = values[mask]
+            visible_v = values * cfg.scale + cfg.offset
 
             # Update Y axis bounds from visible data
             if cfg.visible and len(visible_v) > 0:
-                ch_min = np.min(visible_v)
-                ch_max = np.max(visible_v)
+                bounds = self.stats.window_minmax(i, view_end) if use_stats else None
+                if bounds is not None:
+                    ch_min, ch_max = sorted((bounds[0] * cfg.scale + cfg.offset, bounds[1] * cfg.scale + cfg.offset))
+                else:
+                    ch_min = np.min(visible_v)
+                    ch_max = np.max(visible_v)
                 y_min = min(y_min, ch_min)
                 y_max = max(y_max, ch_max)
                 has_visible_data = True
 
             # Downsample for display performance
             plot_t, plot_v = self._downsample_minmax(visible_t, visible_v)
+            if gap_t is not None:
+                plot_t, plot_v = self._break_gaps(plot_t, plot_v, gap_t)
 
             # Check if series exists
             if dpg.does_item_exist(series_tag):
                 if cfg.visible and len(plot_t) > 0:
                     dpg.set_value(series_tag, [plot_t.tolist(), plot_v.tolist()])
-                    dpg.configure_item(series_tag, label=cfg.name or f"Ch{i}", show=True)
+                    dpg.configure_item(series_tag, label=label, show=True)
                     # Update theme in case color changed
-                    dpg.bind_item_theme(series_tag, self._create_line_theme(cfg.color))
+                    dpg.bind_item_theme(series_tag, self._create_line_theme(color))
                 else:
                     dpg.configure_item(series_tag, show=False)
             else:
@@ -1617,11 +6377,11 @@ class DragoonPlotApp:
                     dpg.add_line_series(
                         plot_t.tolist(),
                         plot_v.tolist(),
-                        label=cfg.name or f"Ch{i}",
+                        label=label,
                         tag=series_tag,
                         parent="y_axis",
                     )
-                    dpg.bind_item_theme(series_tag, self._create_line_theme(cfg.color))
+                    dpg.bind_item_theme(series_tag, self._create_line_theme(color))
 
         # Apply Y axis auto-scaling with padding
         if has_visible_data and y_min != float('inf'):
@@ -1631,6 +6391,98 @@ class DragoonPlotApp:
             padding = y_range * 0.10  # 10% padding
             dpg.set_axis_limits("y_axis", y_min - padding, y_max + padding)
 
+    @staticmethod
+    def _break_gaps(plot_t: np.ndarray, plot_v: np.ndarray, gap_t: np.ndarray) -> tuple:
+        """Insert a NaN point in each gap so the line is not drawn across it."""
+        idx = np.searchsorted(plot_t, gap_t[:, 1])
+        keep = (idx > 0) & (idx < len(plot_t))
+        if not keep.any():
+            return plot_t, plot_v
+        return np.insert(plot_t, idx[keep], gap_t[keep, 0]), np.insert(plot_v, idx[keep], np.nan)
+
+    def _update_gap_markers(self, gap_t: Optional[np.ndarray]):
+        """Vertical lines at the start and end of each reconnect gap in view."""
+        x = gap_t.reshape(-1).tolist() if gap_t is not None else []
+        if dpg.does_item_exist("gap_lines"):
+            if x:
+                dpg.set_value("gap_lines", [x])
+            dpg.configure_item("gap_lines", show=bool(x))
+        elif x:
+            add_lines = getattr(dpg, "add_inf_line_series", None) or dpg.add_vline_series  # Renamed in dpg 2.0
+            add_lines(x, label="Reconnect", tag="gap_lines", parent="y_axis")
+            if not dpg.does_item_exist("gap_theme"):
+                with dpg.theme(tag="gap_theme"):
+                    with dpg.theme_component(dpg.mvAll):
+                        dpg.add_theme_color(dpg.mvPlotCol_Line, (255, 200, 100, 160), category=dpg.mvThemeCat_Plots)
+            dpg.bind_item_theme("gap_lines", "gap_theme")
+
+    def _on_persistence(self, sender=None, app_data=None):
+        """Switch the Graph tab between line series and the persistence image."""
+        enabled = dpg.get_value("persist_check")
+        decay = max(dpg.get_value("persist_decay"), 0.01)
+        if enabled and self.persistence is None:
+            self.persistence = PersistenceRenderer(decay=decay)
+            for tag in dpg.get_item_children("y_axis", 1):
+                dpg.configure_item(tag, show=False)
+            dpg.add_raw_texture(PERSIST_WIDTH, PERSIST_HEIGHT, self.persistence.pixels.reshape(-1),
+                                format=dpg.mvFormat_Float_rgba, tag="persist_texture", parent="texture_registry")
+            dpg.add_image_series("persist_texture", [0, 0], [1, 1], label="Persistence",
+                                 tag="persist_image", parent="y_axis")
+        elif not enabled and self.persistence is not None:
+            self.persistence = None
+            dpg.delete_item("persist_image")
+            dpg.delete_item("persist_texture")
+        if self.persistence is not None:
+            self.persistence.decay = decay
+
+    def _update_persistence(self, view_start: float, view_end: float, live: bool):
+        """Rasterize new samples into the persistence grid and refresh its texture."""
+        r = self.persistence
+        series = [(i, cfg, color) for i, cfg, _, color in self._plot_series() if cfg.visible]
+        signature = (self.time_window, live or view_end,
+                     tuple((i, cfg.scale, cfg.offset, color) for i, cfg, color in series))
+        rebuild = signature != r.signature
+        if not rebuild and not live:
+            return  # Paused or scrolled back: the image is static
+
+        # Fetch samples: the whole view on rebuild, otherwise only what is new
+        data = []
+        for i, cfg, color in series:
+            if rebuild:
+                ts, vals = self.data_buffer.get_range(i, view_start, view_end, MAX_PLOT_POINTS * 4)
+            else:
+                ts, vals = self.data_buffer.get_range(i, r.last_t.get(i, view_start), view_end)
+                keep = ts > r.last_t.get(i, -np.inf)
+                ts, vals = ts[keep], vals[keep]
+            data.append((i, ts, vals * cfg.scale + cfg.offset, color))
+
+        values = [v for _, _, v, _ in data if len(v)]
+        if values:
+            lo = min(float(v.min()) for v in values)
+            hi = max(float(v.max()) for v in values)
+            if not rebuild and (lo < r.y_lo or hi > r.y_hi):
+                r.signature = None  # Out of range: rebuild the whole view with a new Y range next frame
+                return
+        if rebuild:
+            if values:
+                pad = (hi - lo) * 0.1 or abs(hi) * 0.1 or 1.0
+                r.reset(lo - pad, hi + pad)
+            else:
+                r.reset(0.0, 1.0)
+            r.signature = signature
+        elif r.last_end is not None:
+            r.scroll((view_end - r.last_end) * r.width / self.time_window)
+            r.fade(view_end - r.last_end)
+        r.last_end = view_end
+
+        for i, ts, vals, color in data:
+            if len(ts):
+                r.deposit((ts - view_start) / self.time_window, vals, color)
+                r.last_t[i] = float(ts[-1])
+        r.compose()
+        dpg.configure_item("persist_image", bounds_min=(0.0, r.y_lo), bounds_max=(self.time_window, r.y_hi))
+        dpg.set_axis_limits("y_axis", r.y_lo, r.y_hi)
+
     def _create_line_theme(self, color: tuple) -> str:
         """Create a theme for line color."""
         theme_tag = f"theme_{color[0]}_{color[1]}_{color[2]}"
@@ -1638,11 +6490,27 @@ class DragoonPlotApp:
             with dpg.theme(tag=theme_tag):
                 with dpg.theme_component(dpg.mvLineSeries):
                     dpg.add_theme_color(dpg.mvPlotCol_Line, (*color, 255), category=dpg.mvThemeCat_Plots)
+                with dpg.theme_component(dpg.mvScatterSeries):  # XY tab
+                    dpg.add_theme_color(dpg.mvPlotCol_MarkerFill, (*color, 255), category=dpg.mvThemeCat_Plots)
+                    dpg.add_theme_color(dpg.mvPlotCol_MarkerOutline, (*color, 255), category=dpg.mvThemeCat_Plots)
+                    dpg.add_theme_style(dpg.mvPlotStyleVar_MarkerSize, 1.5, category=dpg.mvThemeCat_Plots)
         return theme_tag
 
+    def _revalidate_display_scale(self):
+        """Re-detect the display scale in the background; a change applies on the next start."""
+        def worker():
+            scale = get_display_scale()
+            if abs(scale - self.config.display_scale) > 0.01:
+                print(f"Display scale changed to {scale:g} (was {self.config.display_scale:g}), "
+                      f"applied on next start")
+                self.config.display_scale = scale
+
+        threading.Thread(target=worker, daemon=True).start()
+
     def run(self):
         """Main application loop."""
         last_channel_count = 0
+        first_frame = True
 
         while dpg.is_dearpygui_running():
             # Process serial data batch (replaces per-frame callbacks)
@@ -1660,10 +6528,10 @@ class DragoonPlotApp:
             # Update horizontal section splitters
             self._update_h_splitters()
 
-            # Rebuild channel controls if new channels detected or labels updated
+            # Sync channel controls if new channels detected or labels updated
             current_count = len(self.channel_configs)
             if current_count != last_channel_count or self.labels_updated:
-                self._rebuild_channel_controls()
+                self._update_channel_controls()
                 last_channel_count = current_count
                 self.labels_updated = False
 
@@ -1680,18 +6548,47 @@ class DragoonPlotApp:
                         self.command_buttons = self.parsed_commands
                         self.commands_updated = True
 
+            self._update_connection()
+
             # Process terminal output queue (thread-safe GUI updates)
             self._process_terminal_queue()
+            self._update_terminal_view()
             self._process_dfu_queue()
+            self._update_dfu_jobs()
+            self._update_stream_status()
+            self._update_scope()
+            self._update_stats_table()
+            self._update_spectrum()
+            self._update_histogram()
+            self._update_xy()
+            self._update_alarms()
+            self._update_macros()
 
             dpg.render_dearpygui_frame()
 
+            if first_frame:
+                first_frame = False
+                if os.environ.get(STARTUP_BENCH_ENV):
+                    print(f"DRAGOONPLOT_FIRST_FRAME {time.time():.6f}", flush=True)
+                    dpg.stop_dearpygui()
+                elif self.scale_cached:
+                    self._revalidate_display_scale()
+
+        self.macro_runner.stop()
         self.serial_manager.disconnect()
+        self.port_monitor.stop()
+        self._close_snapshot()  # Save live channel configs, not the snapshot's
+        if not os.environ.get(STARTUP_BENCH_ENV):  # Benchmark runs must not touch the user's config
+            self._save_config()
+        self.stream_server.stop()
+        self.spectrum.stop()
+        self.data_buffer.set_history(None)  # Deletes any history spill files
+        self.terminal_search.stop()
+        self.terminal.close()
         # Close log file if still open
         if self.log_file:
             self.log_file.close()
             self.log_file = None
-        self._save_config()
         dpg.destroy_context()
 
 